@@ -1,314 +1,436 @@
 import streamlit as st
-import sqlite3
+import hmac
+import io
+import math
+import os
 import pandas as pd
-from xlsxwriter import Workbook
-
-# Função para criar conexão com o banco de dados e ativar FOREIGN KEY
-def get_db_connection():
-    conn = sqlite3.connect("estoque.db", check_same_thread=False)
-    c = conn.cursor()
-    c.execute("PRAGMA foreign_keys = ON;")  # Ativando suporte a FOREIGN KEY
-    return conn
-
-# Conexão com banco de dados SQLite
-conn = get_db_connection()
-c = conn.cursor()
-
-# Criando tabelas
-c.execute("""
-CREATE TABLE IF NOT EXISTS materiais (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    codigo INTEGER UNIQUE,
-    descricao TEXT,
-    unidade TEXT
-)
-""")
-
-c.execute("""
-CREATE TABLE IF NOT EXISTS movimentacoes (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    codigo INTEGER,
-    descricao TEXT,
-    quantidade REAL,
-    tipo TEXT,
-    projeto TEXT,
-    equipe TEXT,
-    data_movimentacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY(codigo) REFERENCES materiais(codigo)
-)
-""")
-
-conn.commit()
+from datetime import date
+from almoxeletrico.backends import criar_backend, depositos_configurados
+from almoxeletrico.exportacao import EXTENSAO, FORMATOS, MIME, exportar_dataframe
+from almoxeletrico.instrumentacao import CONSULTA_LENTA, concluir_tela, iniciar_tela, metricas
+from almoxeletrico.movimentacoes import filtro_movimentacoes
+from almoxeletrico.requisicoes import ErroRequisicao
+from almoxeletrico.servicos import Almoxarifado
+from almoxeletrico.tarefas import SITUACOES_FINAIS
+
+# Almoxarifado (repositórios e serviços) de cada depósito, criado uma única vez por processo
+# junto com a criação/atualização do esquema; importações interrompidas por um reinício do
+# servidor voltam para a fila. As telas não acessam o banco diretamente: toda leitura e gravação
+# passa pelos repositórios e serviços do depósito selecionado.
+@st.cache_resource
+def obter_almoxarifado(url):
+    almox = Almoxarifado(criar_backend(url))
+    almox.backend.migrar()
+    almox.tarefas.retomar()
+    return almox
+
+
+# Função para exibir o botão de download; gerar() só é executada quando o usuário clica
+def botao_download(gerar, nome_arquivo, formato, key):
+    st.download_button(f"Baixar {formato}", gerar, f"{nome_arquivo}.{EXTENSAO[formato]}", MIME[formato],
+                       key=key, on_click="ignore")
+
+
+# Busca e contagem de materiais em cache entre sessões, por depósito e versão do cadastro: a chave
+# muda a cada alteração em materiais, então as reexecuções do script só leem a versão no banco.
+@st.cache_data(max_entries=1000, show_spinner=False)
+def pesquisar_materiais(url, versao, termo):
+    return obter_almoxarifado(url).materiais.pesquisar(termo)
+
+
+@st.cache_data(max_entries=100, show_spinner=False)
+def contar_materiais(url, versao):
+    return obter_almoxarifado(url).materiais.contar()
+
+
+# Função para buscar e selecionar um material pelo índice de texto do banco (só os melhores
+# resultados vão para o navegador). primeira_opcao ("" ou "Todos") representa nenhum material.
+# Retorna (codigo, descricao), ou (None, None) se nenhum material foi selecionado.
+def selecionar_material(rotulo, key, primeira_opcao=None):
+    termo = st.text_input(f"Buscar {rotulo}", key=f"{key}_busca", placeholder="Código ou parte da descrição")
+    encontrados = pesquisar_materiais(depositos[deposito], almox.materiais.versao(), termo)
+    materiais = {f"{codigo} - {descricao}": (codigo, descricao) for codigo, descricao, _ in encontrados}
+    opcoes = ([primeira_opcao] if primeira_opcao is not None else []) + list(materiais)
+    if not opcoes:
+        st.warning("Nenhum material encontrado.")
+        return None, None
+    material_selecionado = st.selectbox(rotulo, opcoes, key=key)
+    return materiais.get(material_selecionado, (None, None))
+
+
+# Função para enviar uma planilha à fila de importação e acompanhar a tarefa. A importação roda em
+# segundo plano, então a página continua respondendo; reexecuções do script (cliques em outros
+# widgets) reaproveitam a tarefa do arquivo enviado, sem importá-lo de novo.
+def importar_planilha(arquivo, tipo, mensagem_sucesso):
+    chave = f"tarefa_{deposito}_{tipo}_{arquivo.file_id}"
+    if chave not in st.session_state:
+        st.session_state[chave] = almox.tarefas.importar(arquivo, tipo)
+    tarefa_id, nova = st.session_state[chave]
+
+    # Enquanto a tarefa não termina, só o fragmento é reexecutado (a cada segundo), não a página
+    em_andamento = almox.tarefas.tarefa(tarefa_id).situacao not in SITUACOES_FINAIS
+    if em_andamento:
+        st.session_state[f"tarefa_{tarefa_id}_em_andamento"] = True
+    st.fragment(exibir_tarefa, run_every=1 if em_andamento else None)(tarefa_id, nova, mensagem_sucesso)
+
+
+# Função para exibir a situação de uma tarefa de importação: progresso ou resultado, inclusive as
+# linhas recusadas
+def exibir_tarefa(tarefa_id, nova, mensagem_sucesso):
+    tarefa = almox.tarefas.tarefa(tarefa_id)
+    if tarefa.situacao not in SITUACOES_FINAIS:
+        if tarefa.situacao == "pendente":
+            st.progress(0.0, text="Planilha na fila de importação...")
+        else:
+            fracao = min(tarefa.linhas_lidas / tarefa.total, 1.0) if tarefa.total else 0.0
+            st.progress(fracao, text=f"Importando planilha em segundo plano... {tarefa.linhas_lidas} linha(s) lida(s)")
+        return
+    if st.session_state.get(f"tarefa_{tarefa_id}_em_andamento"):
+        # A tarefa terminou durante o acompanhamento: reexecuta a página para parar a atualização
+        # periódica e atualizar as demais informações da tela
+        del st.session_state[f"tarefa_{tarefa_id}_em_andamento"]
+        st.rerun()
+
+    if tarefa.situacao == "erro":
+        st.error(tarefa.mensagem)
+        return
+    if tarefa.ja_importada or not nova:
+        st.info(f"Esta planilha já foi importada ({tarefa.gravadas} registro(s) gravado(s) em {tarefa.concluida_em}).")
+        return
+
+    st.success(f"{mensagem_sucesso} ({tarefa.gravadas} registro(s) gravado(s))")
+    if tarefa.recusadas:
+        rejeitadas = pd.read_csv(io.BytesIO(tarefa.recusadas), encoding="utf-8-sig")
+        st.warning(f"{len(rejeitadas)} linha(s) recusada(s).")
+        st.dataframe(rejeitadas)
+        st.download_button("Baixar Linhas Recusadas", tarefa.recusadas, "linhas_recusadas.csv", "text/csv")
+
+
+# Função para listar as últimas importações do tipo (inclusive as enviadas em outras sessões ou
+# concluídas depois que o usuário saiu da tela)
+def importacoes_recentes(tipo):
+    with st.expander("Últimas Importações"):
+        st.dataframe(almox.tarefas.listar(tipo, 5), hide_index=True)
+
+
+# Função para exibir a requisição com vários materiais (grade de código e quantidade) para o
+# projeto/equipe informados. Os itens são validados contra os saldos a cada edição e gravados
+# juntos, numa única transação; se algum item for recusado, nada é gravado.
+def requisicao_materiais(tipo, projeto, equipe, key, rotulo_botao):
+    st.write("---")
+    st.subheader("Requisição com Vários Materiais")
+
+    # Após gravar, a grade é recriada vazia (nova chave) na próxima execução
+    versao = st.session_state.get(f"{key}_versao", 0)
+    itens = st.data_editor(
+        pd.DataFrame({"codigo": pd.Series(dtype="Int64"), "quantidade": pd.Series(dtype="float")}),
+        num_rows="dynamic", hide_index=True, key=f"{key}_itens_{versao}",
+        column_config={
+            "codigo": st.column_config.NumberColumn("Código", step=1, format="%d"),
+            "quantidade": st.column_config.NumberColumn("Quantidade", min_value=0.0),
+        },
+    ).dropna(how="all")
+
+    if len(itens):
+        validados = almox.movimentacoes.validar_requisicao(tipo, projeto.strip(), itens)
+        st.dataframe(validados, hide_index=True)
+
+    if st.button(rotulo_botao, key=f"{key}_registrar"):
+        if not projeto.strip():
+            st.error("O campo 'Projeto' é obrigatório!")
+        elif not equipe.strip():
+            st.error("O campo 'Código da Equipe' é obrigatório!")
+        else:
+            try:
+                requisicao_id, validados = almox.movimentacoes.registrar_requisicao(
+                    tipo, projeto.strip(), equipe.strip(), itens)
+            except ErroRequisicao as erro:
+                st.error(str(erro))
+            else:
+                st.session_state[f"{key}_versao"] = versao + 1
+                st.success(f"Requisição {requisicao_id} registrada com {len(validados)} item(ns)!")
 
 # Interface Streamlit
 st.title("Controle de Estoque")
 
+# Seleção do depósito (exibida apenas quando há mais de um configurado)
+depositos = depositos_configurados()
+deposito = st.sidebar.selectbox("Depósito", list(depositos)) if len(depositos) > 1 else next(iter(depositos))
+almox = obter_almoxarifado(depositos[deposito])
+
 menu = ["Cadastro de Materiais", "Entrada de Material", "Saída de Material", "Baixa EQTL", "Devolução de Material",
-        "Estorno de Material", "Visão Geral do Estoque", "Projetos", "Consulta de Movimentação", "Inventário"]
+        "Estorno de Material", "Visão Geral do Estoque", "Posição Histórica", "Projetos", "Pendências", "Consulta de Movimentação",
+        "Inventário"]
+
+# Acesso de administrador: libera a tela Desempenho quando ALMOXELETRICO_SENHA_ADMIN está definida
+senha_admin = os.environ.get("ALMOXELETRICO_SENHA_ADMIN")
+if senha_admin and not st.session_state.get("admin"):
+    with st.sidebar.expander("Administração"):
+        senha = st.text_input("Senha de Administrador", type="password")
+        if senha and hmac.compare_digest(senha.encode(), senha_admin.encode()):
+            st.session_state["admin"] = True
+        elif senha:
+            st.error("Senha incorreta.")
+if st.session_state.get("admin"):
+    menu.append("Desempenho")
+
 escolha = st.sidebar.radio("Selecione uma opção:", menu)
 
-# Tela de Inventário
-if escolha == "Inventário":
-    st.subheader("Inventário de Estoque")
+# Mede a execução do script na tela escolhida (e atribui a ela as consultas feitas); a medição é
+# encerrada mesmo quando a tela para no meio (st.stop, st.rerun ou erro)
+iniciar_tela(escolha)
+try:
+    # Tela de Inventário
+    if escolha == "Inventário":
+        st.subheader("Inventário de Estoque")
 
-    # Upload de planilha para atualização em lote
-    arquivo = st.file_uploader("Importar Planilha de Inventário", type=["csv", "xlsx"])
-    if arquivo:
-        df = pd.read_excel(arquivo) if "xlsx" in arquivo.name else pd.read_csv(arquivo)
+        # Upload de planilha para atualização em lote
+        arquivo = st.file_uploader("Importar Planilha de Inventário", type=["csv", "xlsx"])
+        if arquivo:
+            importar_planilha(arquivo, "inventario", "Inventário atualizado com sucesso!")
+        importacoes_recentes("inventario")
 
-        if {"codigo", "descricao", "quantidade"}.issubset(df.columns):
-            for _, row in df.iterrows():
-                c.execute("SELECT COALESCE(SUM(quantidade), 0) FROM movimentacoes WHERE codigo = ?", (row["codigo"],))
-                saldo_atual = c.fetchone()[0]
+        st.write("---")
 
-                nova_quantidade = row["quantidade"]
-                ajuste = nova_quantidade - saldo_atual
+        # Atualização Manual do Estoque
+        st.subheader("Atualizar Estoque Manualmente")
 
-                if ajuste != 0:
-                    # Criando movimentação de ajuste
-                    c.execute("""
-                        INSERT INTO movimentacoes (codigo, descricao, quantidade, tipo, projeto, equipe) 
-                        VALUES (?, ?, ?, 'ajuste_inventario', NULL, NULL)
-                    """, (row["codigo"], row["descricao"], ajuste))
-                    conn.commit()
+        # Buscar materiais cadastrados (busca no índice de texto)
+        if contar_materiais(depositos[deposito], almox.materiais.versao()):
+            codigo, descricao = selecionar_material("Material", "inventario_material", primeira_opcao="")
 
-            st.success("Inventário atualizado com sucesso!")
-        else:
-            st.error("A planilha deve conter as colunas: 'codigo', 'descricao' e 'quantidade'.")
+            if codigo is not None:
+                st.text_input("Descrição", descricao, disabled=True)  # Campo bloqueado, apenas exibição
 
-    st.write("---")
+                # Buscar saldo atual
+                saldo_atual = almox.saldos.saldo_total(codigo)
 
-    # Atualização Manual do Estoque
-    st.subheader("Atualizar Estoque Manualmente")
+                # Inserir nova quantidade
+                nova_quantidade = st.number_input("Nova Quantidade", min_value=0.0, step=1.0, value=float(saldo_atual or 0.0))
 
-    # Buscar materiais cadastrados
-    c.execute("SELECT codigo, descricao FROM materiais")
-    materiais = {str(m[0]): (m[0], m[1]) for m in c.fetchall()}
-
-    if materiais:
-        material_selecionado = st.selectbox("Selecione um Material", [""] + list(materiais.keys()))
+                if st.button("Atualizar Estoque"):
+                    # Criando movimentação de ajuste (saldo relido na transação de escrita)
+                    if almox.saldos.ajustar(codigo, nova_quantidade) != 0:
+                        st.success("Estoque atualizado com sucesso!")
+                    else:
+                        st.info("O saldo já está correto, nenhuma alteração foi feita.")
+        else:
+            st.warning("Nenhum material cadastrado.")
 
-        if material_selecionado:
-            codigo, descricao = materiais[material_selecionado]
-            st.text_input("Descrição", descricao, disabled=True)  # Campo bloqueado, apenas exibição
+    # Tela de Estorno de Material
+    if escolha == "Estorno de Material":
+        st.subheader("Estorno de Material")
 
-            # Buscar saldo atual
-            c.execute("SELECT COALESCE(SUM(quantidade), 0) FROM movimentacoes WHERE codigo = ?", (codigo,))
-            saldo_atual = c.fetchone()[0]
+        # Buscar projetos cadastrados
+        projetos = almox.movimentacoes.projetos()
+        projeto = st.selectbox("Projeto", projetos) if projetos else st.warning("Nenhum projeto cadastrado.")
 
-            # Inserir nova quantidade
-            nova_quantidade = st.number_input("Nova Quantidade", min_value=0.0, step=1.0, value=float(saldo_atual or 0.0))
+        equipe = st.text_input("Código da Equipe")
 
-            if st.button("Atualizar Estoque"):
-                ajuste = nova_quantidade - saldo_atual
+        # Buscar materiais cadastrados (busca no índice de texto)
+        if contar_materiais(depositos[deposito], almox.materiais.versao()):
+            codigo, descricao = selecionar_material("Material", "estorno_material")
+            quantidade = st.number_input("Quantidade", min_value=0, step=1)
 
-                if ajuste != 0:
-                    # Criando movimentação de ajuste
-                    c.execute("""
-                        INSERT INTO movimentacoes (codigo, descricao, quantidade, tipo, projeto, equipe) 
-                        VALUES (?, ?, ?, 'ajuste_inventario', NULL, NULL)
-                    """, (codigo, descricao, ajuste))
-                    conn.commit()
-                    st.success("Estoque atualizado com sucesso!")
+            if st.button("Registrar Estorno"):
+                if not projeto:
+                    st.error("O campo 'Projeto' é obrigatório!")
+                elif not equipe.strip():
+                    st.error("O campo 'Código da Equipe' é obrigatório!")
+                elif not codigo:
+                    st.error("Selecione um material!")
+                elif quantidade <= 0:
+                    st.error("A quantidade deve ser maior que zero!")
                 else:
-                    st.info("O saldo já está correto, nenhuma alteração foi feita.")
-    else:
-        st.warning("Nenhum material cadastrado.")
+                    almox.movimentacoes.registrar("estorno", codigo, quantidade, projeto, equipe, descricao)
+                    st.success("Estorno registrado com sucesso!")
+        else:
+            st.warning("Nenhum material cadastrado.")
+
+    # Tela de Projetos com Cards (paginada; XLSX gerado apenas ao clicar em baixar)
+    if escolha == "Projetos":
+        st.subheader("Projetos e Equipes")
+        busca_projeto = st.text_input("Buscar Projeto (Opcional)")
+        total_projetos = almox.projetos.contar(busca_projeto.strip())
+
+        if total_projetos:
+            col_tamanho, col_pagina, col_formato = st.columns(3)
+            por_pagina = col_tamanho.selectbox("Projetos por página", [10, 25, 50])
+            formato = col_formato.selectbox("Formato de Exportação", FORMATOS)
+            total_paginas = math.ceil(total_projetos / por_pagina)
+            pagina = col_pagina.number_input(f"Página (de {total_paginas})", min_value=1, max_value=total_paginas,
+                                             step=1)
+
+            projetos = almox.projetos.listar(busca_projeto.strip(), por_pagina, (pagina - 1) * por_pagina)
+            equipes = almox.projetos.equipes(projetos)
+            resumo = almox.projetos.resumo(projetos)
+
+            for projeto in projetos:
+                with st.expander(f"Projeto: {projeto}"):
+                    st.write("**Equipes:**", equipes.get(projeto, ""))
+
+                    st.write("**Movimentações no Projeto**")
+                    df_projeto = resumo[projeto]
+                    st.dataframe(df_projeto)
+
+                    # Botão para exportar (arquivo gerado em memória ao clicar)
+                    botao_download(lambda df=df_projeto: exportar_dataframe(df, formato, "Movimentacoes"),
+                                   f"projeto_{projeto}", formato, key=f"exportar_projeto_{projeto}")
+        else:
+            st.info("Nenhum projeto encontrado.")
+
+
+    # Tela de Pendências (conciliação de todos os projetos e equipes, mantida por triggers)
+    if escolha == "Pendências":
+        st.subheader("Pendências dos Projetos")
+        st.caption("Pendente Baixa = Saídas - Baixas EQTL; Pendente Estorno = Devoluções - Estornos. "
+                   "Devoluções e estornos são conciliados por projeto e material, na linha sem equipe.")
+
+        # Filtros
+        col_equipe, col_projeto = st.columns(2)
+        equipe_filtro = col_equipe.selectbox("Equipe", [None] + almox.pendencias.equipes(),
+                                             format_func=lambda equipe: "Todas" if equipe is None else equipe or "(sem equipe)")
+        projeto_filtro = col_projeto.text_input("Buscar Projeto (Opcional)").strip()
+
+        total_linhas, pendente_baixa, pendente_estorno = almox.pendencias.totais(equipe_filtro, projeto_filtro)
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Itens Pendentes", total_linhas)
+        col2.metric("Pendente Baixa", f"{pendente_baixa:g}")
+        col3.metric("Pendente Estorno", f"{pendente_estorno:g}")
+
+        if total_linhas:
+            col_tamanho, col_pagina, col_formato = st.columns(3)
+            por_pagina = col_tamanho.selectbox("Linhas por página", [100, 500, 1000])
+            formato = col_formato.selectbox("Formato de Exportação", FORMATOS)
+            total_paginas = math.ceil(total_linhas / por_pagina)
+            pagina = col_pagina.number_input(f"Página (de {total_paginas})", min_value=1, max_value=total_paginas,
+                                             step=1)
+
+            st.dataframe(almox.pendencias.listar(equipe_filtro, projeto_filtro, por_pagina, (pagina - 1) * por_pagina),
+                         hide_index=True, use_container_width=True)
+
+            # Botão para exportar todas as pendências filtradas (arquivo gerado em memória ao clicar)
+            botao_download(lambda: exportar_dataframe(almox.pendencias.listar(equipe_filtro, projeto_filtro), formato,
+                                                      "Pendencias"), "pendencias", formato, key="exportar_pendencias")
+        else:
+            st.info("Nenhuma pendência encontrada.")
 
-# Tela de Estorno de Material
-if escolha == "Estorno de Material":
-    st.subheader("Estorno de Material")
 
-    # Buscar projetos cadastrados
-    c.execute("SELECT DISTINCT projeto FROM movimentacoes WHERE projeto IS NOT NULL")
-    projetos = [projeto[0] for projeto in c.fetchall() if projeto[0]]
-    projeto = st.selectbox("Projeto", projetos) if projetos else st.warning("Nenhum projeto cadastrado.")
+    # Tela de Cadastro de Materiais
+    if escolha == "Cadastro de Materiais":
+        st.subheader("Cadastro de Materiais")
+        arquivo = st.file_uploader("Importar Planilha", type=["csv", "xlsx"])
+        if arquivo:
+            importar_planilha(arquivo, "materiais", "Materiais importados com sucesso!")
+        importacoes_recentes("materiais")
 
-    equipe = st.text_input("Código da Equipe")
+        codigo = st.text_input("Código do Material")
+        descricao = st.text_input("Descrição")
+        unidade = st.selectbox("Unidade de Medida", ["UN", "KG", "KIT", "M"])
+        if st.button("Adicionar Material"):
+            almox.materiais.cadastrar(codigo, descricao, unidade)
+            st.success("Material cadastrado com sucesso!")
 
-    # Buscar materiais cadastrados
-    c.execute("SELECT codigo, descricao FROM materiais")
-    materiais = {f"{m[0]} - {m[1]}": m[0] for m in c.fetchall()}
+    # Tela de Devolução de Material
+    if escolha == "Devolução de Material":
+        st.subheader("Devolução de Material")
 
-    if materiais:
-        material_selecionado = st.selectbox("Material", list(materiais.keys()))
-        codigo = materiais[material_selecionado]
-        quantidade = st.number_input("Quantidade", min_value=0, step=1)
+        # Buscar os projetos onde houve saída de material
+        projetos = almox.movimentacoes.projetos(tipo="saída")
 
-        if st.button("Registrar Estorno"):
-            if not projeto:
-                st.error("O campo 'Projeto' é obrigatório!")
-            elif not equipe.strip():
-                st.error("O campo 'Código da Equipe' é obrigatório!")
-            elif not codigo:
-                st.error("Selecione um material!")
-            elif quantidade <= 0:
-                st.error("A quantidade deve ser maior que zero!")
+        if projetos:
+            projeto = st.selectbox("Projeto", projetos)
+
+            # Buscar materiais que tiveram saída para esse projeto
+            materiais_saida = {f"{m[0]} - {m[1]}": m[0] for m in almox.movimentacoes.materiais_do_projeto(projeto, "saída")}
+
+            if materiais_saida:
+                material_selecionado = st.selectbox("Material", list(materiais_saida.keys()))
+                codigo = materiais_saida[material_selecionado]
+                quantidade = st.number_input("Quantidade", min_value=0, step=1)
+
+                if st.button("Registrar Devolução"):
+                    almox.movimentacoes.registrar("devolução", codigo, quantidade, projeto)
+                    st.success("Devolução registrada com sucesso!")
             else:
-                descricao = material_selecionado.split(" - ")[1]
-                c.execute("""
-                    INSERT INTO movimentacoes (codigo, descricao, quantidade, tipo, projeto, equipe) 
-                    VALUES (?, ?, ?, 'estorno', ?, ?)
-                """, (codigo, descricao, quantidade, projeto, equipe))
-                conn.commit()
-                st.success("Estorno registrado com sucesso!")
-    else:
-        st.warning("Nenhum material cadastrado.")
-
-# Tela de Projetos com Cards
-if escolha == "Projetos":
-    st.subheader("Projetos e Equipes")
-    c.execute("SELECT DISTINCT projeto FROM movimentacoes WHERE projeto IS NOT NULL")
-    projetos = c.fetchall()
-
-    for projeto in projetos:
-        with st.expander(f"Projeto: {projeto[0]}"):
-            c.execute("SELECT DISTINCT equipe FROM movimentacoes WHERE projeto = ?", (projeto[0],))
-            equipes = c.fetchall()
-            st.write("**Equipes:**", ", ".join([equipe[0] for equipe in equipes if equipe[0]]))
-
-            st.write("**Movimentações no Projeto**")
-            c.execute("""
-                SELECT codigo, 
-                       MAX(descricao) AS descricao, 
-                       SUM(CASE WHEN tipo = 'saída' THEN quantidade ELSE 0 END) AS saidas,
-                       SUM(CASE WHEN tipo = 'baixa_eqtl' THEN quantidade ELSE 0 END) AS baixas_eqtl,
-                       SUM(CASE WHEN tipo = 'devolução' THEN quantidade ELSE 0 END) AS devolucoes,
-                       SUM(CASE WHEN tipo = 'estorno' THEN quantidade ELSE 0 END) AS estornos
-                FROM movimentacoes WHERE projeto = ?
-                GROUP BY codigo
-            """, (projeto[0],))
-            dados_projeto = c.fetchall()
-            df_projeto = pd.DataFrame(dados_projeto,
-                                      columns=["Código", "Descrição", "Saídas", "Baixas EQTL", "Devoluções", "Estornos"])
-            df_projeto["Saldo Atual"] = df_projeto["Saídas"] - df_projeto["Devoluções"]
-            df_projeto["Status"] = df_projeto.apply(lambda row: "Baixado" if (row["Saídas"] == row["Baixas EQTL"]) and (row["Devoluções"] == row["Estornos"]) else "Pendente", axis=1)
-            st.dataframe(df_projeto)
-
-            # Botão para exportar XLSX
-            xlsx_filename = f"projeto_{projeto[0]}.xlsx"
-            with pd.ExcelWriter(xlsx_filename, engine='xlsxwriter') as writer:
-                df_projeto.to_excel(writer, index=False, sheet_name='Movimentacoes')
-                writer.close()
-
-            with open(xlsx_filename, "rb") as file:
-                st.download_button("Baixar XLSX", file, xlsx_filename,
-                                   "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-
-
-# Tela de Cadastro de Materiais
-if escolha == "Cadastro de Materiais":
-    st.subheader("Cadastro de Materiais")
-    arquivo = st.file_uploader("Importar Planilha", type=["csv", "xlsx"])
-    if arquivo:
-        df = pd.read_excel(arquivo) if "xlsx" in arquivo.name else pd.read_csv(arquivo)
-        for _, row in df.iterrows():
-            c.execute("INSERT OR IGNORE INTO materiais (codigo, descricao, unidade) VALUES (?, ?, ?)",
-                      (row["codigo"], row["descricao"], row["unidade"]))
-        conn.commit()
-        st.success("Materiais importados com sucesso!")
-
-    codigo = st.text_input("Código do Material")
-    descricao = st.text_input("Descrição")
-    unidade = st.selectbox("Unidade de Medida", ["UN", "KG", "KIT", "M"])
-    if st.button("Adicionar Material"):
-        c.execute("INSERT OR IGNORE INTO materiais (codigo, descricao, unidade) VALUES (?, ?, ?)",
-                  (codigo, descricao, unidade))
-        conn.commit()
-        st.success("Material cadastrado com sucesso!")
-
-# Tela de Devolução de Material
-if escolha == "Devolução de Material":
-    st.subheader("Devolução de Material")
-
-    # Buscar os projetos onde houve saída de material
-    c.execute("SELECT DISTINCT projeto FROM movimentacoes WHERE tipo = 'saída' AND projeto IS NOT NULL")
-    projetos = [projeto[0] for projeto in c.fetchall() if projeto[0]]
-
-    if projetos:
-        projeto = st.selectbox("Projeto", projetos)
-
-        # Buscar materiais que tiveram saída para esse projeto
-        c.execute("SELECT DISTINCT codigo, descricao FROM movimentacoes WHERE projeto = ? AND tipo = 'saída'",
-                  (projeto,))
-        materiais_saida = {f"{m[0]} - {m[1]}": m[0] for m in c.fetchall()}
-
-        if materiais_saida:
-            material_selecionado = st.selectbox("Material", list(materiais_saida.keys()))
-            codigo = materiais_saida[material_selecionado]
+                st.warning("Nenhum material foi retirado para esse projeto.")
+        else:
+            st.warning("Nenhum projeto com saída de material registrado.")
+
+    # Tela de Entrada de Material
+    elif escolha == "Entrada de Material":
+        st.subheader("Entrada de Material")
+        arquivo = st.file_uploader("Importar Planilha de Entradas", type=["csv", "xlsx"])
+        if arquivo:
+            importar_planilha(arquivo, "entrada", "Entradas registradas com sucesso!")
+        importacoes_recentes("entrada")
+
+        codigo = st.number_input("Código do Material", min_value=1, step=1)
+        if st.button("Buscar Material"):
+            material = almox.materiais.buscar(codigo)
+            if material:
+                descricao, unidade = material
+                quantidade = st.number_input("Quantidade")
+                if st.button("Registrar Entrada"):
+                    almox.movimentacoes.registrar("entrada", codigo, quantidade, descricao=descricao)
+                    st.success("Entrada registrada com sucesso!")
+            else:
+                st.error("Código não encontrado!")
+
+    # Tela de Saída de Material
+    if escolha == "Saída de Material":
+        st.subheader("Saída de Material")
+
+        # Upload de planilha para registrar saídas em lote
+        arquivo = st.file_uploader("Importar Planilha de Saída", type=["csv", "xlsx"])
+        if arquivo:
+            importar_planilha(arquivo, "saída", "Saídas registradas com sucesso!")
+        importacoes_recentes("saída")
+
+        projeto = st.text_input("Projeto")
+        equipe = st.text_input("Código da Equipe")
+
+        # Buscar materiais cadastrados (busca no índice de texto)
+        if contar_materiais(depositos[deposito], almox.materiais.versao()):
+            codigo, descricao = selecionar_material("Material", "saida_material")
             quantidade = st.number_input("Quantidade", min_value=0, step=1)
 
-            if st.button("Registrar Devolução"):
-                c.execute(
-                    "INSERT INTO movimentacoes (codigo, descricao, quantidade, tipo, projeto) VALUES (?, (SELECT descricao FROM materiais WHERE codigo = ?), ?, 'devolução', ?)",
-                    (codigo, codigo, quantidade, projeto))
-                conn.commit()
-                st.success("Devolução registrada com sucesso!")
-        else:
-            st.warning("Nenhum material foi retirado para esse projeto.")
-    else:
-        st.warning("Nenhum projeto com saída de material registrado.")
-
-# Tela de Entrada de Material
-elif escolha == "Entrada de Material":
-    st.subheader("Entrada de Material")
-    arquivo = st.file_uploader("Importar Planilha de Entradas", type=["csv", "xlsx"])
-    if arquivo:
-        df = pd.read_excel(arquivo) if "xlsx" in arquivo.name else pd.read_csv(arquivo)
-        for _, row in df.iterrows():
-            c.execute("INSERT INTO movimentacoes (codigo, descricao, quantidade, tipo) VALUES (?, ?, ?, 'entrada')",
-                      (row["codigo"], row["descricao"], row["quantidade"]))
-        conn.commit()
-        st.success("Entradas registradas com sucesso!")
-
-    codigo = st.number_input("Código do Material", min_value=1, step=1)
-    if st.button("Buscar Material"):
-        c.execute("SELECT descricao, unidade FROM materiais WHERE codigo = ?", (codigo,))
-        material = c.fetchone()
-        if material:
-            descricao, unidade = material
-            quantidade = st.number_input("Quantidade")
-            if st.button("Registrar Entrada"):
-                c.execute("INSERT INTO movimentacoes (codigo, descricao, quantidade, tipo) VALUES (?, ?, ?, 'entrada')",
-                          (codigo, descricao, quantidade))
-                conn.commit()
-                st.success("Entrada registrada com sucesso!")
+            if st.button("Registrar Saída"):
+                if not projeto.strip():
+                    st.error("O campo 'Projeto' é obrigatório!")
+                elif not equipe.strip():
+                    st.error("O campo 'Código da Equipe' é obrigatório!")
+                elif not codigo:
+                    st.error("Selecione um material!")
+                elif quantidade <= 0:
+                    st.error("A quantidade deve ser maior que zero!")
+                else:
+                    almox.movimentacoes.registrar("saída", codigo, quantidade, projeto, equipe, descricao)
+                    st.success("Saída registrada com sucesso!")
+
+            requisicao_materiais("saída", projeto, equipe, "saida_requisicao", "Registrar Requisição de Saída")
         else:
-            st.error("Código não encontrado!")
-
-# Tela de Saída de Material
-if escolha == "Saída de Material":
-    st.subheader("Saída de Material")
-
-    # Upload de planilha para registrar saídas em lote
-    arquivo = st.file_uploader("Importar Planilha de Saída", type=["csv", "xlsx"])
-    if arquivo:
-        df = pd.read_excel(arquivo) if "xlsx" in arquivo.name else pd.read_csv(arquivo)
-        for _, row in df.iterrows():
-            c.execute("SELECT descricao FROM materiais WHERE codigo = ?", (row["codigo"],))
-            material = c.fetchone()
-            if material:
-                descricao = material[0]
-                c.execute("""
-                    INSERT INTO movimentacoes (codigo, descricao, quantidade, tipo, projeto, equipe) 
-                    VALUES (?, ?, ?, 'saída', ?, ?)
-                """, (row["codigo"], descricao, row["quantidade"], row["projeto"], row["equipe"]))
-        conn.commit()
-        st.success("Saídas registradas com sucesso!")
-
-    projeto = st.text_input("Projeto")
-    equipe = st.text_input("Código da Equipe")
-
-    # Buscar materiais cadastrados
-    c.execute("SELECT codigo, descricao FROM materiais")
-    materiais = {f"{m[0]} - {m[1]}": m[0] for m in c.fetchall()}
-
-    if materiais:
-        material_selecionado = st.selectbox("Material", list(materiais.keys()))
-        codigo = materiais[material_selecionado]
-        quantidade = st.number_input("Quantidade", min_value=0, step=1)
-
-        if st.button("Registrar Saída"):
+            st.warning("Nenhum material cadastrado.")
+
+    # Tela de Baixa EQTL
+    if escolha == "Baixa EQTL":
+        st.subheader("Baixa EQTL")
+
+        # Importação via planilha
+        arquivo = st.file_uploader("Importar Planilha de Baixa EQTL", type=["csv", "xlsx"])
+        if arquivo:
+            importar_planilha(arquivo, "baixa_eqtl", "Baixas EQTL registradas com sucesso!")
+        importacoes_recentes("baixa_eqtl")
+
+        projeto = st.text_input("Projeto")
+        equipe = st.text_input("Código da Equipe")
+
+        # Campo de busca do material (rótulos no formato "Código - Descrição")
+        codigo, descricao = selecionar_material("Código do Material", "baixa_material")
+
+        quantidade = st.number_input("Quantidade", min_value=0.0, step=0.1)  # Convertendo tudo para float
+
+        if st.button("Registrar Baixa EQTL"):
             if not projeto.strip():
                 st.error("O campo 'Projeto' é obrigatório!")
             elif not equipe.strip():
@@ -318,191 +440,175 @@ if escolha == "Saída de Material":
             elif quantidade <= 0:
                 st.error("A quantidade deve ser maior que zero!")
             else:
-                descricao = material_selecionado.split(" - ")[1]
-                c.execute("""
-                    INSERT INTO movimentacoes (codigo, descricao, quantidade, tipo, projeto, equipe) 
-                    VALUES (?, ?, ?, 'saída', ?, ?)
-                """, (codigo, descricao, quantidade, projeto, equipe))
-                conn.commit()
-                st.success("Saída registrada com sucesso!")
-    else:
-        st.warning("Nenhum material cadastrado.")
-
-# Tela de Baixa EQTL
-if escolha == "Baixa EQTL":
-    st.subheader("Baixa EQTL")
-
-    # Buscar materiais cadastrados
-    c.execute("SELECT codigo, descricao FROM materiais")
-    materiais = c.fetchall()
-    material_dict = {str(m[0]): f"{m[0]} - {m[1]}" for m in materiais}  # Formato "Código - Descrição"
-
-    # Importação via planilha
-    arquivo = st.file_uploader("Importar Planilha de Baixa EQTL", type=["csv", "xlsx"])
-    if arquivo:
-        df = pd.read_excel(arquivo) if "xlsx" in arquivo.name else pd.read_csv(arquivo)
-
-        for _, row in df.iterrows():
-            c.execute("SELECT descricao FROM materiais WHERE codigo = ?", (row["codigo"],))
-            descricao = c.fetchone()
-
-            if descricao:
-                descricao = descricao[0]  # Pegando o valor real dentro da tupla retornada pelo fetchone
-                c.execute("""
-                    INSERT INTO movimentacoes (codigo, descricao, quantidade, tipo, projeto, equipe) 
-                    VALUES (?, ?, ?, 'baixa_eqtl', ?, ?)
-                """, (row["codigo"], descricao, row["quantidade"], row["projeto"], row["equipe"]))
-            else:
-                st.warning(f"Código {row['codigo']} não encontrado no banco de dados.")
+                almox.movimentacoes.registrar("baixa_eqtl", codigo, quantidade, projeto, equipe, descricao)
+                st.success("Baixa EQTL registrada com sucesso!")
 
-        conn.commit()
-        st.success("Baixas EQTL registradas com sucesso!")
+        requisicao_materiais("baixa_eqtl", projeto, equipe, "baixa_requisicao", "Registrar Requisição de Baixa EQTL")
 
-    projeto = st.text_input("Projeto")
-    equipe = st.text_input("Código da Equipe")
 
-    # Campo de busca do material
-    codigo = st.selectbox("Código do Material", options=list(material_dict.keys()), format_func=lambda x: material_dict[x])
+    # Tela de Visão Geral do Estoque
+    if escolha == "Visão Geral do Estoque":
+        st.subheader("Visão Geral do Estoque")
 
-    quantidade = st.number_input("Quantidade", min_value=0.0, step=0.1)  # Convertendo tudo para float
+        # Filtro opcional de materiais
+        codigo_material, _ = selecionar_material("Material (Opcional)", "visao_material", primeira_opcao="Todos")
 
-    if st.button("Registrar Baixa EQTL"):
-        if not projeto.strip():
-            st.error("O campo 'Projeto' é obrigatório!")
-        elif not equipe.strip():
-            st.error("O campo 'Código da Equipe' é obrigatório!")
-        elif not codigo:
-            st.error("Selecione um material!")
-        elif quantidade <= 0:
-            st.error("A quantidade deve ser maior que zero!")
+        # Saldos materializados por material e tipo (não o livro de movimentações)
+        df_estoque = almox.saldos.visao_geral(codigo_material)
+
+        # Exibir tabela na interface
+        st.dataframe(df_estoque, use_container_width=True, height=400)
+
+        # Botão para exportar (arquivo gerado em memória ao clicar)
+        formato = st.selectbox("Formato de Exportação", FORMATOS)
+        botao_download(lambda: exportar_dataframe(df_estoque, formato, "Estoque"), "estoque", formato,
+                       key="exportar_estoque")
+
+        # Quantidades movimentadas por mês e tipo (cache analítico + movimentações ainda não exportadas),
+        # calculadas só quando solicitadas
+        if st.checkbox("Exibir Movimentação Mensal"):
+            df_mensal = almox.analitico.mensal(codigo_material)
+            st.dataframe(df_mensal, hide_index=True, use_container_width=True)
+            botao_download(lambda: exportar_dataframe(df_mensal, formato, "Mensal"), "movimentacao_mensal", formato,
+                           key="exportar_mensal")
+
+    # Tela de Posição Histórica (último fechamento mensal + movimentações posteriores)
+    if escolha == "Posição Histórica":
+        st.subheader("Posição Histórica do Estoque")
+
+        # Filtros
+        data_posicao = st.date_input("Posição no Fim do Dia", date.today(), max_value=date.today())
+        codigo_material, _ = selecionar_material("Material (Opcional)", "posicao_material", primeira_opcao="Todos")
+        projeto_filtro = st.text_input("Projeto (Opcional)")
+
+        df_posicao, mes_base = almox.historico.posicao(data_posicao, codigo_material, projeto_filtro.strip() or None)
+        if mes_base:
+            st.caption(f"Fechamento de {mes_base} + movimentações posteriores até {data_posicao:%d/%m/%Y}.")
         else:
-            descricao = material_dict.get(codigo, "")
-            c.execute("""
-                INSERT INTO movimentacoes (codigo, descricao, quantidade, tipo, projeto, equipe) 
-                VALUES (?, ?, ?, 'baixa_eqtl', ?, ?)
-            """, (codigo, descricao, quantidade, projeto, equipe))
-            conn.commit()
-            st.success("Baixa EQTL registrada com sucesso!")
-
-
-# Tela de Visão Geral do Estoque
-if escolha == "Visão Geral do Estoque":
-    st.subheader("Visão Geral do Estoque")
-
-    # Filtro opcional de materiais
-    c.execute("SELECT codigo, descricao FROM materiais")
-    materiais = {f"{m[0]} - {m[1]}": m[0] for m in c.fetchall()}
-    material_selecionado = st.selectbox("Selecione um Material (Opcional)", ["Todos"] + list(materiais.keys()))
-    codigo_material = materiais.get(material_selecionado)
-
-    # Query base
-    query = """
-        SELECT m.codigo, 
-               m.descricao, 
-               COALESCE(SUM(CASE WHEN mov.tipo = 'entrada' THEN mov.quantidade ELSE 0 END), 0) AS entradas,
-               COALESCE(SUM(CASE WHEN mov.tipo = 'saída' THEN mov.quantidade ELSE 0 END), 0) AS saidas,
-               COALESCE(SUM(CASE WHEN mov.tipo = 'baixa_eqtl' THEN mov.quantidade ELSE 0 END), 0) AS baixas_eqtl,
-               COALESCE(SUM(CASE WHEN mov.tipo = 'devolução' THEN mov.quantidade ELSE 0 END), 0) AS devolucoes,
-               COALESCE(SUM(CASE WHEN mov.tipo = 'ajuste_inventario' THEN mov.quantidade ELSE 0 END), 0) AS ajustes
-        FROM materiais m
-        LEFT JOIN movimentacoes mov ON m.codigo = mov.codigo
-    """
-
-    params = []
-    if material_selecionado != "Todos":
-        query += " WHERE m.codigo = ?"
-        params.append(codigo_material)
-
-    query += " GROUP BY m.codigo, m.descricao"
-
-    # Executar a query e carregar os dados
-    c.execute(query, params)
-    dados_estoque = c.fetchall()
-
-    # Criar dataframe
-    df_estoque = pd.DataFrame(dados_estoque,
-                              columns=["Código", "Descrição", "Entradas", "Saídas", "Baixas EQTL", "Devoluções",
-                                       "Ajustes"])
-
-    # Novo saldo atualizado (agora incluindo os ajustes do inventário)
-    df_estoque["Saldo Atual"] = df_estoque["Entradas"] - df_estoque["Saídas"] + df_estoque["Devoluções"] + df_estoque[
-        "Ajustes"]
-
-    # Exibir tabela na interface
-    st.dataframe(df_estoque, use_container_width=True, height=400)
-
-    # Botão para exportar XLSX
-    xlsx_filename = "estoque.xlsx"
-    with pd.ExcelWriter(xlsx_filename, engine='xlsxwriter') as writer:
-        df_estoque.to_excel(writer, index=False, sheet_name='Estoque')
-        writer.close()
-
-    with open(xlsx_filename, "rb") as file:
-        st.download_button("Baixar XLSX", file, xlsx_filename,
-                           "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-
-# Tela de Consulta de Movimentação
-if escolha == "Consulta de Movimentação":
-    st.subheader("Consulta de Movimentação de Materiais")
-
-    # Buscar materiais cadastrados
-    c.execute("SELECT codigo, descricao FROM materiais")
-    materiais = {f"{m[0]} - {m[1]}": m[0] for m in c.fetchall()}
-
-    # Opções de filtros opcionais
-    material_selecionado = st.selectbox("Selecione um Material (Opcional)", ["Todos"] + list(materiais.keys()))
-    codigo_material = materiais.get(material_selecionado)
-
-    tipo_movimentacao = st.selectbox("Tipo de Movimentação (Opcional)",
-                                     ["Todos", "entrada", "saída", "devolução", "baixa_eqtl", "estorno"])
-    data_inicial = st.date_input("Data Inicial (Opcional)", None)
-    data_final = st.date_input("Data Final (Opcional)", None)
-
-    if st.button("Consultar"):
-        query = """
-            SELECT data_movimentacao, codigo, descricao, tipo, quantidade, projeto, equipe 
-            FROM movimentacoes WHERE 1=1
-        """
-        params = []
-
-        if material_selecionado != "Todos":
-            query += " AND codigo = ?"
-            params.append(codigo_material)
-
-        if tipo_movimentacao != "Todos":
-            query += " AND tipo = ?"
-            params.append(tipo_movimentacao)
-
-        if data_inicial:
-            query += " AND DATE(data_movimentacao) >= DATE(?)"
-            params.append(data_inicial)
-
-        if data_final:
-            query += " AND DATE(data_movimentacao) <= DATE(?)"
-            params.append(data_final)
-
-        query += " ORDER BY data_movimentacao DESC"
-        c.execute(query, params)
-        dados_movimentacao = c.fetchall()
-
-        if dados_movimentacao:
-            df_movimentacao = pd.DataFrame(dados_movimentacao,
-                                           columns=["Data", "Código", "Descrição", "Tipo", "Quantidade", "Projeto", "Equipe"])
-
-            # Formatando data para o formato brasileiro
-            df_movimentacao["Data"] = pd.to_datetime(df_movimentacao["Data"]).dt.strftime("%d/%m/%Y %H:%M:%S")
-
-            st.dataframe(df_movimentacao)
-
-            # Botão para exportar XLSX
-            xlsx_filename = "movimentacoes.xlsx"
-            with pd.ExcelWriter(xlsx_filename, engine='xlsxwriter') as writer:
-                df_movimentacao.to_excel(writer, index=False, sheet_name='Movimentacoes')
-                writer.close()
-
-            with open(xlsx_filename, "rb") as file:
-                st.download_button("Baixar XLSX", file, xlsx_filename,
-                                   "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+            st.caption("Nenhum mês fechado até esta data: posição calculada com todas as movimentações.")
+        st.dataframe(df_posicao, use_container_width=True, height=400)
+
+        # Botão para exportar (arquivo gerado em memória ao clicar)
+        formato = st.selectbox("Formato de Exportação", FORMATOS)
+        botao_download(lambda: exportar_dataframe(df_posicao, formato, "Posicao"), f"posicao_{data_posicao:%Y%m%d}",
+                       formato, key="exportar_posicao")
+
+        st.write("---")
+
+        # Fechamento mensal (também disponível em "python -m almoxeletrico.fechamentos fechar")
+        st.subheader("Fechamentos Mensais")
+        pendentes = almox.historico.pendentes()
+        if pendentes:
+            st.info(f"{len(pendentes)} mês(es) a fechar ({pendentes[0]} a {pendentes[-1]}).")
+            if st.button("Fechar Meses Pendentes"):
+                barra = st.progress(0.0, text="Fechando meses...")
+                fechados = almox.historico.fechar(
+                    ao_progredir=lambda feitos, total: barra.progress(feitos / total, text=f"Fechando meses... {feitos}/{total}"))
+                barra.empty()
+                st.success(f"{len(fechados)} mês(es) fechado(s) com sucesso!")
         else:
-            st.warning("Nenhuma movimentação encontrada para os filtros selecionados.")
+            st.write("Todos os meses anteriores ao atual estão fechados.")
+        st.dataframe(almox.historico.fechamentos(), hide_index=True)
+
+    # Tela de Consulta de Movimentação (paginada no servidor)
+    if escolha == "Consulta de Movimentação":
+        st.subheader("Consulta de Movimentação de Materiais")
+
+        # Opções de filtros opcionais (material pela busca no índice de texto)
+        codigo_material, _ = selecionar_material("Material (Opcional)", "consulta_material", primeira_opcao="Todos")
+
+        tipo_movimentacao = st.selectbox("Tipo de Movimentação (Opcional)",
+                                         ["Todos", "entrada", "saída", "devolução", "baixa_eqtl", "estorno"])
+        data_inicial = st.date_input("Data Inicial (Opcional)", None)
+        data_final = st.date_input("Data Final (Opcional)", None)
+        projeto_filtro = st.text_input("Projeto (Opcional)")
+        equipe_filtro = st.text_input("Código da Equipe (Opcional)")
+        por_pagina = st.selectbox("Linhas por Página", [50, 100, 500, 1000])
+
+        if st.button("Consultar"):
+            campos = {
+                "codigo": codigo_material,
+                "tipo": tipo_movimentacao if tipo_movimentacao != "Todos" else None,
+                "data_inicial": data_inicial,
+                "data_final": data_final,
+                "projeto": projeto_filtro.strip(),
+                "equipe": equipe_filtro.strip(),
+            }
+            st.session_state[f"consulta_movimentacao_{deposito}"] = {
+                "filtro": filtro_movimentacoes(**campos),
+                "campos": campos,
+                # Chave de início de cada página visitada (None = primeira página)
+                "paginas": [None],
+            }
+
+        consulta = st.session_state.get(f"consulta_movimentacao_{deposito}")
+        if consulta:
+            # Resumo agregado pelo cache analítico (Parquet) + movimentações ainda não exportadas
+            resumo = almox.analitico.resumo(**consulta["campos"])
+            total = int(resumo["Movimentações"].sum())
+
+            if total:
+                # Mudança no tamanho da página reinicia a navegação
+                if consulta.get("por_pagina") != por_pagina:
+                    consulta["por_pagina"] = por_pagina
+                    consulta["paginas"] = [None]
+
+                st.write(f"**{total} movimentação(ões) encontrada(s)**")
+                st.dataframe(resumo, hide_index=True)
+
+                df_movimentacao, proxima = almox.movimentacoes.pagina(consulta["filtro"], por_pagina,
+                                                                   consulta["paginas"][-1])
+                st.dataframe(df_movimentacao, hide_index=True)
+
+                pagina = len(consulta["paginas"])
+                col_anterior, col_pagina, col_proxima = st.columns(3)
+                col_anterior.button("Página Anterior", disabled=pagina == 1,
+                                    on_click=lambda: consulta["paginas"].pop())
+                col_pagina.write(f"Página {pagina} de {math.ceil(total / por_pagina)}")
+                col_proxima.button("Próxima Página", disabled=proxima is None,
+                                   on_click=lambda: consulta["paginas"].append(proxima))
+
+                # Exportação de todo o resultado, lida direto do cursor (na conexão da thread do download), ao clicar
+                for formato in FORMATOS:
+                    botao_download(lambda formato=formato: almox.movimentacoes.exportar(consulta["filtro"], formato),
+                                   "movimentacoes", formato,
+                                   key=f"exportar_movimentacoes_{formato}")
+            else:
+                st.warning("Nenhuma movimentação encontrada para os filtros selecionados.")
+
+    # Tela de Desempenho (somente administrador)
+    if escolha == "Desempenho":
+        st.subheader("Desempenho")
+
+        st.write("**Telas (tempo por execução)**")
+        telas = pd.DataFrame(metricas.resumo_telas(),
+                             columns=["tela", "execucoes", "media", "p95", "maximo", "consultas"])
+        telas[["media", "p95", "maximo"]] = (telas[["media", "p95", "maximo"]] * 1000).round(1)
+        telas.columns = ["Tela", "Execuções", "Média (ms)", "p95 (ms)", "Máximo (ms)", "Consultas por Execução"]
+        st.dataframe(telas, hide_index=True)
+
+        st.write("**Consultas com maior tempo total**")
+        consultas = pd.DataFrame(metricas.resumo_consultas(),
+                                 columns=["sql", "execucoes", "total", "media", "maximo", "linhas"])
+        consultas[["total", "media", "maximo"]] = (consultas[["total", "media", "maximo"]] * 1000).round(1)
+        consultas.columns = ["SQL", "Execuções", "Total (ms)", "Média (ms)", "Máximo (ms)", "Linhas"]
+        st.dataframe(consultas, hide_index=True)
+
+        lentas = metricas.consultas_lentas()
+        st.write(f"**Consultas lentas recentes (acima de {CONSULTA_LENTA * 1000:.0f} ms)**")
+        if lentas:
+            for lenta in lentas:
+                with st.expander(f"{lenta['duracao'] * 1000:.0f} ms - {lenta['tela'] or 'fora das telas'} - "
+                                 f"{lenta['sql'][:80]}"):
+                    st.code(lenta["sql"], language="sql")
+                    st.write(f"{lenta['linhas']} linha(s)")
+                    st.code("\n".join(lenta["plano"]) or "(sem plano)")
+        else:
+            st.info("Nenhuma consulta lenta registrada.")
+
+        st.write("**Banco de Dados**")
+        st.json(almox.backend.estatisticas())
 
+        st.button("Zerar Métricas", on_click=metricas.zerar)
+finally:
+    concluir_tela()
@@ -0,0 +1 @@
+# Pacote com a lógica de banco de dados do Controle de Estoque (Almoxeletrico.py)
@@ -0,0 +1,241 @@
+import argparse
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import date
+from pathlib import Path
+
+from almoxeletrico.backends import criar_backend, depositos_configurados
+from almoxeletrico.exportacao import EXTENSAO, FORMATOS, exportar_dataframe
+from almoxeletrico.importacao import gravar_lotes, importacao_concluida, rejeitadas_csv
+from almoxeletrico.leitura import TAMANHO_LOTE, digest_arquivo, ler_planilha
+from almoxeletrico.servicos import Almoxarifado
+from almoxeletrico.tarefas import finalizar_tarefa, progresso_tarefa, reservar_importacao
+
+# Linha de comando do Controle de Estoque, para cargas e exportações agendadas (cron, Agendador
+# de Tarefas) sem a interface web. Usa os mesmos serviços e o mesmo motor de importação das telas:
+#
+#   python -m almoxeletrico importar-saidas planilhas/        (ou import-saidas)
+#   python -m almoxeletrico exportar-estoque --formato CSV     (ou export-estoque)
+#   python -m almoxeletrico reconstruir-saldos                 (ou rebuild-balances)
+#   python -m almoxeletrico atualizar-analitico                (exporta o livro para o cache Parquet)
+#   python -m almoxeletrico processar-tarefas                  (executa a fila de importações da interface)
+#
+# Diretórios são expandidos nas planilhas .csv/.xlsx que contêm. As planilhas são lidas e
+# divididas em lotes por processos paralelos; a gravação é feita apenas pelo processo principal
+# (um único escritor no SQLite), uma planilha por vez, na ordem em que as leituras terminam.
+# Como na tela, cada planilha é identificada pelo conteúdo: as já importadas são puladas e uma
+# importação interrompida continua do primeiro lote não gravado. Antes de gravar, a planilha é
+# reservada na fila de importações (tabela tarefas), então a tela não a importa ao mesmo tempo e
+# uma planilha já em importação pela tela é pulada.
+
+# Comando -> (tipo de importação, apelido)
+IMPORTACOES = {
+    "importar-materiais": ("materiais", "import-materiais"),
+    "importar-entradas": ("entrada", "import-entradas"),
+    "importar-saidas": ("saída", "import-saidas"),
+    "importar-baixas": ("baixa_eqtl", "import-baixas"),
+    "importar-inventario": ("inventario", "import-inventario"),
+}
+
+EXTENSOES = (".csv", ".xlsx")
+SUFIXO_RECUSADAS = ".recusadas.csv"
+
+
+# Função para listar as planilhas dos caminhos informados (diretórios em ordem alfabética, sem os
+# arquivos de linhas recusadas gravados por importações anteriores)
+def listar_planilhas(caminhos):
+    planilhas = []
+    for caminho in map(Path, caminhos):
+        if caminho.is_dir():
+            planilhas += sorted(item for item in caminho.iterdir()
+                                if item.suffix.lower() in EXTENSOES and not item.name.endswith(SUFIXO_RECUSADAS))
+        else:
+            planilhas.append(caminho)
+    return planilhas
+
+
+# Lê as planilhas em até "processos" processos paralelos, com no máximo 2 leituras por processo
+# aguardando a gravação. Gera (caminho, digest, (total, lotes) ou a exceção da leitura).
+def _ler_em_paralelo(pendentes, processos, tamanho_lote):
+    if processos <= 1:
+        for caminho, digest in pendentes:
+            try:
+                yield caminho, digest, ler_planilha(caminho, tamanho_lote)
+            except Exception as erro:
+                yield caminho, digest, erro
+        return
+
+    fila = iter(pendentes)
+    with ProcessPoolExecutor(max_workers=processos) as executor:
+        em_andamento = {}
+
+        def enviar():
+            for caminho, digest in fila:
+                em_andamento[executor.submit(ler_planilha, caminho, tamanho_lote)] = (caminho, digest)
+                if len(em_andamento) >= 2 * processos:
+                    break
+
+        enviar()
+        while em_andamento:
+            prontos, _ = wait(em_andamento, return_when=FIRST_COMPLETED)
+            for futuro in prontos:
+                caminho, digest = em_andamento.pop(futuro)
+                erro = futuro.exception()
+                yield caminho, digest, erro or futuro.result()
+            enviar()
+
+
+# Função para importar as planilhas do tipo informado. Retorna o número de planilhas com erro.
+def importar(almox, tipo, caminhos, processos, tamanho_lote=TAMANHO_LOTE, recusadas=None):
+    conn = almox.backend.conexao()
+    pendentes, erros = [], 0
+    for caminho in listar_planilhas(caminhos):
+        if not caminho.is_file():
+            erros += 1
+            print(f"{caminho}: arquivo não encontrado.")
+            continue
+        with open(caminho, "rb") as arquivo:
+            digest = digest_arquivo(arquivo)
+        if importacao_concluida(conn, digest, tipo):
+            print(f"{caminho}: já importada.")
+        else:
+            pendentes.append((caminho, digest))
+
+    for caminho, digest, leitura in _ler_em_paralelo(pendentes, processos, tamanho_lote):
+        inicio = time.perf_counter()
+        tarefa_id = reservar_importacao(conn, almox.tarefas.diretorio, digest, tipo, caminho.name)
+        if tarefa_id is None:
+            print(f"{caminho}: em importação por outra tarefa (ou já importada).")
+            continue
+        try:
+            if isinstance(leitura, Exception):
+                raise leitura
+            total, lotes = leitura
+            resultado = gravar_lotes(conn, digest, tipo, lambda: (total, iter(lotes)),
+                                     progresso_tarefa(conn, tarefa_id))
+        except Exception as erro:
+            finalizar_tarefa(conn, tarefa_id, erro=erro)
+            erros += 1
+            print(f"{caminho}: ERRO - {erro}")
+            continue
+        finalizar_tarefa(conn, tarefa_id, resultado)
+
+        mensagem = f"{caminho}: {resultado.gravadas} registro(s) gravado(s)"
+        if len(resultado.rejeitadas):
+            destino = Path(recusadas or caminho.parent) / f"{caminho.stem}{SUFIXO_RECUSADAS}"
+            destino.write_bytes(rejeitadas_csv(resultado.rejeitadas))
+            mensagem += f", {len(resultado.rejeitadas)} linha(s) recusada(s) em {destino}"
+        print(f"{mensagem} ({time.perf_counter() - inicio:.1f} s).")
+    return erros
+
+
+# Função para gravar a Visão Geral do Estoque num arquivo; retorna o caminho gravado
+def exportar_estoque(almox, formato, saida=None, codigo=None):
+    saida = Path(saida or f"estoque_{date.today():%Y%m%d}.{EXTENSAO[formato]}")
+    saida.write_bytes(exportar_dataframe(almox.saldos.visao_geral(codigo), formato, "Estoque"))
+    return saida
+
+
+# Função para executar as tarefas da fila de importação (pendentes ou interrompidas). Retorna o
+# número de tarefas com erro.
+def processar_tarefas(almox):
+    situacoes = almox.tarefas.processar_pendentes()
+    for tarefa_id, situacao in situacoes.items():
+        tarefa = almox.tarefas.tarefa(tarefa_id)
+        if situacao is None:
+            print(f"Tarefa {tarefa_id} ({tarefa.arquivo}): em execução por outro processo.")
+        elif situacao == "erro":
+            print(f"Tarefa {tarefa_id} ({tarefa.arquivo}): ERRO - {tarefa.mensagem}")
+        else:
+            print(f"Tarefa {tarefa_id} ({tarefa.arquivo}): {tarefa.gravadas} registro(s) gravado(s).")
+    if not situacoes:
+        print("Nenhuma tarefa pendente.")
+    return sum(situacao == "erro" for situacao in situacoes.values())
+
+
+# Função para recalcular os saldos e a conciliação a partir do livro e conferir o resultado
+def reconstruir_saldos(almox):
+    almox.saldos.reconstruir()
+    almox.pendencias.reconstruir()
+    return almox.saldos.verificar() + almox.pendencias.verificar()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m almoxeletrico",
+                                     description="Controle de Estoque pela linha de comando")
+    parser.add_argument("--deposito", help="Nome do depósito em ALMOXELETRICO_DEPOSITOS (padrão: o primeiro)")
+    parser.add_argument("--banco", help="Caminho ou URL do banco (substitui --deposito)")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    for comando, (tipo, apelido) in IMPORTACOES.items():
+        sub = comandos.add_parser(comando, aliases=[apelido], help=f"Importar planilhas ({tipo})")
+        sub.set_defaults(comando=comando)
+        sub.add_argument("caminhos", nargs="+", help="Planilhas .csv/.xlsx ou diretórios com planilhas")
+        sub.add_argument("--processos", type=int, default=os.cpu_count() or 1,
+                         help="Processos de leitura em paralelo (padrão: número de CPUs)")
+        sub.add_argument("--tamanho-lote", type=int, default=TAMANHO_LOTE)
+        sub.add_argument("--recusadas", help="Diretório das linhas recusadas (padrão: o da planilha)")
+
+    sub = comandos.add_parser("exportar-estoque", aliases=["export-estoque"], help="Exportar a Visão Geral do Estoque")
+    sub.set_defaults(comando="exportar-estoque")
+    sub.add_argument("--formato", choices=FORMATOS, default="XLSX")
+    sub.add_argument("--saida", help="Arquivo de saída (padrão: estoque_AAAAMMDD.<formato>)")
+    sub.add_argument("--codigo", type=int, help="Exportar só este material")
+
+    sub = comandos.add_parser("atualizar-analitico", help="Exportar as novas movimentações para o cache analítico")
+    sub.set_defaults(comando="atualizar-analitico")
+
+    sub = comandos.add_parser("processar-tarefas",
+                              help="Executar as importações enviadas pela interface que ainda estão na fila")
+    sub.set_defaults(comando="processar-tarefas")
+
+    sub = comandos.add_parser("reconstruir-saldos", aliases=["rebuild-balances"],
+                              help="Recalcular saldos e conciliação a partir das movimentações")
+    sub.set_defaults(comando="reconstruir-saldos")
+
+    args = parser.parse_args(argv)
+
+    depositos = depositos_configurados()
+    if args.banco:
+        url = args.banco
+    elif args.deposito:
+        if args.deposito not in depositos:
+            parser.error(f"Depósito desconhecido: {args.deposito} (configurados: {', '.join(depositos)})")
+        url = depositos[args.deposito]
+    else:
+        url = next(iter(depositos.values()))
+
+    almox = Almoxarifado(criar_backend(url))
+    almox.backend.migrar()
+    try:
+        if args.comando in IMPORTACOES:
+            tipo = IMPORTACOES[args.comando][0]
+            return 1 if importar(almox, tipo, args.caminhos, args.processos, args.tamanho_lote, args.recusadas) else 0
+
+        if args.comando == "exportar-estoque":
+            print(f"Estoque exportado em {exportar_estoque(almox, args.formato, args.saida, args.codigo)}.")
+            return 0
+
+        if args.comando == "atualizar-analitico":
+            if almox.analitico.cache is None:
+                print("Cache analítico indisponível (requer o pacote pyarrow).")
+                return 1
+            print(f"{almox.analitico.atualizar()} movimentação(ões) exportada(s) para {almox.analitico.cache.diretorio}.")
+            return 0
+
+        if args.comando == "processar-tarefas":
+            return processar_tarefas(almox)
+
+        divergencias = reconstruir_saldos(almox)
+        if divergencias:
+            print(f"{len(divergencias)} divergência(s) após a reconstrução.")
+            return 1
+        print("Saldos e conciliação reconstruídos com sucesso!")
+        return 0
+    finally:
+        almox.backend.fechar()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
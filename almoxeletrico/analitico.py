@@ -0,0 +1,338 @@
+import json
+import os
+import threading
+from datetime import timedelta
+from pathlib import Path
+
+import pandas as pd
+
+from almoxeletrico.exportacao import PARQUET_DISPONIVEL
+from almoxeletrico.livro import REFERENCIAS
+from almoxeletrico.movimentacoes import filtro_movimentacoes
+
+# Cache analítico colunar do livro de movimentações (Parquet, lido com pyarrow).
+#
+# As movimentações são exportadas de forma incremental para arquivos Parquet particionados por
+# mês (mes=AAAA-MM/parte-....parquet), a partir do último id exportado. O manifesto.json lista as
+# partes de cada mês, o último id e a versão do livro; os leitores só enxergam as partes do
+# manifesto, que é sempre substituído por inteiro (os.replace).
+#
+# Os relatórios agregados leem as partes dos meses do filtro (com o filtro empurrado para a
+# leitura do Parquet) e somam a "cauda" ainda não exportada (id > último exportado) direto do
+# SQLite. Alterações e exclusões no livro incrementam versoes['movimentacoes'] por trigger; com
+# versão diferente da do manifesto, o cache é refeito do zero.
+#
+# As consultas nunca exportam: refazer o cache leva segundos num livro grande. Enquanto o cache
+# estiver desatualizado (outra versão do livro ou cauda acima de CAUDA_MAXIMA), os relatórios são
+# calculados só no SQLite, e a exportação roda fora da página (ServicoAnalitico, numa thread de
+# fundo, ou "python -m almoxeletrico atualizar-analitico").
+#
+# O cache só compensa em livros grandes: até algumas centenas de milhares de movimentações, o
+# SQLite agrega o livro mais rápido do que o Parquet é lido e somado à cauda. Abaixo de
+# LIMIAR_CACHE movimentações (pelo maior id do livro), os relatórios vêm direto do SQLite e nada é
+# exportado; "python -m benchmarks.fluxos" mede os dois caminhos e mostra o ponto de virada.
+#
+# Sem pyarrow, os relatórios são calculados apenas no SQLite.
+
+LOTE_EXPORTACAO = 200000
+CAUDA_MAXIMA = 20000  # movimentações não exportadas somadas do SQLite; acima disso o cache está desatualizado
+LIMIAR_CACHE = 250000  # tamanho do livro a partir do qual o cache é usado
+MAXIMO_PARTES = 16  # partes por mês antes de compactar o mês num único arquivo
+MANIFESTO = "manifesto.json"
+
+COLUNAS_CACHE = ["id", "data_movimentacao", "mes", "codigo", "tipo", "quantidade", "projeto", "equipe"]
+SQL_COLUNAS_CACHE = ", ".join("substr(data_movimentacao, 1, 7)" if coluna == "mes" else coluna
+                              for coluna in COLUNAS_CACHE)
+AGRUPAMENTOS = ["mes", "codigo", "tipo", "projeto", "equipe"]
+# Filtros atendidos pelos índices do livro; com eles o SQLite é mais rápido que o cache (no período,
+# o Parquet só descarta meses inteiros)
+FILTROS_INDEXADOS = ["codigo", "projeto", "equipe", "data_inicial"]
+COLUNAS_RESUMO = ["Tipo", "Movimentações", "Quantidade", "Primeira", "Última"]
+
+
+def _esquema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ("id", pa.int64()),
+        ("data_movimentacao", pa.string()),
+        ("mes", pa.string()),
+        ("codigo", pa.int64()),
+        ("tipo", pa.string()),
+        ("quantidade", pa.float64()),
+        ("projeto", pa.string()),
+        ("equipe", pa.string()),
+    ])
+
+
+# Versão do livro: muda a cada alteração ou exclusão de movimentação
+def _versao_livro(conn):
+    c = conn.cursor()
+    c.execute("SELECT versao FROM versoes WHERE tabela = 'movimentacoes'")
+    versao = c.fetchone()
+    return versao[0] if versao else 0
+
+
+class CacheAnalitico:
+    def __init__(self, diretorio):
+        self.diretorio = Path(diretorio)
+        self._lock = threading.Lock()
+
+    def manifesto(self):
+        try:
+            with open(self.diretorio / MANIFESTO, encoding="utf-8") as arquivo:
+                return json.load(arquivo)
+        except (OSError, ValueError):
+            return {"versao": None, "ultimo_id": 0, "partes": {}}
+
+    def _gravar_manifesto(self, manifesto):
+        temporario = self.diretorio / (MANIFESTO + ".tmp")
+        with open(temporario, "w", encoding="utf-8") as arquivo:
+            json.dump(manifesto, arquivo, indent=1, sort_keys=True)
+        os.replace(temporario, self.diretorio / MANIFESTO)
+
+    def _gravar_parte(self, tabela, mes, nome):
+        import pyarrow.parquet as pq
+
+        relativo = f"mes={mes}/{nome}.parquet"
+        destino = self.diretorio / relativo
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        temporario = destino.with_suffix(".tmp")
+        pq.write_table(tabela, temporario, compression="zstd")
+        os.replace(temporario, destino)
+        return relativo
+
+    # Remove arquivos que saíram do manifesto; no Windows, arquivos ainda abertos por outro leitor
+    # ficam para a próxima limpeza
+    def _remover(self, relativos):
+        for relativo in relativos:
+            try:
+                (self.diretorio / relativo).unlink(missing_ok=True)
+            except OSError:
+                pass
+
+    # Junta as partes de um mês num único arquivo
+    def _compactar(self, mes, partes, geracao):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        tabela = pa.concat_tables(pq.read_table(self.diretorio / parte, schema=_esquema()) for parte in partes)
+        tabela = tabela.sort_by("id")
+        primeiro, ultimo = tabela["id"][0].as_py(), tabela["id"][-1].as_py()
+        return self._gravar_parte(tabela, mes, f"parte-g{geracao}-{primeiro:012d}-{ultimo:012d}-c")
+
+    # Função para exportar as movimentações com id acima do último exportado (ou todo o livro, se
+    # a versão mudou). Com minimo, só exporta se a cauda tiver ao menos essa quantidade de linhas.
+    # Retorna o número de movimentações exportadas.
+    def atualizar(self, conn, minimo=0):
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        with self._lock:
+            manifesto = self.manifesto()
+            c = conn.cursor()
+            # Leitura num único snapshot: versão, último id e linhas exportadas são consistentes
+            c.execute("BEGIN")
+            try:
+                versao = _versao_livro(conn)
+                antigas = []
+                if manifesto["versao"] != versao:
+                    antigas = [parte for partes in manifesto["partes"].values() for parte in partes]
+                    manifesto = {"versao": versao, "ultimo_id": 0, "partes": {}}
+
+                c.execute("SELECT MAX(id) FROM livro")
+                maximo = c.fetchone()[0] or 0
+                if maximo - manifesto["ultimo_id"] < max(minimo, 1) and not antigas:
+                    return 0
+
+                geracao = versao or 0
+                exportadas = 0
+                c.execute(f"""
+                    SELECT {SQL_COLUNAS_CACHE}
+                    FROM movimentacoes WHERE id > ? AND id <= ? ORDER BY id
+                """, (manifesto["ultimo_id"], maximo))
+                while True:
+                    linhas = c.fetchmany(LOTE_EXPORTACAO)
+                    if not linhas:
+                        break
+                    esquema = _esquema()
+                    tabela = pa.Table.from_arrays([pa.array(coluna, type=campo.type)
+                                                   for coluna, campo in zip(zip(*linhas), esquema)], schema=esquema)
+                    primeiro, ultimo = linhas[0][0], linhas[-1][0]
+                    for mes in pc.unique(tabela["mes"]).to_pylist():
+                        filtro = pc.is_null(tabela["mes"]) if mes is None else pc.equal(tabela["mes"], mes)
+                        mes = mes or "sem-data"
+                        parte = self._gravar_parte(tabela.filter(filtro), mes,
+                                                   f"parte-g{geracao}-{primeiro:012d}-{ultimo:012d}")
+                        manifesto["partes"].setdefault(mes, []).append(parte)
+                    exportadas += len(linhas)
+                manifesto["ultimo_id"] = maximo
+            finally:
+                conn.rollback()
+
+            for mes, partes in manifesto["partes"].items():
+                if len(partes) > MAXIMO_PARTES:
+                    manifesto["partes"][mes] = [self._compactar(mes, partes, geracao)]
+                    antigas += partes
+
+            self.diretorio.mkdir(parents=True, exist_ok=True)
+            self._gravar_manifesto(manifesto)
+            self._remover(antigas)
+            return exportadas
+
+    # Partes do manifesto nos meses entre inicio e fim ('AAAA-MM', inclusive; None = sem limite);
+    # movimentações sem data só entram sem filtro de período
+    def partes(self, manifesto, inicio=None, fim=None):
+        arquivos = []
+        for mes, partes in manifesto["partes"].items():
+            if mes == "sem-data":
+                incluir = inicio is None and fim is None
+            else:
+                incluir = (inicio is None or mes >= inicio) and (fim is None or mes <= fim)
+            if incluir:
+                arquivos += [str(self.diretorio / parte) for parte in partes]
+        return arquivos
+
+
+# Filtro do pyarrow equivalente a filtro_movimentacoes()
+def _filtro_arrow(codigo=None, tipo=None, data_inicial=None, data_final=None, projeto=None, equipe=None):
+    import pyarrow.dataset as ds
+
+    condicoes = []
+    if codigo is not None:
+        condicoes.append(ds.field("codigo") == codigo)
+    if tipo:
+        condicoes.append(ds.field("tipo") == tipo)
+    if data_inicial:
+        condicoes.append(ds.field("data_movimentacao") >= data_inicial.isoformat())
+    if data_final:
+        condicoes.append(ds.field("data_movimentacao") < (data_final + timedelta(days=1)).isoformat())
+    if projeto:
+        condicoes.append(ds.field("projeto") == projeto)
+    if equipe:
+        condicoes.append(ds.field("equipe") == equipe)
+
+    filtro = None
+    for condicao in condicoes:
+        filtro = condicao if filtro is None else filtro & condicao
+    return filtro
+
+
+_METRICAS = ["movimentacoes", "quantidade", "primeira", "ultima"]
+
+
+def _agregar_cache(cache, manifesto, por, filtros):
+    import pyarrow.dataset as ds
+
+    inicio = filtros["data_inicial"].isoformat()[:7] if filtros.get("data_inicial") else None
+    fim = filtros["data_final"].isoformat()[:7] if filtros.get("data_final") else None
+    arquivos = cache.partes(manifesto, inicio, fim)
+    if not arquivos:
+        return pd.DataFrame(columns=por + _METRICAS)
+
+    tabela = ds.dataset(arquivos, format="parquet", schema=_esquema()).to_table(
+        columns=sorted(set(por) | {"id", "quantidade", "data_movimentacao"}), filter=_filtro_arrow(**filtros))
+    agrupado = tabela.group_by(por).aggregate([
+        ("id", "count"), ("quantidade", "sum"), ("data_movimentacao", "min"), ("data_movimentacao", "max"),
+    ])
+    return agrupado.to_pandas().rename(columns={
+        "id_count": "movimentacoes", "quantidade_sum": "quantidade",
+        "data_movimentacao_min": "primeira", "data_movimentacao_max": "ultima",
+    })[por + _METRICAS]
+
+
+# Agrupa direto no livro (pelos ids) e só depois junta os nomes de tipo, projeto e equipe
+def _agregar_sqlite(conn, por, filtros, apos_id=0):
+    where, params = filtro_movimentacoes(**filtros)
+    chaves = [("strftime('%Y-%m', data, 'unixepoch')" if coluna == "mes"
+               else f"{coluna}_id" if coluna in REFERENCIAS else coluna) + f" AS {coluna}" for coluna in por]
+    nomes = [f"r_{coluna}.nome" if coluna in REFERENCIAS else f"a.{coluna}" for coluna in por]
+    juncoes = "".join(f" LEFT JOIN {REFERENCIAS[coluna]} r_{coluna} ON r_{coluna}.id = a.{coluna}"
+                      for coluna in por if coluna in REFERENCIAS)
+    c = conn.cursor()
+    c.execute(f"""
+        SELECT {", ".join(nomes)}, a.movimentacoes, a.quantidade,
+               datetime(a.primeira, 'unixepoch'), datetime(a.ultima, 'unixepoch')
+        FROM (
+            SELECT {", ".join(chaves)}, COUNT(*) AS movimentacoes, COALESCE(SUM(quantidade), 0) AS quantidade,
+                   MIN(data) AS primeira, MAX(data) AS ultima
+            FROM livro{where} AND id > ?
+            GROUP BY {", ".join(por)}
+        ) a{juncoes}
+    """, params + (apos_id,))
+    return pd.DataFrame(c.fetchall(), columns=por + _METRICAS)
+
+
+# Função para verificar se o livro tem o tamanho a partir do qual o cache compensa (limiar=None
+# usa LIMIAR_CACHE)
+def usar_cache(conn, limiar=None):
+    limiar = LIMIAR_CACHE if limiar is None else limiar
+    c = conn.cursor()
+    c.execute("SELECT MAX(id) FROM livro")
+    return (c.fetchone()[0] or 0) >= limiar
+
+
+# Função para ler o manifesto do cache se ele estiver atual (mesma versão do livro e até
+# CAUDA_MAXIMA movimentações não exportadas); None se o cache precisa ser atualizado
+def manifesto_atual(conn, cache):
+    manifesto = cache.manifesto()
+    if manifesto["versao"] != _versao_livro(conn):
+        return None
+    c = conn.cursor()
+    c.execute("SELECT MAX(id) FROM livro")
+    if (c.fetchone()[0] or 0) - manifesto["ultimo_id"] > CAUDA_MAXIMA:
+        return None
+    return manifesto
+
+
+# Função para agregar as movimentações por colunas de AGRUPAMENTOS (com os filtros de
+# filtro_movimentacoes): movimentações, quantidade somada, primeira e última data de cada grupo.
+# Com o cache atual, lê as partes Parquet e soma a cauda não exportada do SQLite. Sem cache, com o
+# cache desatualizado, com o livro abaixo do limiar (usar_cache) ou com filtro de FILTROS_INDEXADOS
+# (linhas achadas pelos índices do banco), só o SQLite.
+def agregar(conn, cache, por, limiar=None, **filtros):
+    seletivo = any(filtros.get(campo) not in (None, "") for campo in FILTROS_INDEXADOS)
+    usar = cache is not None and not seletivo and usar_cache(conn, limiar)
+    manifesto = manifesto_atual(conn, cache) if usar else None
+    if manifesto is None:
+        return _agregar_sqlite(conn, por, filtros)
+
+    try:
+        do_cache = _agregar_cache(cache, manifesto, por, filtros)
+    except FileNotFoundError:
+        return _agregar_sqlite(conn, por, filtros)  # parte removida por uma exportação concorrente
+    partes = [do_cache, _agregar_sqlite(conn, por, filtros, manifesto["ultimo_id"])]
+    partes = [parte for parte in partes if len(parte)]
+    if not partes:
+        return pd.DataFrame(columns=por + _METRICAS)
+    df = pd.concat(partes, ignore_index=True)
+    return (df.groupby(por, dropna=False, as_index=False)
+              .agg(movimentacoes=("movimentacoes", "sum"), quantidade=("quantidade", "sum"),
+                   primeira=("primeira", "min"), ultima=("ultima", "max")))
+
+
+# Função para resumir as movimentações do filtro por tipo (mesmo formato de resumo_movimentacoes)
+def resumo_por_tipo(conn, cache, limiar=None, **filtros):
+    df = agregar(conn, cache, ["tipo"], limiar, **filtros)
+    df["quantidade"] = df["quantidade"].fillna(0)
+    df = df.sort_values("tipo", ignore_index=True)
+    df.columns = COLUNAS_RESUMO
+    return df
+
+
+# Função para montar a movimentação mensal (meses nas linhas, tipos nas colunas) de um material ou de todos
+def movimentacao_mensal(conn, cache, codigo=None, limiar=None):
+    df = agregar(conn, cache, ["mes", "tipo"], limiar, codigo=codigo)
+    if df.empty:
+        return pd.DataFrame(columns=["Mês"])
+    mensal = df.pivot_table(index="mes", columns="tipo", values="quantidade", aggfunc="sum", fill_value=0)
+    mensal = mensal.sort_index(ascending=False).reset_index().rename(columns={"mes": "Mês"})
+    mensal.columns.name = None
+    return mensal
+
+
+# Função para criar o cache do depósito no diretório informado (None sem pyarrow ou sem diretório)
+def criar_cache(diretorio):
+    if not PARQUET_DISPONIVEL or not diretorio:
+        return None
+    return CacheAnalitico(diretorio)
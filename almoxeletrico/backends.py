@@ -0,0 +1,115 @@
+import os
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+from almoxeletrico.conexoes import DB_PATH, PoolConexoes, estatisticas_escrita, transacao
+from almoxeletrico.db import migrar
+
+# Backends de armazenamento usados pelos repositórios (almoxeletrico.repositorios).
+#
+# Um backend sabe abrir conexões, executar transações de escrita e criar/atualizar o esquema.
+# Cada depósito é um backend identificado por uma URL ("sqlite:///estoque.db"); a variável de
+# ambiente ALMOXELETRICO_DEPOSITOS lista os depósitos de uma instalação com vários depósitos:
+#
+#   ALMOXELETRICO_DEPOSITOS="Central=sqlite:///estoque.db;Norte=sqlite:///norte.db"
+#
+# Todo depósito é um banco SQLite: o SQL dos repositórios e serviços (triggers, views, PRAGMAs,
+# BEGIN IMMEDIATE, FTS5, funções de data) é do dialeto do SQLite, e URLs de outros bancos são
+# recusadas. Backend é a interface que repositórios e serviços usam para chegar ao depósito
+# (conexões, transações, esquema e diretórios), implementada por BackendSQLite.
+
+
+class Backend(ABC):
+    url = None
+
+    # Conexão da thread atual (DB-API 2.0)
+    @abstractmethod
+    def conexao(self):
+        ...
+
+    # Context manager de transação de escrita; entrega a conexão
+    @abstractmethod
+    def transacao(self):
+        ...
+
+    # Cria/atualiza o esquema; retorna a versão final
+    @abstractmethod
+    def migrar(self):
+        ...
+
+    # Diretório do cache analítico do depósito (None: relatórios calculados só no banco)
+    def diretorio_analitico(self):
+        return None
+
+    # Diretório das planilhas enviadas à fila de importação (None: um diretório temporário)
+    def diretorio_tarefas(self):
+        return None
+
+    # Indicadores do backend exibidos no painel Desempenho
+    def estatisticas(self):
+        return {}
+
+    def fechar(self):
+        pass
+
+
+class BackendSQLite(Backend):
+    def __init__(self, caminho=DB_PATH):
+        self.caminho = caminho
+        self.url = f"sqlite:///{caminho}"
+        self.pool = PoolConexoes(caminho)
+
+    def conexao(self):
+        return self.pool.conexao()
+
+    @contextmanager
+    def transacao(self):
+        conn = self.conexao()
+        with transacao(conn):
+            yield conn
+
+    def migrar(self):
+        return migrar(self.conexao())
+
+    # Ao lado do arquivo do banco: estoque.db -> estoque.analitico/
+    def diretorio_analitico(self):
+        if self.caminho == ":memory:":
+            return None
+        return os.path.splitext(self.caminho)[0] + ".analitico"
+
+    # estoque.db -> estoque.tarefas/
+    def diretorio_tarefas(self):
+        if self.caminho == ":memory:":
+            return None
+        return os.path.splitext(self.caminho)[0] + ".tarefas"
+
+    def estatisticas(self):
+        return {**estatisticas_escrita(), **self.pool.tamanho()}
+
+    def fechar(self):
+        self.pool.fechar()
+
+
+# Função para criar o backend de uma URL ("sqlite:///caminho.db"); um caminho simples é tratado como
+# SQLite. Outros bancos não são suportados.
+def criar_backend(url):
+    esquema, separador, endereco = url.partition("://")
+    if not separador:
+        return BackendSQLite(url)
+    if esquema != "sqlite":
+        raise ValueError(f"Banco de dados não suportado: {esquema} (os depósitos são bancos SQLite)")
+    return BackendSQLite(endereco.removeprefix("/"))
+
+
+# Função para ler os depósitos configurados: {nome: url}
+def depositos_configurados():
+    configuracao = os.environ.get("ALMOXELETRICO_DEPOSITOS", "").strip()
+    if not configuracao:
+        return {"Principal": f"sqlite:///{DB_PATH}"}
+
+    depositos = {}
+    for item in configuracao.split(";"):
+        if item.strip():
+            nome, _, url = item.partition("=")
+            depositos[nome.strip()] = url.strip()
+    return depositos
@@ -0,0 +1,104 @@
+import sqlite3
+
+# Busca de materiais por código ou descrição com o índice de texto FTS5 do SQLite.
+#
+# materiais_fts é uma tabela FTS5 de conteúdo externo (lê o texto de materiais, guarda só o índice),
+# com o tokenizador unicode61 sem acentos: "alca" encontra "ALÇA" e "conec cunha" encontra
+# "CONECTOR CUNHA TIPO I". Cada palavra digitada é buscada como prefixo e todas precisam aparecer.
+# Triggers em materiais mantêm o índice sincronizado. Se o SQLite não tiver FTS5, a busca usa LIKE.
+
+LIMITE_BUSCA = 20
+
+SQL_INDICE = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS materiais_fts USING fts5(
+        codigo, descricao,
+        content = 'materiais', content_rowid = 'id',
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '1 2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_materiais_fts_insert AFTER INSERT ON materiais
+    BEGIN
+        INSERT INTO materiais_fts (rowid, codigo, descricao) VALUES (NEW.id, NEW.codigo, NEW.descricao);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_materiais_fts_delete AFTER DELETE ON materiais
+    BEGIN
+        INSERT INTO materiais_fts (materiais_fts, rowid, codigo, descricao)
+        VALUES ('delete', OLD.id, OLD.codigo, OLD.descricao);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_materiais_fts_update AFTER UPDATE OF codigo, descricao ON materiais
+    BEGIN
+        INSERT INTO materiais_fts (materiais_fts, rowid, codigo, descricao)
+        VALUES ('delete', OLD.id, OLD.codigo, OLD.descricao);
+        INSERT INTO materiais_fts (rowid, codigo, descricao) VALUES (NEW.id, NEW.codigo, NEW.descricao);
+    END
+    """,
+]
+
+
+# Função para criar o índice de texto dos materiais (indexando os já cadastrados); sem FTS5
+# no SQLite, o índice não é criado e a busca usa LIKE
+def criar_indice_materiais(conn):
+    c = conn.cursor()
+    try:
+        for sql in SQL_INDICE:
+            c.execute(sql)
+    except sqlite3.OperationalError as erro:
+        if "fts5" not in str(erro):
+            raise
+        conn.rollback()
+        return False
+    c.execute("INSERT INTO materiais_fts (materiais_fts) VALUES ('rebuild')")
+    conn.commit()
+    return True
+
+
+def _indice_disponivel(conn):
+    c = conn.cursor()
+    c.execute("SELECT 1 FROM sqlite_master WHERE name = 'materiais_fts'")
+    return c.fetchone() is not None
+
+
+# Monta a expressão FTS5: cada palavra vira um prefixo entre aspas (pontuação como "1/0" ou
+# "DT 11/300" continua funcionando, pois o termo é tratado como frase)
+def _expressao_fts(termo):
+    return " ".join('"' + palavra.replace('"', '""') + '"*' for palavra in termo.split())
+
+
+# Função para buscar os materiais que correspondem ao termo (código ou palavras da descrição).
+# Retorna até limite tuplas (codigo, descricao, unidade); código exato aparece primeiro.
+# Sem termo, retorna os primeiros materiais por código.
+def buscar_materiais(conn, termo, limite=LIMITE_BUSCA):
+    termo = termo.strip()
+    c = conn.cursor()
+    if not termo:
+        c.execute("SELECT codigo, descricao, unidade FROM materiais ORDER BY codigo LIMIT ?", (limite,))
+        return c.fetchall()
+
+    codigo = int(termo) if termo.isdigit() else None
+    if _indice_disponivel(conn):
+        c.execute("""
+            SELECT m.codigo, m.descricao, m.unidade
+            FROM materiais_fts f
+            JOIN materiais m ON m.id = f.rowid
+            WHERE materiais_fts MATCH ?
+            ORDER BY m.codigo = ? DESC, bm25(materiais_fts, 10.0, 1.0), m.codigo
+            LIMIT ?
+        """, (_expressao_fts(termo), codigo, limite))
+        return c.fetchall()
+
+    condicoes = " AND ".join("(descricao LIKE ? OR CAST(codigo AS TEXT) LIKE ?)" for _ in termo.split())
+    params = [valor for palavra in termo.split() for valor in (f"%{palavra}%", f"{palavra}%")]
+    c.execute(f"""
+        SELECT codigo, descricao, unidade FROM materiais
+        WHERE {condicoes}
+        ORDER BY codigo = ? DESC, codigo
+        LIMIT ?
+    """, params + [codigo, limite])
+    return c.fetchall()
@@ -0,0 +1,258 @@
+import argparse
+
+import pandas as pd
+
+from almoxeletrico.conexoes import transacao
+from almoxeletrico.livro import TIPO_ID, sql_nome
+
+# Conciliação dos projetos: para cada projeto, equipe e material, as quantidades de saída,
+# baixa EQTL, devolução e estorno acumuladas no livro de movimentações.
+#
+# Pendente Baixa   = Saídas - Baixas EQTL   (material retirado ainda não baixado na EQTL)
+# Pendente Estorno = Devoluções - Estornos  (material devolvido ainda não estornado)
+#
+# A devolução é registrada sem equipe e o estorno com a equipe, então devoluções e estornos são
+# conciliados só por projeto e material: ficam na linha sem equipe (equipe = ''), qualquer que
+# seja a equipe informada na movimentação.
+#
+# A tabela conciliacao é mantida por triggers no livro (como os saldos), então a tela
+# Pendências lê apenas as linhas com pendência, pelo índice parcial idx_conciliacao_pendentes,
+# sem percorrer o livro.
+
+TOLERANCIA = 1e-6
+
+COLUNAS_PENDENCIAS = ["Projeto", "Equipe", "Código", "Descrição", "Saídas", "Baixas EQTL", "Devoluções", "Estornos",
+                      "Pendente Baixa", "Pendente Estorno"]
+
+SQL_TABELAS = [
+    """
+    CREATE TABLE IF NOT EXISTS conciliacao (
+        projeto TEXT NOT NULL,
+        equipe TEXT NOT NULL,
+        codigo INTEGER NOT NULL,
+        saidas REAL NOT NULL DEFAULT 0,
+        baixas_eqtl REAL NOT NULL DEFAULT 0,
+        devolucoes REAL NOT NULL DEFAULT 0,
+        estornos REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (projeto, equipe, codigo)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_conciliacao_pendentes ON conciliacao (equipe, projeto, codigo)
+    WHERE saidas != baixas_eqtl OR devolucoes != estornos
+    """,
+]
+
+# Colunas da conciliação e o tipo de movimentação somado em cada uma
+COLUNAS_TIPO = [("saidas", "saída"), ("baixas_eqtl", "baixa_eqtl"), ("devolucoes", "devolução"), ("estornos", "estorno")]
+
+# Tipos conciliados por projeto e material, sem a equipe
+TIPOS_SEM_EQUIPE = ["devolução", "estorno"]
+
+
+# Quantidade da movimentação em cada coluna da conciliação (multiplicada pelo fator, se houver).
+# Na view o tipo é comparado pelo nome; no livro (triggers), pelo id.
+def _sql_pivo(ref, fator="", por_id=False):
+    return [f"{fator}CASE WHEN {_sql_tipo(ref, [tipo], por_id)} THEN COALESCE({ref}.quantidade, 0) ELSE 0 END"
+            for _, tipo in COLUNAS_TIPO]
+
+
+def _sql_tipo(ref, tipos, por_id=False):
+    if por_id:
+        return f"{ref}.tipo_id IN ({', '.join(str(TIPO_ID[tipo]) for tipo in tipos)})"
+    return f"{ref}.tipo IN ({', '.join(repr(tipo) for tipo in tipos)})"
+
+
+# Equipe da linha da conciliação em que a movimentação é somada ('' para devolução e estorno)
+def _sql_equipe(ref, por_id=False):
+    equipe = sql_nome("equipe", ref) if por_id else f"{ref}.equipe"
+    return f"CASE WHEN {_sql_tipo(ref, TIPOS_SEM_EQUIPE, por_id)} THEN '' ELSE COALESCE({equipe}, '') END"
+
+
+# Movimentações que entram na conciliação: com projeto, material e um dos tipos conciliados
+def _sql_filtro(ref):
+    return (f"{ref}.projeto IS NOT NULL AND {ref}.projeto != '' AND {ref}.codigo IS NOT NULL "
+            f"AND {_sql_tipo(ref, [tipo for _, tipo in COLUNAS_TIPO])}")
+
+
+# Monta o corpo do trigger que aplica (sinal = 1) ou desfaz (sinal = -1) uma movimentação do livro
+def _sql_aplicar(ref, sinal):
+    return f"""
+        INSERT INTO conciliacao (projeto, equipe, codigo, saidas, baixas_eqtl, devolucoes, estornos)
+        SELECT {sql_nome("projeto", ref)}, {_sql_equipe(ref, por_id=True)}, {ref}.codigo,
+               {", ".join(_sql_pivo(ref, f"{sinal} * ", por_id=True))}
+        WHERE {ref}.projeto_id IS NOT NULL AND {ref}.codigo IS NOT NULL
+          AND {_sql_tipo(ref, [tipo for _, tipo in COLUNAS_TIPO], por_id=True)}
+        ON CONFLICT(projeto, equipe, codigo) DO UPDATE SET
+            saidas = saidas + excluded.saidas,
+            baixas_eqtl = baixas_eqtl + excluded.baixas_eqtl,
+            devolucoes = devolucoes + excluded.devolucoes,
+            estornos = estornos + excluded.estornos;
+    """
+
+
+SQL_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_conciliacao_insert AFTER INSERT ON livro
+    BEGIN
+        {_sql_aplicar("NEW", 1)}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_conciliacao_delete AFTER DELETE ON livro
+    BEGIN
+        {_sql_aplicar("OLD", -1)}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_conciliacao_update
+    AFTER UPDATE OF codigo, quantidade, tipo_id, projeto_id, equipe_id ON livro
+    BEGIN
+        {_sql_aplicar("OLD", -1)}
+        {_sql_aplicar("NEW", 1)}
+    END
+    """,
+]
+
+# Agrupamento de todo o livro numa única consulta (usado na reconstrução e na verificação)
+SQL_AGRUPADO = f"""
+    SELECT projeto, equipe, codigo, {", ".join(f"SUM({coluna})" for coluna, _ in COLUNAS_TIPO)}
+    FROM (
+        SELECT m.projeto, {_sql_equipe("m")} AS equipe, m.codigo,
+               {", ".join(f"{sql} AS {coluna}" for sql, (coluna, _) in zip(_sql_pivo("m"), COLUNAS_TIPO))}
+        FROM movimentacoes m
+        WHERE {_sql_filtro("m")}
+    )
+    GROUP BY projeto, equipe, codigo
+"""
+
+
+# Função para criar a tabela de conciliação (os triggers são criados junto com o livro); na
+# primeira execução a conciliação é calculada a partir das movimentações já existentes
+def criar_tabela_conciliacao(conn):
+    c = conn.cursor()
+    c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'conciliacao'")
+    existia = c.fetchone() is not None
+
+    for sql in SQL_TABELAS:
+        c.execute(sql)
+    conn.commit()
+
+    if not existia:
+        reconstruir_conciliacao(conn)
+
+
+# Função para recalcular toda a conciliação a partir do livro de movimentações
+def reconstruir_conciliacao(conn):
+    with transacao(conn):
+        c = conn.cursor()
+        c.execute("DELETE FROM conciliacao")
+        c.execute(f"""
+            INSERT INTO conciliacao (projeto, equipe, codigo, saidas, baixas_eqtl, devolucoes, estornos)
+            {SQL_AGRUPADO}
+        """)
+
+
+# Função para comparar a conciliação materializada com o livro de movimentações.
+# Retorna uma lista de ((projeto, equipe, codigo), registrado, calculado) com as divergências.
+def verificar_conciliacao(conn):
+    c = conn.cursor()
+    c.execute(SQL_AGRUPADO)
+    calculado = {tuple(linha[:3]): linha[3:] for linha in c.fetchall()}
+    c.execute("SELECT projeto, equipe, codigo, saidas, baixas_eqtl, devolucoes, estornos FROM conciliacao")
+    registrado = {tuple(linha[:3]): linha[3:] for linha in c.fetchall()}
+
+    zero = (0, 0, 0, 0)
+    divergencias = []
+    for chave in calculado.keys() | registrado.keys():
+        esperado, atual = calculado.get(chave, zero), registrado.get(chave, zero)
+        if any(abs(e - a) > TOLERANCIA for e, a in zip(esperado, atual)):
+            divergencias.append((chave, atual, esperado))
+    return divergencias
+
+
+# Filtro das linhas com pendência: o primeiro termo é o do índice parcial; o segundo descarta
+# resíduos de arredondamento das somas
+def _filtro_pendencias(equipe=None, projeto=""):
+    query = f"""
+        WHERE (c.saidas != c.baixas_eqtl OR c.devolucoes != c.estornos)
+          AND (ABS(c.saidas - c.baixas_eqtl) > {TOLERANCIA} OR ABS(c.devolucoes - c.estornos) > {TOLERANCIA})
+    """
+    params = []
+    if equipe is not None:
+        query += " AND c.equipe = ?"
+        params.append(equipe)
+    if projeto:
+        query += " AND c.projeto LIKE ?"
+        params.append(f"%{projeto}%")
+    return query, params
+
+
+# Função para listar as equipes com alguma pendência
+def equipes_pendentes(conn):
+    filtro, params = _filtro_pendencias()
+    c = conn.cursor()
+    c.execute(f"SELECT DISTINCT c.equipe FROM conciliacao c {filtro} ORDER BY c.equipe", params)
+    return [equipe[0] for equipe in c.fetchall()]
+
+
+# Função para contar as linhas pendentes e somar as quantidades pendentes:
+# (linhas, pendente baixa, pendente estorno)
+def totais_pendencias(conn, equipe=None, projeto=""):
+    filtro, params = _filtro_pendencias(equipe, projeto)
+    c = conn.cursor()
+    c.execute(f"""
+        SELECT COUNT(*), COALESCE(SUM(c.saidas - c.baixas_eqtl), 0), COALESCE(SUM(c.devolucoes - c.estornos), 0)
+        FROM conciliacao c {filtro}
+    """, params)
+    return c.fetchone()
+
+
+# Função para listar uma página das pendências (em COLUNAS_PENDENCIAS), por projeto, equipe e material.
+# Sem limite, lista todas (exportação).
+def listar_pendencias(conn, equipe=None, projeto="", limite=None, deslocamento=0):
+    filtro, params = _filtro_pendencias(equipe, projeto)
+    query = f"""
+        SELECT c.projeto, c.equipe, c.codigo, m.descricao, c.saidas, c.baixas_eqtl, c.devolucoes, c.estornos,
+               c.saidas - c.baixas_eqtl, c.devolucoes - c.estornos
+        FROM conciliacao c
+        LEFT JOIN materiais m ON m.codigo = c.codigo
+        {filtro}
+        ORDER BY c.projeto, c.equipe, c.codigo
+    """
+    if limite is not None:
+        query += " LIMIT ? OFFSET ?"
+        params += [limite, deslocamento]
+    c = conn.cursor()
+    c.execute(query, params)
+    return pd.DataFrame(c.fetchall(), columns=COLUNAS_PENDENCIAS)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manutenção da conciliação dos projetos")
+    parser.add_argument("comando", choices=["reconstruir", "verificar"])
+    parser.add_argument("--banco", default="estoque.db", help="Caminho do banco SQLite")
+    args = parser.parse_args(argv)
+
+    from almoxeletrico.db import get_db_connection, migrar
+
+    conn = get_db_connection(args.banco)
+    migrar(conn)
+
+    if args.comando == "reconstruir":
+        reconstruir_conciliacao(conn)
+        print("Conciliação reconstruída com sucesso!")
+        return 0
+
+    divergencias = verificar_conciliacao(conn)
+    for chave, atual, esperado in divergencias:
+        print(f"conciliacao {chave}: registrado={atual} calculado={esperado}")
+    if divergencias:
+        print(f"{len(divergencias)} divergência(s) encontrada(s).")
+        return 1
+    print("Conciliação confere com as movimentações.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,149 @@
+import logging
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from almoxeletrico.instrumentacao import ConexaoInstrumentada
+
+# Gerenciamento de conexões para vários usuários simultâneos.
+#
+# Leitura: cada thread (cada execução do script no Streamlit) usa a sua própria conexão, obtida
+# de um pool; conexões de threads encerradas voltam ao pool para reaproveitamento. Com WAL as
+# leituras não bloqueiam nem são bloqueadas pela escrita.
+#
+# Escrita: toda gravação passa por transacao(conn), que abre a transação com BEGIN IMMEDIATE
+# (reserva o lock de escrita logo no início, evitando o "database is locked" na promoção de uma
+# transação de leitura) e repete com espera exponencial enquanto outro escritor detém o lock.
+# O tempo de espera pelo lock é acumulado em estatisticas_escrita().
+
+DB_PATH = "estoque.db"
+
+TENTATIVAS_ESCRITA = 3  # além da espera do próprio busy_timeout em cada tentativa
+ESPERA_INICIAL = 0.05  # segundos; dobra a cada nova tentativa
+ESPERA_MAXIMA = 1.0
+ESPERA_LENTA = 1.0  # esperas acima disso são registradas no log
+
+logger = logging.getLogger(__name__)
+
+
+# Função para criar conexão com o banco de dados e ativar FOREIGN KEY (com cursores instrumentados)
+def get_db_connection(caminho=DB_PATH):
+    conn = sqlite3.connect(caminho, check_same_thread=False, factory=ConexaoInstrumentada)
+    c = conn.cursor()
+    c.execute("PRAGMA foreign_keys = ON;")  # Ativando suporte a FOREIGN KEY
+    c.execute("PRAGMA journal_mode = WAL;")  # Leitores não bloqueiam a escrita (e vice-versa)
+    c.execute("PRAGMA synchronous = NORMAL;")  # Seguro com WAL e evita um fsync por commit
+    c.execute("PRAGMA cache_size = -32000;")  # ~32 MB de cache de páginas por conexão
+    c.execute("PRAGMA temp_store = MEMORY;")
+    c.execute("PRAGMA busy_timeout = 5000;")
+    return conn
+
+
+_estatisticas_lock = threading.Lock()
+_estatisticas = {
+    "transacoes": 0,
+    "repeticoes": 0,
+    "falhas": 0,
+    "espera_total": 0.0,
+    "espera_maxima": 0.0,
+}
+
+
+def _registrar_espera(espera, repeticoes, falhou=False):
+    with _estatisticas_lock:
+        _estatisticas["transacoes"] += 0 if falhou else 1
+        _estatisticas["falhas"] += 1 if falhou else 0
+        _estatisticas["repeticoes"] += repeticoes
+        _estatisticas["espera_total"] += espera
+        _estatisticas["espera_maxima"] = max(_estatisticas["espera_maxima"], espera)
+    if espera > ESPERA_LENTA:
+        logger.warning("Espera de %.2fs pelo lock de escrita (%d repetições)", espera, repeticoes)
+
+
+# Função para consultar as estatísticas de espera pelo lock de escrita deste processo
+def estatisticas_escrita():
+    with _estatisticas_lock:
+        estatisticas = dict(_estatisticas)
+    estatisticas["espera_media"] = estatisticas["espera_total"] / estatisticas["transacoes"] \
+        if estatisticas["transacoes"] else 0.0
+    return estatisticas
+
+
+def _lock_ocupado(erro):
+    mensagem = str(erro).lower()
+    return "locked" in mensagem or "busy" in mensagem
+
+
+# Transação de escrita: BEGIN IMMEDIATE com novas tentativas, COMMIT no fim ou ROLLBACK em caso de erro.
+# Se a conexão já estiver numa transação, o bloco apenas participa dela.
+@contextmanager
+def transacao(conn, tentativas=TENTATIVAS_ESCRITA, espera=ESPERA_INICIAL):
+    if conn.in_transaction:
+        yield conn
+        return
+
+    inicio = time.perf_counter()
+    repeticoes = 0
+    while True:
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            break
+        except sqlite3.OperationalError as erro:
+            if not _lock_ocupado(erro) or repeticoes >= tentativas:
+                _registrar_espera(time.perf_counter() - inicio, repeticoes, falhou=True)
+                raise
+            repeticoes += 1
+            time.sleep(min(espera * 2 ** (repeticoes - 1), ESPERA_MAXIMA) * random.uniform(0.5, 1.5))
+    _registrar_espera(time.perf_counter() - inicio, repeticoes)
+
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+class PoolConexoes:
+    def __init__(self, caminho=DB_PATH, maximo_ociosas=8):
+        self.caminho = caminho
+        self.maximo_ociosas = maximo_ociosas
+        self._lock = threading.Lock()
+        self._em_uso = {}  # thread -> conexão
+        self._ociosas = []
+
+    # Conexão da thread atual (a mesma em todas as chamadas feitas pela thread)
+    def conexao(self):
+        thread = threading.current_thread()
+        with self._lock:
+            conn = self._em_uso.get(thread)
+            if conn is None:
+                self._recolher()
+                conn = self._ociosas.pop() if self._ociosas else get_db_connection(self.caminho)
+                self._em_uso[thread] = conn
+        return conn
+
+    # Devolve ao pool as conexões de threads que já terminaram
+    def _recolher(self):
+        for thread in [thread for thread in self._em_uso if not thread.is_alive()]:
+            conn = self._em_uso.pop(thread)
+            if conn.in_transaction:
+                conn.rollback()
+            if len(self._ociosas) < self.maximo_ociosas:
+                self._ociosas.append(conn)
+            else:
+                conn.close()
+
+    def tamanho(self):
+        with self._lock:
+            self._recolher()
+            return {"em_uso": len(self._em_uso), "ociosas": len(self._ociosas)}
+
+    def fechar(self):
+        with self._lock:
+            for conn in list(self._em_uso.values()) + self._ociosas:
+                conn.close()
+            self._em_uso.clear()
+            self._ociosas.clear()
@@ -0,0 +1,214 @@
+from almoxeletrico.busca import criar_indice_materiais
+from almoxeletrico.conciliacao import (SQL_TRIGGERS as SQL_TRIGGERS_CONCILIACAO, criar_tabela_conciliacao,
+                                       reconstruir_conciliacao)
+from almoxeletrico.conexoes import DB_PATH, get_db_connection, transacao
+from almoxeletrico.fechamentos import SQL_TRIGGERS as SQL_TRIGGERS_FECHAMENTOS, criar_tabelas_fechamentos
+from almoxeletrico.livro import SQL_TRIGGERS_VIEW, criar_livro
+from almoxeletrico.requisicoes import criar_tabelas_requisicoes
+from almoxeletrico.saldos import SQL_TRIGGERS as SQL_TRIGGERS_SALDOS, criar_tabelas_saldos, reconstruir_saldos
+from almoxeletrico.tarefas import criar_tabela_tarefas
+
+# get_db_connection e DB_PATH moraram aqui antes de almoxeletrico.conexoes e continuam importáveis
+# deste módulo
+__all__ = ["DB_PATH", "MIGRACOES", "get_db_connection", "migrar", "versao_esquema"]
+
+
+# Migrações do esquema. Cada posição da lista corresponde a uma versão (PRAGMA user_version):
+# a primeira migração leva o banco para a versão 1, a segunda para a versão 2 e assim por diante.
+# Todas usam IF NOT EXISTS, então podem ser reaplicadas com segurança num banco criado antes
+# do controle de versões.
+#
+# Os triggers que mantêm saldos, conciliação e fechamentos ficam no livro compacto e são criados
+# pela migração do livro, depois que a tabela movimentacoes antiga vira view.
+
+def _migracao_tabelas_base(conn):
+    c = conn.cursor()
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS materiais (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        codigo INTEGER UNIQUE,
+        descricao TEXT,
+        unidade TEXT
+    )
+    """)
+
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS movimentacoes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        codigo INTEGER,
+        descricao TEXT,
+        quantidade REAL,
+        tipo TEXT,
+        projeto TEXT,
+        equipe TEXT,
+        data_movimentacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(codigo) REFERENCES materiais(codigo)
+    )
+    """)
+
+
+def _migracao_saldos(conn):
+    criar_tabelas_saldos(conn)
+
+
+def _migracao_indices(conn):
+    c = conn.cursor()
+    # Telas de projeto (WHERE projeto = ? ... GROUP BY codigo, filtros por tipo)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_mov_projeto_codigo_tipo ON movimentacoes (projeto, codigo, tipo)")
+    # Consulta por material com intervalo de datas
+    c.execute("CREATE INDEX IF NOT EXISTS idx_mov_codigo_data ON movimentacoes (codigo, data_movimentacao)")
+    # Consulta por tipo com intervalo de datas
+    c.execute("CREATE INDEX IF NOT EXISTS idx_mov_tipo_data ON movimentacoes (tipo, data_movimentacao)")
+    # Consulta sem filtro de material/tipo (intervalo de datas e ORDER BY data)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_mov_data ON movimentacoes (data_movimentacao)")
+    c.execute("ANALYZE")
+
+
+def _migracao_importacoes(conn):
+    # Progresso das importações em lotes, por arquivo (SHA-256) e tipo de importação
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS importacoes (
+        digest TEXT NOT NULL,
+        tipo TEXT NOT NULL,
+        lotes INTEGER NOT NULL DEFAULT 0,
+        linhas_gravadas INTEGER NOT NULL DEFAULT 0,
+        concluida INTEGER NOT NULL DEFAULT 0,
+        atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (digest, tipo)
+    )
+    """)
+
+
+def _migracao_versoes(conn):
+    # Versão de tabelas de referência, usada como chave dos caches da interface
+    c = conn.cursor()
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS versoes (
+        tabela TEXT PRIMARY KEY,
+        versao INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    c.execute("INSERT OR IGNORE INTO versoes (tabela, versao) VALUES ('materiais', 0)")
+    for evento in ("INSERT", "UPDATE", "DELETE"):
+        c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_versao_materiais_{evento.lower()} AFTER {evento} ON materiais
+        BEGIN
+            UPDATE versoes SET versao = versao + 1 WHERE tabela = 'materiais';
+        END
+        """)
+
+
+def _migracao_indices_consulta(conn):
+    c = conn.cursor()
+    # Consulta de Movimentação filtrada por projeto ou equipe, ordenada por data
+    c.execute("CREATE INDEX IF NOT EXISTS idx_mov_projeto_data ON movimentacoes (projeto, data_movimentacao)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_mov_equipe_data ON movimentacoes (equipe, data_movimentacao)")
+    c.execute("ANALYZE")
+
+
+def _migracao_fechamentos(conn):
+    criar_tabelas_fechamentos(conn)
+
+
+def _migracao_busca_materiais(conn):
+    criar_indice_materiais(conn)
+
+
+def _migracao_requisicoes(conn):
+    criar_tabelas_requisicoes(conn)
+
+
+def _migracao_conciliacao(conn):
+    criar_tabela_conciliacao(conn)
+
+
+def _migracao_versao_movimentacoes(conn):
+    # Alterações e exclusões no livro invalidam o cache analítico (inclusões são exportadas pelo id)
+    c = conn.cursor()
+    c.execute("INSERT OR IGNORE INTO versoes (tabela, versao) VALUES ('movimentacoes', 0)")
+    for evento in ("UPDATE", "DELETE"):
+        c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_versao_movimentacoes_{evento.lower()} AFTER {evento} ON movimentacoes
+        BEGIN
+            UPDATE versoes SET versao = versao + 1 WHERE tabela = 'movimentacoes';
+        END
+        """)
+
+
+def _migracao_livro_compacto(conn):
+    with transacao(conn):
+        convertidas = criar_livro(conn)
+        for sql in SQL_TRIGGERS_SALDOS + SQL_TRIGGERS_CONCILIACAO + SQL_TRIGGERS_FECHAMENTOS:
+            conn.execute(sql)
+        if convertidas:
+            # Antes do livro os saldos só eram calculados na criação da tabela; a partir daqui os triggers
+            # os mantêm
+            reconstruir_saldos(conn)
+    conn.execute("ANALYZE")
+    conn.commit()
+    if convertidas:
+        conn.execute("VACUUM")  # devolve ao disco o espaço da tabela antiga
+
+
+def _migracao_tarefas(conn):
+    criar_tabela_tarefas(conn)
+
+
+def _migracao_conciliacao_estornos(conn):
+    # Devoluções e estornos passam a ser conciliados por projeto e material (a devolução não tem equipe)
+    with transacao(conn):
+        for evento in ("insert", "update", "delete"):
+            conn.execute(f"DROP TRIGGER IF EXISTS trg_conciliacao_{evento}")
+        for sql in SQL_TRIGGERS_CONCILIACAO:
+            conn.execute(sql)
+        reconstruir_conciliacao(conn)
+
+
+def _migracao_tarefas_processo(conn):
+    # Processo que reservou cada tarefa, para reconhecer as abandonadas
+    criar_tabela_tarefas(conn)
+
+
+def _migracao_view_colunas_derivadas(conn):
+    # O UPDATE na view passa a recusar alterações nas colunas derivadas, antes ignoradas
+    with transacao(conn):
+        for evento in ("insert", "update", "delete"):
+            conn.execute(f"DROP TRIGGER IF EXISTS trg_movimentacoes_{evento}")
+        for sql in SQL_TRIGGERS_VIEW:
+            conn.execute(sql)
+
+
+MIGRACOES = [
+    _migracao_tabelas_base,
+    _migracao_saldos,
+    _migracao_indices,
+    _migracao_importacoes,
+    _migracao_versoes,
+    _migracao_indices_consulta,
+    _migracao_fechamentos,
+    _migracao_busca_materiais,
+    _migracao_requisicoes,
+    _migracao_conciliacao,
+    _migracao_versao_movimentacoes,
+    _migracao_livro_compacto,
+    _migracao_tarefas,
+    _migracao_conciliacao_estornos,
+    _migracao_tarefas_processo,
+    _migracao_view_colunas_derivadas,
+]
+
+
+# Função para ler a versão atual do esquema
+def versao_esquema(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+# Função para aplicar as migrações pendentes, em ordem, registrando a versão após cada uma
+def migrar(conn, ate=None):
+    alvo = len(MIGRACOES) if ate is None else ate
+    versao = versao_esquema(conn)
+    for numero in range(versao + 1, alvo + 1):
+        MIGRACOES[numero - 1](conn)
+        conn.execute(f"PRAGMA user_version = {numero}")
+        conn.commit()
+    return versao_esquema(conn)
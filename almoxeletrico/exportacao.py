@@ -0,0 +1,161 @@
+import csv
+import importlib.util
+import itertools
+from io import BytesIO, StringIO
+
+import pandas as pd
+from xlsxwriter import Workbook
+
+# Exportação de relatórios gerada em memória (nada é gravado no diretório de trabalho).
+#
+# Resultados grandes são lidos do cursor SQLite em blocos e escritos direto no arquivo de saída,
+# sem DataFrame intermediário: XLSX com o modo constant_memory do xlsxwriter, CSV linha a linha
+# e Parquet em row groups (este último só se o pyarrow estiver instalado).
+# Uma aba do Excel comporta no máximo 1.048.576 linhas (incluindo o cabeçalho); no XLSX as linhas
+# que passam disso continuam em novas abas ("Dados", "Dados 2", ...), cada uma com o cabeçalho.
+# As telas passam essas funções como callable para st.download_button, então o arquivo só é
+# gerado quando o usuário clica em baixar.
+
+TAMANHO_BLOCO = 5000
+
+# Linhas de dados por aba do XLSX (limite do Excel menos o cabeçalho)
+LINHAS_POR_ABA = 1_048_576 - 1
+
+MIME_XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+MIME = {
+    "XLSX": MIME_XLSX,
+    "CSV": "text/csv",
+    "Parquet": "application/vnd.apache.parquet",
+}
+
+EXTENSAO = {
+    "XLSX": "xlsx",
+    "CSV": "csv",
+    "Parquet": "parquet",
+}
+
+PARQUET_DISPONIVEL = importlib.util.find_spec("pyarrow") is not None
+
+FORMATOS = ["XLSX", "CSV"] + (["Parquet"] if PARQUET_DISPONIVEL else [])
+
+
+class ErroExportacao(ValueError):
+    pass
+
+
+def _blocos(cursor, tamanho=TAMANHO_BLOCO):
+    while True:
+        linhas = cursor.fetchmany(tamanho)
+        if not linhas:
+            break
+        yield linhas
+
+
+# Nome da n-ésima aba de um XLSX dividido
+def _nome_aba(aba, numero):
+    return aba if numero == 1 else f"{aba} {numero}"
+
+
+def _xlsx(colunas, blocos, aba, linhas_por_aba=LINHAS_POR_ABA):
+    saida = BytesIO()
+    workbook = Workbook(saida, {"constant_memory": True})
+    negrito = workbook.add_format({"bold": True})
+
+    def nova_aba():
+        planilha = workbook.add_worksheet(_nome_aba(aba, len(workbook.worksheets()) + 1))
+        planilha.write_row(0, 0, colunas, negrito)
+        return planilha
+
+    planilha = nova_aba()
+    linha = 1
+    for bloco in blocos:
+        for valores in bloco:
+            if linha > linhas_por_aba:
+                planilha = nova_aba()
+                linha = 1
+            planilha.write_row(linha, 0, ["" if valor is None else valor for valor in valores])
+            linha += 1
+    workbook.close()
+    return saida.getvalue()
+
+
+def _csv(colunas, blocos):
+    saida = StringIO()
+    escritor = csv.writer(saida)
+    escritor.writerow(colunas)
+    for bloco in blocos:
+        escritor.writerows(bloco)
+    return saida.getvalue().encode("utf-8-sig")  # BOM para o Excel reconhecer os acentos
+
+
+# Tipo de cada coluna a partir do primeiro valor não nulo do bloco (texto se a coluna estiver vazia)
+def _inferir_tipos(bloco, quantidade):
+    tipos = []
+    for coluna in range(quantidade):
+        valor = next((linha[coluna] for linha in bloco if linha[coluna] is not None), "")
+        tipos.append(type(valor) if type(valor) in (int, float) else str)
+    return tipos
+
+
+def _parquet(colunas, blocos, tipos):
+    if not PARQUET_DISPONIVEL:
+        raise ErroExportacao("Exportação em Parquet requer o pacote pyarrow.")
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    blocos = iter(blocos)
+    primeiro = next(blocos, [])
+    tipos = tipos or _inferir_tipos(primeiro, len(colunas))
+    tipos_arrow = {int: pa.int64(), float: pa.float64(), str: pa.string()}
+    esquema = pa.schema([(coluna, tipos_arrow[tipo]) for coluna, tipo in zip(colunas, tipos)])
+    saida = BytesIO()
+    with pq.ParquetWriter(saida, esquema) as escritor:
+        for bloco in itertools.chain([primeiro] if primeiro else [], blocos):
+            valores = list(zip(*bloco))
+            escritor.write_batch(pa.record_batch(
+                [pa.array(coluna, type=campo.type) for coluna, campo in zip(valores, esquema)], schema=esquema))
+    return saida.getvalue()
+
+
+def _gerar(formato, colunas, blocos, aba, tipos):
+    if formato == "XLSX":
+        return _xlsx(colunas, blocos, aba)
+    if formato == "CSV":
+        return _csv(colunas, blocos)
+    if formato == "Parquet":
+        return _parquet(colunas, blocos, tipos)
+    raise ErroExportacao(f"Formato de exportação desconhecido: {formato}")
+
+
+# Função para exportar o resultado de uma consulta direto do cursor.
+# tipos (int, float ou str por coluna) define o esquema do Parquet; se omitido, é inferido
+# a partir do primeiro bloco de linhas.
+def exportar_consulta(conn, sql, params, colunas, formato, aba="Dados", tipos=None):
+    c = conn.cursor()
+    c.execute(sql, params)
+    return _gerar(formato, colunas, _blocos(c), aba, tipos)
+
+
+# Função para exportar um DataFrame já calculado (relatórios pequenos, agregados)
+def exportar_dataframe(df, formato, aba="Dados"):
+    if formato == "XLSX":
+        return planilha_xlsx(df, aba)
+    if formato == "CSV":
+        return df.to_csv(index=False).encode("utf-8-sig")
+    if formato == "Parquet":
+        if not PARQUET_DISPONIVEL:
+            raise ErroExportacao("Exportação em Parquet requer o pacote pyarrow.")
+        saida = BytesIO()
+        df.to_parquet(saida, index=False)
+        return saida.getvalue()
+    raise ErroExportacao(f"Formato de exportação desconhecido: {formato}")
+
+
+# Função para gerar um XLSX em memória a partir de um DataFrame (dividido em abas acima do limite do Excel)
+def planilha_xlsx(df, aba, linhas_por_aba=LINHAS_POR_ABA):
+    saida = BytesIO()
+    with pd.ExcelWriter(saida, engine="xlsxwriter") as writer:
+        for numero, inicio in enumerate(range(0, max(len(df), 1), linhas_por_aba), start=1):
+            df.iloc[inicio:inicio + linhas_por_aba].to_excel(writer, index=False, sheet_name=_nome_aba(aba, numero))
+    return saida.getvalue()
@@ -0,0 +1,287 @@
+import argparse
+from datetime import timedelta
+
+import pandas as pd
+
+from almoxeletrico.conexoes import transacao
+from almoxeletrico.livro import epoch
+from almoxeletrico.saldos import SQL_SOMA_TIPOS, tabela_estoque
+
+# Fechamentos mensais: fotografias dos saldos acumulados no fim de cada mês.
+#
+# fechamentos              -> meses fechados ('AAAA-MM') e o início do mês seguinte (fim)
+# saldos_mensais           -> saldo acumulado por material e tipo no fim de cada mês fechado (todos os materiais)
+# saldos_mensais_projeto   -> saldo acumulado por projeto, material e tipo, gravado apenas nos meses em
+#                             que o projeto teve movimentação (o valor vale até o próximo registro)
+#
+# A posição numa data D é o último fechamento até D mais as movimentações posteriores a ele, então
+# o custo da consulta fica limitado a um mês de movimentações, seja qual for o tamanho do livro.
+# Os meses são fechados em ordem por fechar_meses() (tela Posição Histórica ou
+# "python -m almoxeletrico.fechamentos fechar"). Movimentações gravadas, alteradas ou excluídas com
+# data num mês já fechado reabrem, por trigger, esse mês e os seguintes.
+
+SQL_TABELAS = [
+    """
+    CREATE TABLE IF NOT EXISTS fechamentos (
+        mes TEXT PRIMARY KEY,
+        fim TEXT NOT NULL,
+        movimentacoes INTEGER NOT NULL DEFAULT 0,
+        fechado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS saldos_mensais (
+        mes TEXT NOT NULL,
+        codigo INTEGER NOT NULL,
+        tipo TEXT NOT NULL,
+        quantidade REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (mes, codigo, tipo)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS saldos_mensais_projeto (
+        projeto TEXT NOT NULL,
+        codigo INTEGER NOT NULL,
+        tipo TEXT NOT NULL,
+        mes TEXT NOT NULL,
+        quantidade REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (projeto, codigo, tipo, mes)
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_saldos_mensais_projeto_mes ON saldos_mensais_projeto (mes)",
+]
+
+
+# Monta o corpo do trigger que reabre os meses fechados a partir da data informada
+def _sql_reabrir(data):
+    return f"""
+        DELETE FROM saldos_mensais WHERE mes IN (SELECT mes FROM fechamentos WHERE fim > {data});
+        DELETE FROM saldos_mensais_projeto WHERE mes IN (SELECT mes FROM fechamentos WHERE fim > {data});
+        DELETE FROM fechamentos WHERE fim > {data};
+    """
+
+
+# Data (texto, como fechamentos.fim) de uma movimentação NEW/OLD do livro
+def _sql_data(ref):
+    return f"datetime({ref}.data, 'unixepoch')"
+
+
+SQL_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_fechamentos_insert AFTER INSERT ON livro
+    WHEN {_sql_data("NEW")} < (SELECT MAX(fim) FROM fechamentos)
+    BEGIN
+        {_sql_reabrir(_sql_data("NEW"))}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_fechamentos_delete AFTER DELETE ON livro
+    WHEN {_sql_data("OLD")} < (SELECT MAX(fim) FROM fechamentos)
+    BEGIN
+        {_sql_reabrir(_sql_data("OLD"))}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_fechamentos_update
+    AFTER UPDATE OF codigo, quantidade, tipo_id, projeto_id, data ON livro
+    WHEN MIN({_sql_data("OLD")}, {_sql_data("NEW")}) < (SELECT MAX(fim) FROM fechamentos)
+    BEGIN
+        {_sql_reabrir(f"MIN({_sql_data('OLD')}, {_sql_data('NEW')})")}
+    END
+    """,
+]
+
+
+# Função para criar as tabelas de fechamento (os triggers de reabertura são criados junto com o livro)
+def criar_tabelas_fechamentos(conn):
+    c = conn.cursor()
+    for sql in SQL_TABELAS:
+        c.execute(sql)
+    conn.commit()
+
+
+def _proximo_mes(mes):
+    ano, numero = int(mes[:4]), int(mes[5:7])
+    return f"{ano + numero // 12}-{numero % 12 + 1:02d}"
+
+
+def _inicio(mes):
+    return f"{mes}-01"
+
+
+def _primeiro_mes(conn):
+    c = conn.cursor()
+    c.execute("SELECT datetime(MIN(data), 'unixepoch') FROM livro")
+    primeira = c.fetchone()[0]
+    return str(primeira)[:7] if primeira else None
+
+
+# Meses ainda não fechados, do primeiro com movimentação (ou seguinte ao último fechado) até o
+# mês anterior ao atual, ou até o mês informado em ate ('AAAA-MM'), se for anterior
+def meses_a_fechar(conn, ate=None):
+    c = conn.cursor()
+    c.execute("SELECT MAX(mes) FROM fechamentos")
+    ultimo = c.fetchone()[0]
+    mes = _proximo_mes(ultimo) if ultimo else _primeiro_mes(conn)
+    if mes is None:
+        return []
+
+    c.execute("SELECT strftime('%Y-%m', 'now', 'start of month', '-1 month')")
+    limite = c.fetchone()[0]
+    if ate and ate < limite:
+        limite = ate
+
+    meses = []
+    while mes <= limite:
+        meses.append(mes)
+        mes = _proximo_mes(mes)
+    return meses
+
+
+# Fecha um mês a partir do fechamento do mês anterior; retorna False se o mês não for mais o
+# próximo a fechar (outro processo fechou ou reabriu meses enquanto este esperava o lock)
+def _fechar_mes(conn, mes):
+    inicio, fim = _inicio(mes), _inicio(_proximo_mes(mes))
+    periodo = (epoch(inicio), epoch(fim))
+    with transacao(conn):
+        c = conn.cursor()
+        c.execute("SELECT MAX(mes) FROM fechamentos")
+        ultimo = c.fetchone()[0]
+        proximo = _proximo_mes(ultimo) if ultimo else _primeiro_mes(conn)
+        if mes != proximo:
+            return False
+
+        c.execute("""
+            INSERT INTO fechamentos (mes, fim, movimentacoes)
+            VALUES (?, ?, (SELECT COUNT(*) FROM livro WHERE data >= ? AND data < ?))
+        """, (mes, fim) + periodo)
+
+        # Saldo acumulado de todos os materiais = fechamento anterior + movimentações do mês
+        c.execute("""
+            INSERT INTO saldos_mensais (mes, codigo, tipo, quantidade)
+            SELECT ?, codigo, tipo, SUM(quantidade)
+            FROM (
+                SELECT codigo, tipo, quantidade FROM saldos_mensais WHERE mes = ?
+                UNION ALL
+                SELECT codigo, tipo, COALESCE(quantidade, 0) FROM movimentacoes
+                WHERE data >= ? AND data < ? AND codigo IS NOT NULL AND tipo IS NOT NULL
+            )
+            GROUP BY codigo, tipo
+        """, (mes, ultimo) + periodo)
+
+        # Saldo acumulado por projeto, só para os projetos movimentados no mês
+        c.execute("""
+            INSERT INTO saldos_mensais_projeto (projeto, codigo, tipo, mes, quantidade)
+            SELECT d.projeto, d.codigo, d.tipo, ?, d.quantidade + COALESCE((
+                SELECT s.quantidade FROM saldos_mensais_projeto s
+                WHERE s.projeto = d.projeto AND s.codigo = d.codigo AND s.tipo = d.tipo AND s.mes < ?
+                ORDER BY s.mes DESC LIMIT 1
+            ), 0)
+            FROM (
+                SELECT projeto, codigo, tipo, SUM(COALESCE(quantidade, 0)) AS quantidade
+                FROM movimentacoes
+                WHERE data >= ? AND data < ? AND projeto IS NOT NULL AND codigo IS NOT NULL AND tipo IS NOT NULL
+                GROUP BY projeto, codigo, tipo
+            ) d
+        """, (mes, mes) + periodo)
+    return True
+
+
+# Função para fechar, em ordem e cada um na sua transação, os meses pendentes. Retorna os meses fechados.
+def fechar_meses(conn, ate=None, ao_progredir=None):
+    meses = meses_a_fechar(conn, ate)
+    fechados = []
+    for mes in meses:
+        if not _fechar_mes(conn, mes):
+            break
+        fechados.append(mes)
+        if ao_progredir:
+            ao_progredir(len(fechados), len(meses))
+    return fechados
+
+
+# Função para listar os meses fechados (mais recentes primeiro)
+def listar_fechamentos(conn):
+    c = conn.cursor()
+    c.execute("SELECT mes, movimentacoes, fechado_em FROM fechamentos ORDER BY mes DESC")
+    return pd.DataFrame(c.fetchall(), columns=["Mês", "Movimentações", "Fechado em"])
+
+
+# Função para calcular a posição do estoque no fim do dia informado: último fechamento até a data
+# mais as movimentações posteriores a ele. Com projeto, considera só as movimentações do projeto.
+# Retorna (DataFrame no formato da Visão Geral do Estoque, mês do fechamento usado ou None).
+def posicao_historica(conn, data, codigo=None, projeto=None):
+    fim = (data + timedelta(days=1)).isoformat()
+    c = conn.cursor()
+    c.execute("SELECT mes, fim FROM fechamentos WHERE fim <= ? ORDER BY mes DESC LIMIT 1", (fim,))
+    base = c.fetchone()
+    mes, inicio = base if base else (None, "")
+
+    filtro_codigo = " AND codigo = ?" if codigo is not None else ""
+    params_codigo = [codigo] if codigo is not None else []
+
+    if projeto:
+        fotografia = f"""
+            SELECT p.codigo, p.tipo, p.quantidade FROM saldos_mensais_projeto p
+            WHERE p.projeto = ?{filtro_codigo.replace("codigo", "p.codigo")} AND p.mes = (
+                SELECT MAX(mes) FROM saldos_mensais_projeto
+                WHERE projeto = p.projeto AND codigo = p.codigo AND tipo = p.tipo AND mes <= ?
+            )
+        """
+        params = [projeto] + params_codigo + [mes]
+        delta = "projeto = ? AND "
+        params_delta = [projeto]
+        juncao = "JOIN s ON m.codigo = s.codigo"
+    else:
+        fotografia = f"SELECT codigo, tipo, quantidade FROM saldos_mensais WHERE mes = ?{filtro_codigo}"
+        params = [mes] + params_codigo
+        delta = ""
+        params_delta = []
+        juncao = "LEFT JOIN s ON m.codigo = s.codigo"
+
+    query = f"""
+        WITH s AS (
+            SELECT codigo, tipo, SUM(quantidade) AS quantidade
+            FROM (
+                {fotografia}
+                UNION ALL
+                SELECT codigo, tipo, COALESCE(quantidade, 0) FROM movimentacoes
+                WHERE {delta}data >= ? AND data < ?{filtro_codigo}
+            )
+            GROUP BY codigo, tipo
+        )
+        SELECT m.codigo,
+               m.descricao,{SQL_SOMA_TIPOS}
+        FROM materiais m
+        {juncao}
+        {"WHERE m.codigo = ?" if codigo is not None else ""}
+        GROUP BY m.codigo, m.descricao
+    """
+    params += params_delta + [epoch(inicio) if inicio else 0, epoch(fim)] + params_codigo + params_codigo
+    c.execute(query, params)
+    return tabela_estoque(c.fetchall()), mes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fechamentos mensais dos saldos de estoque")
+    parser.add_argument("comando", choices=["fechar", "listar"])
+    parser.add_argument("--ate", help="Último mês a fechar (AAAA-MM); padrão: mês anterior ao atual")
+    parser.add_argument("--banco", default="estoque.db", help="Caminho do banco SQLite")
+    args = parser.parse_args(argv)
+
+    from almoxeletrico.db import get_db_connection, migrar
+
+    conn = get_db_connection(args.banco)
+    migrar(conn)
+
+    if args.comando == "fechar":
+        fechados = fechar_meses(conn, args.ate)
+        print(f"{len(fechados)} mês(es) fechado(s)" + (f": {fechados[0]} a {fechados[-1]}." if fechados else "."))
+        return 0
+
+    print(listar_fechamentos(conn).to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,285 @@
+from collections import namedtuple
+from functools import partial
+
+import pandas as pd
+
+from almoxeletrico.conexoes import transacao
+from almoxeletrico.leitura import TAMANHO_LOTE, ErroPlanilha, digest_arquivo, ler_planilha_em_lotes
+
+# Motor de importação em lote usado pelas telas de upload de planilhas.
+#
+# A planilha é normalizada e validada com operações vetorizadas do pandas, as descrições
+# (e os saldos, no inventário) são resolvidas com um único join contra o banco e a gravação
+# é feita com executemany numa única transação. As linhas recusadas voltam num DataFrame
+# com a coluna "motivo", para o usuário baixar e corrigir.
+#
+# Planilhas grandes passam por importar_em_lotes: cada lote é gravado (e registrado na tabela
+# importacoes) numa transação própria, então uma importação interrompida recomeça do primeiro
+# lote ainda não gravado quando o mesmo arquivo é enviado de novo. O registro do lote só é aceito
+# se for o próximo da planilha: com duas importações do mesmo arquivo ao mesmo tempo (tela e linha
+# de comando, por exemplo), a que chegar depois desfaz a gravação do lote e passa ao seguinte.
+
+ResultadoImportacao = namedtuple("ResultadoImportacao", ["gravadas", "rejeitadas", "ja_importada"],
+                                 defaults=[False])
+
+COLUNAS_MATERIAIS = ["codigo", "descricao", "unidade"]
+COLUNAS_ENTRADA = ["codigo", "quantidade"]
+COLUNAS_SAIDA = ["codigo", "quantidade", "projeto", "equipe"]
+COLUNAS_INVENTARIO = ["codigo", "quantidade"]
+
+# Tipos de movimentação importáveis e as colunas obrigatórias de cada um
+COLUNAS_POR_TIPO = {
+    "entrada": COLUNAS_ENTRADA,
+    "saída": COLUNAS_SAIDA,
+    "baixa_eqtl": COLUNAS_SAIDA,
+}
+
+
+# Função para padronizar os nomes das colunas e conferir as obrigatórias
+def _normalizar_colunas(df, obrigatorias):
+    df = df.rename(columns=lambda coluna: str(coluna).strip().lower())
+    faltando = [coluna for coluna in obrigatorias if coluna not in df.columns]
+    if faltando:
+        raise ErroPlanilha("A planilha deve conter as colunas: " + ", ".join(f"'{c}'" for c in obrigatorias) + ".")
+    return df
+
+
+# Converte uma coluna para texto sem espaços; números inteiros lidos como float (ex.: 123.0) viram "123"
+def _texto(serie):
+    texto = serie.astype("string").str.strip().fillna("")
+    return texto.str.replace(r"^(-?\d+)\.0+$", r"\1", regex=True)
+
+
+def _numero(serie):
+    return pd.to_numeric(serie, errors="coerce")
+
+
+# Separa as linhas inválidas (mascara verdadeira), anotando o motivo
+def _separar(df, mascara, motivo, rejeitadas):
+    mascara = mascara.fillna(True).astype(bool)
+    if mascara.any():
+        rejeitadas.append(pd.Series(motivo, index=df.index[mascara]))
+    return df.loc[~mascara]
+
+
+def _validar_codigo(df, rejeitadas):
+    codigo = _numero(df["codigo"])
+    df = _separar(df, codigo.isna() | (codigo % 1 != 0), "Código inválido", rejeitadas)
+    df = df.assign(codigo=codigo.loc[df.index].astype("int64"))
+    return df
+
+
+# Função para buscar, com uma única consulta, a descrição e o saldo dos códigos da planilha
+def _dados_materiais(conn, codigos):
+    c = conn.cursor()
+    c.execute("CREATE TEMP TABLE IF NOT EXISTS importacao_codigos (codigo INTEGER PRIMARY KEY)")
+    c.execute("DELETE FROM importacao_codigos")
+    c.executemany("INSERT OR IGNORE INTO importacao_codigos (codigo) VALUES (?)", [(int(x),) for x in codigos])
+    c.execute("""
+        SELECT m.codigo, m.descricao, COALESCE(s.quantidade, 0)
+        FROM importacao_codigos i
+        JOIN materiais m ON m.codigo = i.codigo
+        LEFT JOIN saldos s ON s.codigo = m.codigo
+    """)
+    dados = pd.DataFrame(c.fetchall(), columns=["codigo", "descricao_cadastro", "saldo_atual"])
+    c.execute("DELETE FROM importacao_codigos")
+    return dados.astype({"codigo": "int64", "saldo_atual": "float64"})
+
+
+# Junta os dados do cadastro de materiais, recusando códigos não cadastrados
+def _resolver_materiais(conn, df, rejeitadas):
+    dados = _dados_materiais(conn, df["codigo"].unique()).set_index("codigo")
+    df = df.assign(descricao_cadastro=df["codigo"].map(dados["descricao_cadastro"]),
+                   saldo_atual=df["codigo"].map(dados["saldo_atual"]))
+    return _separar(df, df["descricao_cadastro"].isna(), "Código não cadastrado em materiais", rejeitadas)
+
+
+def _linhas(df, colunas):
+    return list(zip(*(df[coluna].tolist() for coluna in colunas)))
+
+
+# Função para importar o cadastro de materiais (códigos já cadastrados são ignorados).
+# Nas funções de importação, registrar(conn, gravadas) é executada na mesma transação da gravação.
+def importar_materiais(conn, df, registrar=None):
+    df = _normalizar_colunas(df, COLUNAS_MATERIAIS)
+    original = df.copy()
+    rejeitadas = []
+
+    df = _validar_codigo(df, rejeitadas)
+    df = df.assign(descricao=_texto(df["descricao"]), unidade=_texto(df["unidade"]))
+    df = _separar(df, df["descricao"] == "", "Descrição vazia", rejeitadas)
+    df = _separar(df, df["codigo"].duplicated(), "Código repetido na planilha", rejeitadas)
+
+    with transacao(conn):
+        # rowcount conta só as linhas inseridas (total_changes somaria as alteradas pelos triggers)
+        c = conn.cursor()
+        c.executemany("INSERT OR IGNORE INTO materiais (codigo, descricao, unidade) VALUES (?, ?, ?)",
+                      _linhas(df, ["codigo", "descricao", "unidade"]))
+        gravadas = c.rowcount
+        if registrar:
+            registrar(conn, gravadas)
+
+    return ResultadoImportacao(gravadas, _rejeitadas_originais(original, rejeitadas))
+
+
+# Função para importar movimentações de entrada, saída ou baixa EQTL
+def importar_movimentacoes(conn, df, tipo, registrar=None):
+    colunas = COLUNAS_POR_TIPO[tipo]
+    df = _normalizar_colunas(df, colunas)
+    original = df.copy()
+    rejeitadas = []
+
+    df = _validar_codigo(df, rejeitadas)
+    df = df.assign(quantidade=_numero(df["quantidade"]))
+    df = _separar(df, ~(df["quantidade"] > 0), "Quantidade deve ser maior que zero", rejeitadas)
+
+    if "projeto" in colunas:
+        df = df.assign(projeto=_texto(df["projeto"]), equipe=_texto(df["equipe"]))
+        df = _separar(df, df["projeto"] == "", "Projeto não informado", rejeitadas)
+        df = _separar(df, df["equipe"] == "", "Equipe não informada", rejeitadas)
+    else:
+        df = df.assign(projeto=None, equipe=None)
+
+    with transacao(conn):
+        df = _resolver_materiais(conn, df, rejeitadas)
+        conn.executemany("""
+            INSERT INTO movimentacoes (codigo, descricao, quantidade, tipo, projeto, equipe)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [(codigo, descricao, quantidade, tipo, projeto, equipe) for codigo, descricao, quantidade, projeto, equipe
+              in _linhas(df, ["codigo", "descricao_cadastro", "quantidade", "projeto", "equipe"])])
+        if registrar:
+            registrar(conn, len(df))
+
+    return ResultadoImportacao(len(df), _rejeitadas_originais(original, rejeitadas))
+
+
+# Função para importar o inventário: cada código recebe um ajuste igual à diferença entre a
+# quantidade contada (última linha do código na planilha) e o saldo atual
+def importar_inventario(conn, df, registrar=None):
+    df = _normalizar_colunas(df, COLUNAS_INVENTARIO)
+    original = df.copy()
+    rejeitadas = []
+
+    df = _validar_codigo(df, rejeitadas)
+    df = df.assign(quantidade=_numero(df["quantidade"]))
+    df = _separar(df, ~(df["quantidade"] >= 0), "Quantidade inválida", rejeitadas)
+    df = df.drop_duplicates("codigo", keep="last")
+
+    # Saldos lidos e ajustes gravados na mesma transação de escrita
+    with transacao(conn):
+        df = _resolver_materiais(conn, df, rejeitadas)
+        df = df.assign(ajuste=df["quantidade"] - df["saldo_atual"])
+        df = df.loc[df["ajuste"] != 0]
+        conn.executemany("""
+            INSERT INTO movimentacoes (codigo, descricao, quantidade, tipo, projeto, equipe)
+            VALUES (?, ?, ?, 'ajuste_inventario', NULL, NULL)
+        """, _linhas(df, ["codigo", "descricao_cadastro", "ajuste"]))
+        if registrar:
+            registrar(conn, len(df))
+
+    return ResultadoImportacao(len(df), _rejeitadas_originais(original, rejeitadas))
+
+
+# Devolve as linhas recusadas com os valores originais da planilha (antes da normalização)
+def _rejeitadas_originais(original, rejeitadas):
+    if not rejeitadas:
+        return original.iloc[0:0].assign(motivo=pd.Series(dtype="object"))
+    motivos = pd.concat(rejeitadas).sort_index()
+    return original.loc[motivos.index].assign(motivo=motivos)
+
+
+# Função para gerar o CSV das linhas recusadas (para st.download_button)
+def rejeitadas_csv(rejeitadas):
+    return rejeitadas.to_csv(index=False).encode("utf-8-sig")
+
+
+# Importações disponíveis para importar_em_lotes
+IMPORTADORES = {
+    "materiais": importar_materiais,
+    "entrada": partial(importar_movimentacoes, tipo="entrada"),
+    "saída": partial(importar_movimentacoes, tipo="saída"),
+    "baixa_eqtl": partial(importar_movimentacoes, tipo="baixa_eqtl"),
+    "inventario": importar_inventario,
+}
+
+
+def _progresso(conn, digest, tipo):
+    c = conn.cursor()
+    c.execute("SELECT lotes, linhas_gravadas, concluida FROM importacoes WHERE digest = ? AND tipo = ?",
+              (digest, tipo))
+    return c.fetchone() or (0, 0, 0)
+
+
+# Lote já gravado por outra importação do mesmo arquivo; a exceção desfaz a transação do lote
+class LoteJaGravado(Exception):
+    pass
+
+
+def _registrar_lote(digest, tipo, lote):
+    def registrar(conn, gravadas):
+        c = conn.cursor()
+        c.execute("""
+            INSERT INTO importacoes (digest, tipo, lotes, linhas_gravadas)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(digest, tipo) DO UPDATE SET
+                lotes = excluded.lotes,
+                linhas_gravadas = linhas_gravadas + excluded.linhas_gravadas,
+                atualizado_em = CURRENT_TIMESTAMP
+            WHERE importacoes.lotes = excluded.lotes - 1 AND NOT importacoes.concluida
+        """, (digest, tipo, lote, gravadas))
+        if c.rowcount != 1:
+            raise LoteJaGravado(lote)
+    return registrar
+
+
+# Função para saber se a planilha (pelo digest) já foi importada por completo com o tipo informado
+def importacao_concluida(conn, digest, tipo):
+    return bool(_progresso(conn, digest, tipo)[2])
+
+
+# Função para gravar os lotes de uma planilha identificada pelo digest. ler() retorna
+# (total_estimado, lotes) e só é chamada se a planilha ainda não foi concluída; lotes já gravados
+# numa tentativa anterior são pulados. ao_progredir(linhas_lidas, total_estimado) é chamada após cada lote.
+def gravar_lotes(conn, digest, tipo, ler, ao_progredir=None):
+    importar = IMPORTADORES[tipo]
+    lotes_gravados, gravadas, concluida = _progresso(conn, digest, tipo)
+    if concluida:
+        return ResultadoImportacao(gravadas, _rejeitadas_originais(pd.DataFrame(), []), ja_importada=True)
+
+    total, lotes = ler()
+    rejeitadas, lidas = [], 0
+    try:
+        for numero, lote in enumerate(lotes, start=1):
+            lidas += len(lote)
+            if numero > lotes_gravados:
+                try:
+                    resultado = importar(conn, lote, registrar=_registrar_lote(digest, tipo, numero))
+                except LoteJaGravado:
+                    resultado = None
+                if resultado is not None:
+                    gravadas += resultado.gravadas
+                    if len(resultado.rejeitadas):
+                        rejeitadas.append(resultado.rejeitadas)
+            if ao_progredir:
+                ao_progredir(lidas, total)
+    finally:
+        # Encerra a leitura (e o arquivo aberto por ela) mesmo se um lote falhar
+        if hasattr(lotes, "close"):
+            lotes.close()
+
+    with transacao(conn):
+        conn.execute("""
+            INSERT INTO importacoes (digest, tipo, concluida) VALUES (?, ?, 1)
+            ON CONFLICT(digest, tipo) DO UPDATE SET concluida = 1, atualizado_em = CURRENT_TIMESTAMP
+        """, (digest, tipo))
+
+    rejeitadas = pd.concat(rejeitadas) if rejeitadas else _rejeitadas_originais(pd.DataFrame(), [])
+    return ResultadoImportacao(gravadas, rejeitadas)
+
+
+# Função para importar uma planilha enviada em lotes de tamanho fixo. Lotes já gravados numa
+# tentativa anterior do mesmo arquivo são pulados; uma planilha já concluída não é reaplicada.
+# ao_progredir(linhas_lidas, total_estimado) é chamada após cada lote.
+def importar_em_lotes(conn, arquivo, tipo, tamanho_lote=TAMANHO_LOTE, ao_progredir=None):
+    return gravar_lotes(conn, digest_arquivo(arquivo), tipo, lambda: ler_planilha_em_lotes(arquivo, tamanho_lote),
+                        ao_progredir)
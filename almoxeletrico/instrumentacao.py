@@ -0,0 +1,279 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+
+# Instrumentação das consultas e das execuções das telas.
+#
+# As conexões criadas por get_db_connection usam ConexaoInstrumentada, cujos cursores medem o
+# tempo de cada comando (execute + leitura das linhas) e contam as linhas lidas ou alteradas.
+# Comandos acima de CONSULTA_LENTA são registrados com o EXPLAIN QUERY PLAN. Cada execução do
+# script é medida por iniciar_tela()/concluir_tela(), que também atribui as consultas à tela.
+#
+# As métricas ficam na memória do processo (painel "Desempenho") e, se ALMOXELETRICO_METRICAS
+# apontar para um arquivo, são exportadas: "*.prom" recebe o formato texto do Prometheus
+# (reescrito a cada INTERVALO_PROMETHEUS segundos, para o textfile collector do node_exporter);
+# qualquer outro nome recebe uma linha JSON por execução de tela e por consulta lenta.
+
+CONSULTA_LENTA = float(os.environ.get("ALMOXELETRICO_CONSULTA_LENTA_MS", 200)) / 1000  # segundos
+TELA_LENTA = 2.0  # segundos
+AMOSTRAS_TELA = 200  # durações guardadas por tela para os percentis
+MAXIMO_LENTAS = 50
+INTERVALO_PROMETHEUS = 10  # segundos
+
+logger = logging.getLogger(__name__)
+
+_contexto = threading.local()
+
+
+# Normaliza o SQL para agrupar execuções do mesmo comando (listas IN (?, ?, ...) viram IN (?, ...))
+def _normalizar(sql):
+    sql = " ".join(sql.split())
+    return re.sub(r"\(\?(?:\s*,\s*\?)+\)", "(?, ...)", sql)
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(p / 100 * len(ordenados)))] if ordenados else 0.0
+
+
+class Metricas:
+    def __init__(self, arquivo=None):
+        self.arquivo = arquivo
+        self._lock = threading.Lock()
+        self._ultima_exportacao = 0.0
+        self.zerar()
+
+    def zerar(self):
+        with self._lock:
+            self.consultas = {}  # sql normalizado -> {execucoes, total, maximo, linhas}
+            self.telas = {}  # tela -> {execucoes, total, maximo, consultas, amostras}
+            self.lentas = deque(maxlen=MAXIMO_LENTAS)
+            self._planos = {}
+
+    def registrar_consulta(self, sql, duracao, linhas, nova_execucao):
+        with self._lock:
+            consulta = self.consultas.setdefault(sql, {"execucoes": 0, "total": 0.0, "maximo": 0.0, "linhas": 0})
+            consulta["execucoes"] += 1 if nova_execucao else 0
+            consulta["total"] += duracao
+            consulta["linhas"] += linhas
+
+    def fechar_execucao(self, sql, duracao):
+        with self._lock:
+            consulta = self.consultas.get(sql)
+            if consulta:
+                consulta["maximo"] = max(consulta["maximo"], duracao)
+
+    def registrar_lenta(self, sql, duracao, linhas, plano_de):
+        with self._lock:
+            plano = self._planos.get(sql)
+        if plano is None:
+            plano = plano_de()
+            with self._lock:
+                self._planos[sql] = plano
+        lenta = {"quando": time.time(), "tela": tela_atual(), "sql": sql, "duracao": duracao,
+                 "linhas": linhas, "plano": plano}
+        with self._lock:
+            self.lentas.append(lenta)
+        logger.warning("Consulta lenta (%.0f ms, %d linhas) na tela %s: %s", duracao * 1000, linhas,
+                       lenta["tela"], sql)
+        self._exportar_linha({"evento": "consulta_lenta", **lenta})
+
+    def registrar_tela(self, tela, duracao, consultas, tempo_consultas):
+        with self._lock:
+            registro = self.telas.setdefault(tela, {"execucoes": 0, "total": 0.0, "maximo": 0.0, "consultas": 0,
+                                                    "amostras": deque(maxlen=AMOSTRAS_TELA)})
+            registro["execucoes"] += 1
+            registro["total"] += duracao
+            registro["maximo"] = max(registro["maximo"], duracao)
+            registro["consultas"] += consultas
+            registro["amostras"].append(duracao)
+        if duracao > TELA_LENTA:
+            logger.warning("Tela %s levou %.2fs (%d consultas, %.2fs no banco)", tela, duracao, consultas,
+                           tempo_consultas)
+        self._exportar_linha({"evento": "tela", "quando": time.time(), "tela": tela, "duracao": duracao,
+                              "consultas": consultas, "tempo_consultas": tempo_consultas})
+        self._exportar_prometheus()
+
+    # Resumo por tela: lista de dicts ordenada pela maior média
+    def resumo_telas(self):
+        with self._lock:
+            telas = [{"tela": tela, "execucoes": r["execucoes"], "media": r["total"] / r["execucoes"],
+                      "p95": _percentil(r["amostras"], 95), "maximo": r["maximo"],
+                      "consultas": r["consultas"] / r["execucoes"]}
+                     for tela, r in self.telas.items()]
+        return sorted(telas, key=lambda tela: tela["media"], reverse=True)
+
+    # Resumo por comando SQL: lista de dicts ordenada pelo maior tempo total
+    def resumo_consultas(self, limite=20):
+        with self._lock:
+            consultas = [{"sql": sql, "execucoes": r["execucoes"], "total": r["total"],
+                          "media": r["total"] / max(r["execucoes"], 1), "maximo": r["maximo"], "linhas": r["linhas"]}
+                         for sql, r in self.consultas.items()]
+        return sorted(consultas, key=lambda consulta: consulta["total"], reverse=True)[:limite]
+
+    def consultas_lentas(self):
+        with self._lock:
+            return list(reversed(self.lentas))
+
+    def _exportar_linha(self, registro):
+        if not self.arquivo or self.arquivo.endswith(".prom"):
+            return
+        try:
+            with open(self.arquivo, "a", encoding="utf-8") as arquivo:
+                arquivo.write(json.dumps(registro, ensure_ascii=False, default=str) + "\n")
+        except OSError as erro:
+            logger.warning("Não foi possível gravar as métricas em %s: %s", self.arquivo, erro)
+
+    def _exportar_prometheus(self):
+        if not self.arquivo or not self.arquivo.endswith(".prom"):
+            return
+        agora = time.monotonic()
+        if agora - self._ultima_exportacao < INTERVALO_PROMETHEUS:
+            return
+        self._ultima_exportacao = agora
+
+        telas = self.resumo_telas()
+        with self._lock:
+            execucoes = sum(r["execucoes"] for r in self.consultas.values())
+            total = sum(r["total"] for r in self.consultas.values())
+            lentas = len(self.lentas)
+
+        # Cada família: linha TYPE seguida de todas as suas amostras
+        familias = [
+            ("almoxeletrico_tela_execucoes_total", "counter", [(t["tela"], t["execucoes"]) for t in telas]),
+            ("almoxeletrico_tela_segundos_total", "counter", [(t["tela"], t["media"] * t["execucoes"]) for t in telas]),
+            ("almoxeletrico_tela_segundos_p95", "gauge", [(t["tela"], t["p95"]) for t in telas]),
+            ("almoxeletrico_consulta_execucoes_total", "counter", [(None, execucoes)]),
+            ("almoxeletrico_consulta_segundos_total", "counter", [(None, total)]),
+            ("almoxeletrico_consultas_lentas", "gauge", [(None, lentas)]),
+        ]
+        linhas = []
+        for nome, tipo, amostras in familias:
+            linhas.append(f"# TYPE {nome} {tipo}")
+            for tela, valor in amostras:
+                rotulo = "" if tela is None else '{tela="%s"}' % tela.replace("\\", "\\\\").replace('"', '\\"')
+                linhas.append(f"{nome}{rotulo} {valor}")
+
+        # Grava num arquivo temporário e renomeia, para o coletor nunca ler um arquivo pela metade
+        temporario = self.arquivo + ".tmp"
+        try:
+            with open(temporario, "w", encoding="utf-8") as arquivo:
+                arquivo.write("\n".join(linhas) + "\n")
+            os.replace(temporario, self.arquivo)
+        except OSError as erro:
+            logger.warning("Não foi possível gravar as métricas em %s: %s", self.arquivo, erro)
+
+
+metricas = Metricas(os.environ.get("ALMOXELETRICO_METRICAS") or None)
+
+
+def tela_atual():
+    return getattr(_contexto, "tela", None)
+
+
+# Função para marcar o início de uma execução do script na tela informada (thread atual)
+def iniciar_tela(tela):
+    _contexto.tela = tela
+    _contexto.inicio = time.perf_counter()
+    _contexto.consultas = 0
+    _contexto.tempo_consultas = 0.0
+
+
+# Função para registrar a duração da execução iniciada por iniciar_tela(); retorna a duração
+def concluir_tela():
+    tela = tela_atual()
+    if tela is None:
+        return None
+    duracao = time.perf_counter() - _contexto.inicio
+    metricas.registrar_tela(tela, duracao, _contexto.consultas, _contexto.tempo_consultas)
+    _contexto.tela = None
+    return duracao
+
+
+class CursorInstrumentado(sqlite3.Cursor):
+    _sql = None
+
+    def _iniciar(self, sql):
+        self._original = sql
+        self._sql = _normalizar(sql)
+        self._duracao = 0.0
+        self._linhas = 0
+        self._lenta = False
+        if tela_atual() is not None:
+            _contexto.consultas += 1
+
+    def _medir(self, inicio, linhas, nova_execucao, plano_de=None):
+        duracao = time.perf_counter() - inicio
+        self._duracao += duracao
+        self._linhas += linhas
+        if tela_atual() is not None:
+            _contexto.tempo_consultas += duracao
+        metricas.registrar_consulta(self._sql, duracao, linhas, nova_execucao)
+        metricas.fechar_execucao(self._sql, self._duracao)
+        if not self._lenta and self._duracao > CONSULTA_LENTA:
+            self._lenta = True
+            metricas.registrar_lenta(self._sql, self._duracao, self._linhas, plano_de or self._plano)
+
+    def execute(self, sql, parametros=()):
+        self._iniciar(sql)
+        self._parametros = parametros
+        inicio = time.perf_counter()
+        super().execute(sql, parametros)
+        self._medir(inicio, max(self.rowcount, 0), True)
+        return self
+
+    def executemany(self, sql, sequencia):
+        self._iniciar(sql)
+        self._parametros = None
+        inicio = time.perf_counter()
+        super().executemany(sql, sequencia)
+        self._medir(inicio, max(self.rowcount, 0), True)
+        return self
+
+    def fetchone(self):
+        inicio = time.perf_counter()
+        linha = super().fetchone()
+        if self._sql:
+            self._medir(inicio, linha is not None, False)
+        return linha
+
+    def fetchmany(self, *args, **kwargs):
+        inicio = time.perf_counter()
+        linhas = super().fetchmany(*args, **kwargs)
+        if self._sql:
+            self._medir(inicio, len(linhas), False)
+        return linhas
+
+    def fetchall(self):
+        inicio = time.perf_counter()
+        linhas = super().fetchall()
+        if self._sql:
+            self._medir(inicio, len(linhas), False)
+        return linhas
+
+    # Plano de execução do comando atual (apenas consultas, com os mesmos parâmetros)
+    def _plano(self):
+        if self._parametros is None or not self._sql.upper().startswith(("SELECT", "WITH")):
+            return []
+        try:
+            cursor = sqlite3.Cursor(self.connection)
+            cursor.execute("EXPLAIN QUERY PLAN " + self._original, self._parametros)
+            return [linha[-1] for linha in cursor.fetchall()]
+        except sqlite3.Error as erro:
+            return [f"(plano indisponível: {erro})"]
+
+
+class ConexaoInstrumentada(sqlite3.Connection):
+    def cursor(self, factory=CursorInstrumentado):
+        return super().cursor(factory)
+
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, sequencia):
+        return self.cursor().executemany(sql, sequencia)
@@ -0,0 +1,91 @@
+import hashlib
+
+import pandas as pd
+
+# Leitura de planilhas em lotes de tamanho fixo, sem carregar o arquivo inteiro num DataFrame.
+# CSV é lido com pd.read_csv(chunksize=...) e XLSX linha a linha com o modo read_only do openpyxl.
+
+TAMANHO_LOTE = 5000
+TAMANHO_BLOCO = 1024 * 1024
+
+
+class ErroPlanilha(ValueError):
+    pass
+
+
+def _blocos(arquivo):
+    arquivo.seek(0)
+    while True:
+        bloco = arquivo.read(TAMANHO_BLOCO)
+        if not bloco:
+            break
+        yield bloco
+    arquivo.seek(0)
+
+
+# Função para calcular o SHA-256 do arquivo enviado (identifica a planilha entre execuções)
+def digest_arquivo(arquivo):
+    digest = hashlib.sha256()
+    for bloco in _blocos(arquivo):
+        digest.update(bloco)
+    return digest.hexdigest()
+
+
+def _eh_xlsx(arquivo):
+    return "xlsx" in arquivo.name
+
+
+def _lotes_csv(arquivo, tamanho_lote):
+    arquivo.seek(0)
+    try:
+        leitor = pd.read_csv(arquivo, chunksize=tamanho_lote)
+    except pd.errors.EmptyDataError:
+        raise ErroPlanilha("A planilha está vazia.") from None
+    with leitor:
+        yield from leitor
+
+
+def _lotes_xlsx(planilha, tamanho_lote):
+    try:
+        linhas = planilha.active.iter_rows(values_only=True)
+        cabecalho = next(linhas, None)
+        if cabecalho is None or all(valor is None for valor in cabecalho):
+            raise ErroPlanilha("A planilha está vazia.")
+        inicio, lote = 0, []
+        for linha in linhas:
+            if all(valor is None for valor in linha):
+                continue
+            lote.append(linha)
+            if len(lote) == tamanho_lote:
+                yield pd.DataFrame(lote, columns=cabecalho, index=range(inicio, inicio + len(lote)))
+                inicio, lote = inicio + len(lote), []
+        if lote or not inicio:  # só o cabeçalho: um lote vazio, para as colunas serem conferidas
+            yield pd.DataFrame(lote, columns=cabecalho, index=range(inicio, inicio + len(lote)))
+    finally:
+        planilha.close()
+
+
+# Função para ler uma planilha (CSV ou XLSX) em lotes. Retorna (total_estimado, lotes), onde
+# total_estimado é o número aproximado de linhas de dados (None se não for possível estimar)
+# e lotes é um iterador de DataFrames com índice contínuo entre os lotes. Planilha sem cabeçalho
+# gera ErroPlanilha na leitura; só com o cabeçalho, um único lote vazio.
+def ler_planilha_em_lotes(arquivo, tamanho_lote=TAMANHO_LOTE):
+    if _eh_xlsx(arquivo):
+        from openpyxl import load_workbook
+
+        arquivo.seek(0)
+        planilha = load_workbook(arquivo, read_only=True, data_only=True)
+        max_row = planilha.active.max_row
+        total = max_row - 1 if max_row else None
+        return total, _lotes_xlsx(planilha, tamanho_lote)
+
+    quebras = sum(bloco.count(b"\n") for bloco in _blocos(arquivo))
+    return max(quebras - 1, 0), _lotes_csv(arquivo, tamanho_lote)
+
+
+# Função para ler do disco uma planilha inteira, já dividida em lotes: (total_estimado, lista de lotes).
+# Usada pelos processos de leitura da linha de comando (python -m almoxeletrico).
+def ler_planilha(caminho, tamanho_lote=TAMANHO_LOTE):
+    with open(caminho, "rb") as arquivo:
+        total, lotes = ler_planilha_em_lotes(arquivo, tamanho_lote)
+        return total, list(lotes)
@@ -0,0 +1,225 @@
+import calendar
+from datetime import datetime, time
+
+from almoxeletrico.conexoes import transacao
+
+# Livro de movimentações compacto (esquema normalizado).
+#
+# livro               -> uma linha por movimentação, só com inteiros e a quantidade: tipo_id,
+#                        projeto_id e equipe_id apontam para as tabelas de referência e a data é
+#                        guardada em segundos desde 1970 (UTC, como o CURRENT_TIMESTAMP)
+# tipos_movimentacao  -> enumeração dos tipos (ids fixos em TIPOS_MOVIMENTACAO)
+# projetos, equipes   -> nomes distintos de projetos e equipes
+#
+# movimentacoes é uma view com as colunas do esquema antigo (descrição vinda de materiais, tipo,
+# projeto e equipe por nome e data_movimentacao em texto), então relatórios e consultas escritos
+# para a tabela continuam funcionando. INSERT, UPDATE e DELETE na view são traduzidos para o livro
+# por triggers INSTEAD OF (a descrição informada é ignorada; projeto e equipe vazios viram NULL).
+# A view também expõe data, tipo_id, projeto_id e equipe_id: filtros e ordenações por período
+# devem usar data (epoch) para aproveitar os índices do livro. Essas colunas e a descrição são
+# derivadas, então um UPDATE que as altere é recusado (altere data_movimentacao, tipo, projeto,
+# equipe ou codigo).
+#
+# Saldos, conciliação, fechamentos e a versão do livro são mantidos por triggers no livro.
+
+TIPOS_MOVIMENTACAO = ["entrada", "saída", "baixa_eqtl", "devolução", "estorno", "ajuste_inventario"]
+TIPO_ID = {tipo: numero for numero, tipo in enumerate(TIPOS_MOVIMENTACAO, start=1)}
+
+# Coluna textual da view -> tabela de referência (o id fica em <coluna>_id no livro)
+REFERENCIAS = {"tipo": "tipos_movimentacao", "projeto": "projetos", "equipe": "equipes"}
+
+SQL_TABELAS = [
+    """
+    CREATE TABLE IF NOT EXISTS tipos_movimentacao (
+        id INTEGER PRIMARY KEY,
+        nome TEXT NOT NULL UNIQUE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS projetos (
+        id INTEGER PRIMARY KEY,
+        nome TEXT NOT NULL UNIQUE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS equipes (
+        id INTEGER PRIMARY KEY,
+        nome TEXT NOT NULL UNIQUE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS livro (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        codigo INTEGER REFERENCES materiais(codigo),
+        quantidade REAL,
+        tipo_id INTEGER REFERENCES tipos_movimentacao(id),
+        projeto_id INTEGER REFERENCES projetos(id),
+        equipe_id INTEGER REFERENCES equipes(id),
+        data INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+        requisicao_id INTEGER REFERENCES requisicoes(id)
+    )
+    """,
+]
+
+# Os mesmos índices do livro antigo, agora sobre inteiros
+SQL_INDICES = [
+    "CREATE INDEX IF NOT EXISTS idx_livro_projeto_codigo_tipo ON livro (projeto_id, codigo, tipo_id)",
+    "CREATE INDEX IF NOT EXISTS idx_livro_codigo_data ON livro (codigo, data)",
+    "CREATE INDEX IF NOT EXISTS idx_livro_tipo_data ON livro (tipo_id, data)",
+    "CREATE INDEX IF NOT EXISTS idx_livro_data ON livro (data)",
+    "CREATE INDEX IF NOT EXISTS idx_livro_projeto_data ON livro (projeto_id, data)",
+    "CREATE INDEX IF NOT EXISTS idx_livro_equipe_data ON livro (equipe_id, data)",
+    "CREATE INDEX IF NOT EXISTS idx_livro_requisicao ON livro (requisicao_id)",
+]
+
+SQL_VIEW = """
+    CREATE VIEW IF NOT EXISTS movimentacoes AS
+    SELECT l.id, l.codigo, m.descricao, l.quantidade, t.nome AS tipo, p.nome AS projeto, e.nome AS equipe,
+           datetime(l.data, 'unixepoch') AS data_movimentacao, l.requisicao_id,
+           l.data, l.tipo_id, l.projeto_id, l.equipe_id
+    FROM livro l
+    LEFT JOIN materiais m ON m.codigo = l.codigo
+    LEFT JOIN tipos_movimentacao t ON t.id = l.tipo_id
+    LEFT JOIN projetos p ON p.id = l.projeto_id
+    LEFT JOIN equipes e ON e.id = l.equipe_id
+"""
+
+
+# Segundos desde 1970 de um texto de data (NULL se vazio ou inválido)
+def _sql_epoch(valor):
+    return f"CAST(strftime('%s', {valor}) AS INTEGER)"
+
+
+# Corpo comum dos triggers de INSERT e UPDATE da view: valida a data e cadastra nomes novos
+def _sql_referencias():
+    return f"""
+        SELECT RAISE(ABORT, 'data_movimentacao inválida')
+        WHERE NEW.data_movimentacao IS NOT NULL AND {_sql_epoch("NEW.data_movimentacao")} IS NULL;
+        INSERT OR IGNORE INTO tipos_movimentacao (nome) SELECT NEW.tipo WHERE NEW.tipo IS NOT NULL;
+        INSERT OR IGNORE INTO projetos (nome) SELECT NEW.projeto WHERE NULLIF(NEW.projeto, '') IS NOT NULL;
+        INSERT OR IGNORE INTO equipes (nome) SELECT NEW.equipe WHERE NULLIF(NEW.equipe, '') IS NOT NULL;
+    """
+
+
+_SQL_IDS = """
+    (SELECT id FROM tipos_movimentacao WHERE nome = NEW.tipo),
+    (SELECT id FROM projetos WHERE nome = NEW.projeto),
+    (SELECT id FROM equipes WHERE nome = NEW.equipe)
+"""
+
+SQL_TRIGGERS_VIEW = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_movimentacoes_insert INSTEAD OF INSERT ON movimentacoes
+    BEGIN
+        {_sql_referencias()}
+        INSERT INTO livro (id, codigo, quantidade, tipo_id, projeto_id, equipe_id, data, requisicao_id)
+        VALUES (NEW.id, NEW.codigo, NEW.quantidade, {_SQL_IDS},
+                COALESCE({_sql_epoch("NEW.data_movimentacao")}, {_sql_epoch("'now'")}), NEW.requisicao_id);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_movimentacoes_update INSTEAD OF UPDATE ON movimentacoes
+    BEGIN
+        SELECT RAISE(ABORT, 'descricao, data e ids de referência são derivados e não podem ser alterados')
+        WHERE NEW.descricao IS NOT OLD.descricao OR NEW.data IS NOT OLD.data OR NEW.tipo_id IS NOT OLD.tipo_id
+           OR NEW.projeto_id IS NOT OLD.projeto_id OR NEW.equipe_id IS NOT OLD.equipe_id;
+        {_sql_referencias()}
+        UPDATE livro SET (id, codigo, quantidade, tipo_id, projeto_id, equipe_id, data, requisicao_id) =
+            (NEW.id, NEW.codigo, NEW.quantidade, {_SQL_IDS}, {_sql_epoch("NEW.data_movimentacao")}, NEW.requisicao_id)
+        WHERE id = OLD.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_movimentacoes_delete INSTEAD OF DELETE ON movimentacoes
+    BEGIN
+        DELETE FROM livro WHERE id = OLD.id;
+    END
+    """,
+]
+
+# Alterações e exclusões no livro invalidam o cache analítico (inclusões são exportadas pelo id)
+SQL_TRIGGERS_VERSAO = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_versao_livro_{evento.lower()} AFTER {evento} ON livro
+    BEGIN
+        UPDATE versoes SET versao = versao + 1 WHERE tabela = 'movimentacoes';
+    END
+    """
+    for evento in ("UPDATE", "DELETE")
+]
+
+
+# Nome (tipo, projeto ou equipe) da movimentação NEW/OLD do livro, para os triggers das tabelas
+# derivadas que guardam nomes
+def sql_nome(coluna, ref):
+    return f"(SELECT nome FROM {REFERENCIAS[coluna]} WHERE id = {ref}.{coluna}_id)"
+
+
+# Condição "coluna = nome" sobre o id da tabela de referência (um parâmetro). Só usa colunas do
+# livro, então vale tanto na view quanto no livro e aproveita os índices por id.
+def sql_filtro_nome(coluna):
+    return f"{coluna}_id = (SELECT id FROM {REFERENCIAS[coluna]} WHERE nome = ?)"
+
+
+# Função para converter uma data (date, datetime ou texto ISO) em segundos desde 1970, no mesmo
+# fuso (UTC) das datas gravadas no livro
+def epoch(valor):
+    if isinstance(valor, str):
+        valor = datetime.fromisoformat(valor)
+    if not isinstance(valor, datetime):
+        valor = datetime.combine(valor, time())
+    return calendar.timegm(valor.timetuple())
+
+
+# Função para criar o livro compacto. Num banco com a tabela movimentacoes antiga, copia as
+# movimentações (mesmos ids), troca a tabela pela view e devolve o número de linhas convertidas.
+# Os triggers das tabelas derivadas são criados pela migração, depois desta função.
+def criar_livro(conn):
+    c = conn.cursor()
+    c.execute("SELECT type FROM sqlite_master WHERE name = 'movimentacoes'")
+    atual = c.fetchone()
+    if atual and atual[0] == "view":
+        return 0
+
+    convertidas = 0
+    with transacao(conn):
+        for sql in SQL_TABELAS:
+            c.execute(sql)
+        c.executemany("INSERT OR IGNORE INTO tipos_movimentacao (id, nome) VALUES (?, ?)",
+                      [(numero, tipo) for tipo, numero in TIPO_ID.items()])
+
+        if atual:
+            c.execute(f"""
+                SELECT COUNT(*) FROM movimentacoes
+                WHERE data_movimentacao IS NOT NULL AND {_sql_epoch("data_movimentacao")} IS NULL
+            """)
+            invalidas = c.fetchone()[0]
+            if invalidas:
+                raise ValueError(f"{invalidas} movimentação(ões) com data_movimentacao inválida; "
+                                 "corrija as datas antes de converter o livro.")
+
+            # Mantém a sequência do AUTOINCREMENT: ids excluídos no fim do livro não são reaproveitados
+            c.execute("INSERT INTO sqlite_sequence (name, seq) SELECT 'livro', seq FROM sqlite_sequence "
+                      "WHERE name = 'movimentacoes'")
+            c.execute("INSERT OR IGNORE INTO tipos_movimentacao (nome) "
+                      "SELECT DISTINCT tipo FROM movimentacoes WHERE tipo IS NOT NULL")
+            for tabela, coluna in (("projetos", "projeto"), ("equipes", "equipe")):
+                c.execute(f"INSERT OR IGNORE INTO {tabela} (nome) "
+                          f"SELECT DISTINCT {coluna} FROM movimentacoes WHERE NULLIF({coluna}, '') IS NOT NULL")
+            c.execute(f"""
+                INSERT INTO livro (id, codigo, quantidade, tipo_id, projeto_id, equipe_id, data, requisicao_id)
+                SELECT v.id, v.codigo, v.quantidade, t.id, p.id, e.id, {_sql_epoch("v.data_movimentacao")},
+                       v.requisicao_id
+                FROM movimentacoes v
+                LEFT JOIN tipos_movimentacao t ON t.nome = v.tipo
+                LEFT JOIN projetos p ON p.nome = v.projeto
+                LEFT JOIN equipes e ON e.nome = v.equipe
+                ORDER BY v.id
+            """)
+            convertidas = c.rowcount
+            # Também remove os índices e triggers da tabela antiga
+            c.execute("DROP TABLE movimentacoes")
+
+        for sql in SQL_INDICES + [SQL_VIEW] + SQL_TRIGGERS_VIEW + SQL_TRIGGERS_VERSAO:
+            c.execute(sql)
+    return convertidas
@@ -0,0 +1,105 @@
+from datetime import timedelta
+
+import pandas as pd
+
+from almoxeletrico.exportacao import exportar_consulta
+from almoxeletrico.livro import epoch, sql_filtro_nome
+
+# Consulta de movimentações paginada no servidor.
+#
+# Os filtros viram um WHERE único, só com colunas do livro (ids de tipo, projeto e equipe e
+# intervalos sargáveis na data em epoch), que vale tanto no livro (resumo agregado) quanto na view
+# movimentacoes (páginas e exportação). As páginas são lidas por keyset em (data, id) decrescente:
+# cada página começa depois da última linha da anterior, então o custo não cresce com o número da
+# página como aconteceria com OFFSET.
+
+COLUNAS = ["Data", "Código", "Descrição", "Tipo", "Quantidade", "Projeto", "Equipe"]
+TIPOS_COLUNAS = [str, int, str, str, float, str, str]
+
+
+# Função para montar o filtro (WHERE, parâmetros) da consulta; argumentos vazios são ignorados
+def filtro_movimentacoes(codigo=None, tipo=None, data_inicial=None, data_final=None, projeto=None, equipe=None):
+    where = " WHERE 1=1"
+    params = []
+
+    if codigo is not None:
+        where += " AND codigo = ?"
+        params.append(codigo)
+
+    if tipo:
+        where += f" AND {sql_filtro_nome('tipo')}"
+        params.append(tipo)
+
+    # Intervalo direto na coluna data (epoch, sem DATE()) para permitir o uso dos índices por data
+    if data_inicial:
+        where += " AND data >= ?"
+        params.append(epoch(data_inicial))
+
+    if data_final:
+        where += " AND data < ?"
+        params.append(epoch(data_final + timedelta(days=1)))
+
+    if projeto:
+        where += f" AND {sql_filtro_nome('projeto')}"
+        params.append(projeto)
+
+    if equipe:
+        where += f" AND {sql_filtro_nome('equipe')}"
+        params.append(equipe)
+
+    return where, tuple(params)
+
+
+# Função para resumir o resultado do filtro: quantidade de movimentações e total por tipo
+# (agrupado por tipo_id direto no livro; os nomes vêm da tabela de tipos)
+def resumo_movimentacoes(conn, filtro):
+    where, params = filtro
+    c = conn.cursor()
+    c.execute(f"""
+        SELECT t.nome, r.movimentacoes, r.quantidade, datetime(r.primeira, 'unixepoch'), datetime(r.ultima, 'unixepoch')
+        FROM (
+            SELECT tipo_id, COUNT(*) AS movimentacoes, COALESCE(SUM(quantidade), 0) AS quantidade,
+                   MIN(data) AS primeira, MAX(data) AS ultima
+            FROM livro{where}
+            GROUP BY tipo_id
+        ) r
+        LEFT JOIN tipos_movimentacao t ON t.id = r.tipo_id
+        ORDER BY t.nome
+    """, params)
+    return pd.DataFrame(c.fetchall(), columns=["Tipo", "Movimentações", "Quantidade", "Primeira", "Última"])
+
+
+# Função para ler uma página da consulta. apos é a chave (data, id) da última linha
+# da página anterior (None para a primeira página). Retorna (DataFrame da página, chave da próxima
+# página ou None se esta for a última).
+def pagina_movimentacoes(conn, filtro, tamanho, apos=None):
+    where, params = filtro
+    if apos is not None:
+        where += " AND (data, id) < (?, ?)"
+        params = params + tuple(apos)
+
+    c = conn.cursor()
+    c.execute("""
+        SELECT id, data, data_movimentacao, codigo, descricao, tipo, quantidade, projeto, equipe
+        FROM movimentacoes""" + where + " ORDER BY data DESC, id DESC LIMIT ?", params + (tamanho + 1,))
+    linhas = c.fetchall()
+
+    proxima = None
+    if len(linhas) > tamanho:
+        linhas = linhas[:tamanho]
+        proxima = (linhas[-1][1], linhas[-1][0])
+
+    df = pd.DataFrame([linha[2:] for linha in linhas], columns=COLUNAS)
+    # Formatando data para o formato brasileiro (apenas as linhas da página)
+    df["Data"] = pd.to_datetime(df["Data"]).dt.strftime("%d/%m/%Y %H:%M:%S")
+    return df, proxima
+
+
+# Função para exportar todo o resultado do filtro (não apenas a página exibida)
+def exportar_movimentacoes(conn, filtro, formato):
+    where, params = filtro
+    return exportar_consulta(
+        conn,
+        "SELECT strftime('%d/%m/%Y %H:%M:%S', data, 'unixepoch'), codigo, descricao, tipo, quantidade, projeto, equipe"
+        " FROM movimentacoes" + where + " ORDER BY data DESC, id DESC",
+        params, COLUNAS, formato, "Movimentacoes", tipos=TIPOS_COLUNAS)
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+
+# Consultas do painel de Projetos. A tela é paginada: primeiro se lista a página de projetos
+# (na tabela de referência projetos, sem percorrer o livro) e depois os agregados por
+# projeto/material e as equipes de todos os projetos da página são obtidos com uma consulta
+# agrupada cada, em vez de consultas por projeto.
+
+COLUNAS_PROJETO = ["Código", "Descrição", "Saídas", "Baixas EQTL", "Devoluções", "Estornos"]
+
+
+# Projetos com ao menos uma movimentação no livro
+def _filtro_projetos(busca):
+    query = " FROM projetos p WHERE EXISTS (SELECT 1 FROM livro l WHERE l.projeto_id = p.id)"
+    params = []
+    if busca:
+        query += " AND p.nome LIKE ?"
+        params.append(f"%{busca}%")
+    return query, params
+
+
+# Função para contar os projetos (opcionalmente filtrados por parte do nome)
+def contar_projetos(conn, busca=""):
+    filtro, params = _filtro_projetos(busca)
+    c = conn.cursor()
+    c.execute("SELECT COUNT(*)" + filtro, params)
+    return c.fetchone()[0]
+
+
+# Função para listar uma página de projetos, em ordem alfabética
+def listar_projetos(conn, busca="", limite=10, deslocamento=0):
+    filtro, params = _filtro_projetos(busca)
+    c = conn.cursor()
+    c.execute("SELECT p.nome" + filtro + " ORDER BY p.nome LIMIT ? OFFSET ?", params + [limite, deslocamento])
+    return [projeto[0] for projeto in c.fetchall()]
+
+
+def _marcadores(valores):
+    return ", ".join("?" for _ in valores)
+
+
+# Filtro dos projetos da página pelos ids (índices do livro), em vez de comparar os nomes linha a linha
+def _filtro_ids(projetos):
+    return f"projeto_id IN (SELECT id FROM projetos WHERE nome IN ({_marcadores(projetos)}))"
+
+
+# Função para buscar as equipes de cada projeto: {projeto: "equipe1, equipe2"}
+def equipes_projetos(conn, projetos):
+    if not projetos:
+        return {}
+    c = conn.cursor()
+    c.execute(f"""
+        SELECT DISTINCT projeto, equipe
+        FROM movimentacoes WHERE {_filtro_ids(projetos)} AND equipe IS NOT NULL AND equipe != ''
+        ORDER BY projeto, equipe
+    """, projetos)
+    equipes = {}
+    for projeto, equipe in c.fetchall():
+        equipes.setdefault(projeto, []).append(str(equipe))
+    return {projeto: ", ".join(nomes) for projeto, nomes in equipes.items()}
+
+
+# Função para calcular as movimentações por material de vários projetos numa única consulta.
+# Retorna {projeto: DataFrame} com saldo atual e status (Baixado/Pendente) de cada material.
+def resumo_projetos(conn, projetos):
+    if not projetos:
+        return {}
+    c = conn.cursor()
+    c.execute(f"""
+        SELECT projeto,
+               codigo,
+               MAX(descricao) AS descricao,
+               SUM(CASE WHEN tipo = 'saída' THEN quantidade ELSE 0 END) AS saidas,
+               SUM(CASE WHEN tipo = 'baixa_eqtl' THEN quantidade ELSE 0 END) AS baixas_eqtl,
+               SUM(CASE WHEN tipo = 'devolução' THEN quantidade ELSE 0 END) AS devolucoes,
+               SUM(CASE WHEN tipo = 'estorno' THEN quantidade ELSE 0 END) AS estornos
+        FROM movimentacoes WHERE {_filtro_ids(projetos)}
+        GROUP BY projeto_id, codigo
+    """, projetos)
+    df = pd.DataFrame(c.fetchall(), columns=["Projeto"] + COLUNAS_PROJETO)
+    df["Saldo Atual"] = df["Saídas"] - df["Devoluções"]
+    baixado = (df["Saídas"] == df["Baixas EQTL"]) & (df["Devoluções"] == df["Estornos"])
+    df["Status"] = np.where(baixado, "Baixado", "Pendente")
+
+    grupos = {projeto: grupo.drop(columns="Projeto").reset_index(drop=True)
+              for projeto, grupo in df.groupby("Projeto", sort=False)}
+    return {projeto: grupos.get(projeto, df.iloc[0:0].drop(columns="Projeto")) for projeto in projetos}
@@ -0,0 +1,91 @@
+from almoxeletrico.busca import LIMITE_BUSCA, buscar_materiais
+from almoxeletrico.livro import sql_filtro_nome
+from almoxeletrico.movimentacoes import exportar_movimentacoes, pagina_movimentacoes, resumo_movimentacoes
+from almoxeletrico.requisicoes import registrar_requisicao, validar_requisicao
+
+# Repositórios: único ponto de acesso das telas aos materiais e movimentações de um depósito.
+# Cada método obtém a conexão da thread atual no backend e toda gravação usa backend.transacao().
+
+
+class RepositorioMateriais:
+    def __init__(self, backend):
+        self.backend = backend
+
+    # Versão do cadastro (incrementada por trigger a cada alteração em materiais)
+    def versao(self):
+        c = self.backend.conexao().cursor()
+        c.execute("SELECT versao FROM versoes WHERE tabela = 'materiais'")
+        versao = c.fetchone()
+        return versao[0] if versao else 0
+
+    def contar(self):
+        c = self.backend.conexao().cursor()
+        c.execute("SELECT COUNT(*) FROM materiais")
+        return c.fetchone()[0]
+
+    # Busca por código ou descrição (índice de texto): até limite tuplas (codigo, descricao, unidade)
+    def pesquisar(self, termo, limite=LIMITE_BUSCA):
+        return buscar_materiais(self.backend.conexao(), termo, limite)
+
+    # Descrição e unidade de um material, ou None se o código não estiver cadastrado
+    def buscar(self, codigo):
+        c = self.backend.conexao().cursor()
+        c.execute("SELECT descricao, unidade FROM materiais WHERE codigo = ?", (codigo,))
+        return c.fetchone()
+
+    # Cadastra um material (código já cadastrado é ignorado); retorna True se foi inserido
+    def cadastrar(self, codigo, descricao, unidade):
+        with self.backend.transacao() as conn:
+            c = conn.cursor()
+            c.execute("INSERT OR IGNORE INTO materiais (codigo, descricao, unidade) VALUES (?, ?, ?)",
+                      (codigo, descricao, unidade))
+            return c.rowcount > 0
+
+
+class RepositorioMovimentacoes:
+    def __init__(self, backend):
+        self.backend = backend
+
+    # Registra uma movimentação; sem descrição informada, usa a do cadastro de materiais
+    def registrar(self, tipo, codigo, quantidade, projeto=None, equipe=None, descricao=None):
+        with self.backend.transacao() as conn:
+            conn.execute("""
+                INSERT INTO movimentacoes (codigo, descricao, quantidade, tipo, projeto, equipe)
+                VALUES (?, COALESCE(?, (SELECT descricao FROM materiais WHERE codigo = ?)), ?, ?, ?, ?)
+            """, (codigo, descricao, codigo, quantidade, tipo, projeto, equipe))
+
+    # Valida os itens (codigo, quantidade) de uma requisição contra os saldos atuais, sem gravar
+    def validar_requisicao(self, tipo, projeto, itens):
+        return validar_requisicao(self.backend.conexao(), tipo, projeto, itens)
+
+    # Registra uma requisição com vários materiais numa única transação; retorna (requisicao_id, itens)
+    def registrar_requisicao(self, tipo, projeto, equipe, itens):
+        return registrar_requisicao(self.backend.conexao(), tipo, projeto, equipe, itens)
+
+    # Projetos com movimentação (opcionalmente só os que tiveram movimentação do tipo informado)
+    def projetos(self, tipo=None):
+        query = "SELECT p.nome FROM projetos p WHERE EXISTS (SELECT 1 FROM movimentacoes v WHERE v.projeto_id = p.id"
+        params = []
+        if tipo:
+            query += " AND v.tipo = ?"
+            params.append(tipo)
+        query += ") ORDER BY p.nome"
+        c = self.backend.conexao().cursor()
+        c.execute(query, params)
+        return [projeto[0] for projeto in c.fetchall()]
+
+    # Materiais (codigo, descricao) movimentados num projeto com o tipo informado
+    def materiais_do_projeto(self, projeto, tipo):
+        c = self.backend.conexao().cursor()
+        c.execute(f"SELECT DISTINCT codigo, descricao FROM movimentacoes "
+                  f"WHERE {sql_filtro_nome('projeto')} AND {sql_filtro_nome('tipo')}", (projeto, tipo))
+        return c.fetchall()
+
+    def resumo(self, filtro):
+        return resumo_movimentacoes(self.backend.conexao(), filtro)
+
+    def pagina(self, filtro, tamanho, apos=None):
+        return pagina_movimentacoes(self.backend.conexao(), filtro, tamanho, apos)
+
+    def exportar(self, filtro, formato):
+        return exportar_movimentacoes(self.backend.conexao(), filtro, formato)
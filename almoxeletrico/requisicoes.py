@@ -0,0 +1,150 @@
+import json
+
+import pandas as pd
+
+from almoxeletrico.conexoes import transacao
+from almoxeletrico.livro import sql_filtro_nome
+
+# Requisições: vários materiais retirados (saída) ou baixados (baixa_eqtl) de uma vez para um
+# projeto/equipe. Os itens são validados numa única consulta e gravados numa única transação;
+# cada linha de movimentacoes guarda o requisicao_id, então uma requisição nunca fica pela metade.
+#
+# A validação é repetida dentro da transação de escrita (BEGIN IMMEDIATE), para que duas
+# requisições simultâneas não retirem o mesmo saldo.
+
+TIPOS_REQUISICAO = ["saída", "baixa_eqtl"]
+COLUNAS_VALIDACAO = ["Linha", "Código", "Descrição", "Quantidade", "Saldo", "Retirado no Projeto", "Situação", "Aviso"]
+TOLERANCIA = 1e-9
+
+
+class ErroRequisicao(ValueError):
+    def __init__(self, mensagem, itens=None):
+        super().__init__(mensagem)
+        self.itens = itens
+
+
+# Função para criar a tabela de requisições e a coluna requisicao_id nas movimentações
+def criar_tabelas_requisicoes(conn):
+    c = conn.cursor()
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS requisicoes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tipo TEXT NOT NULL,
+        projeto TEXT NOT NULL,
+        equipe TEXT NOT NULL,
+        itens INTEGER NOT NULL,
+        criada_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    c.execute("PRAGMA table_info(movimentacoes)")
+    if "requisicao_id" not in {coluna[1] for coluna in c.fetchall()}:
+        c.execute("ALTER TABLE movimentacoes ADD COLUMN requisicao_id INTEGER REFERENCES requisicoes(id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_mov_requisicao ON movimentacoes (requisicao_id)")
+    conn.commit()
+
+
+# Valor numérico de uma célula da grade; vazio (None, NaN, pd.NA de colunas Int64) ou texto não
+# numérico vira None, e a linha é recusada na validação
+def _numero(valor):
+    if pd.isna(valor):
+        return None
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        return None
+
+
+# Converte os itens (DataFrame com codigo e quantidade, ou lista de pares) para [[codigo, quantidade], ...];
+# código não inteiro vira None (recusado na validação)
+def _itens_json(itens):
+    if isinstance(itens, pd.DataFrame):
+        itens = itens[["codigo", "quantidade"]].itertuples(index=False, name=None)
+    pares = []
+    for codigo, quantidade in itens:
+        codigo = _numero(codigo)
+        pares.append([int(codigo) if codigo is not None and codigo.is_integer() else None, _numero(quantidade)])
+    return json.dumps(pares)
+
+
+# Função para validar os itens de uma requisição com uma única consulta. Retorna um DataFrame em
+# COLUNAS_VALIDACAO; "Situação" é "ok" ou o motivo da recusa e "Aviso" traz alertas que não impedem
+# a gravação. Na saída, o total pedido de cada material não pode passar do saldo atual (Visão Geral);
+# na baixa EQTL, pedidos acima do retirado pelo projeto (saídas - devoluções - baixas) geram aviso.
+def validar_requisicao(conn, tipo, projeto, itens):
+    c = conn.cursor()
+    c.execute(f"""
+        WITH itens AS (
+            SELECT CAST(j.key AS INTEGER) + 1 AS linha,
+                   json_extract(j.value, '$[0]') AS codigo,
+                   json_extract(j.value, '$[1]') AS quantidade
+            FROM json_each(?) j
+        ),
+        pedidos AS (
+            SELECT codigo, SUM(quantidade) AS total FROM itens WHERE codigo IS NOT NULL GROUP BY codigo
+        )
+        SELECT i.linha, i.codigo, m.descricao, i.quantidade, p.total, m.codigo IS NOT NULL,
+               COALESCE((
+                   SELECT SUM(CASE WHEN s.tipo IN ('entrada', 'devolução', 'ajuste_inventario') THEN s.quantidade
+                                   WHEN s.tipo = 'saída' THEN -s.quantidade ELSE 0 END)
+                   FROM saldos_tipo s WHERE s.codigo = i.codigo
+               ), 0),
+               COALESCE((
+                   SELECT SUM(CASE v.tipo WHEN 'saída' THEN v.quantidade WHEN 'devolução' THEN -v.quantidade
+                                          WHEN 'baixa_eqtl' THEN -v.quantidade ELSE 0 END)
+                   FROM movimentacoes v WHERE v.{sql_filtro_nome('projeto')} AND v.codigo = i.codigo
+               ), 0)
+        FROM itens i
+        LEFT JOIN materiais m ON m.codigo = i.codigo
+        LEFT JOIN pedidos p ON p.codigo = i.codigo
+        ORDER BY i.linha
+    """, (_itens_json(itens), projeto))
+
+    linhas = []
+    for linha, codigo, descricao, quantidade, total, cadastrado, saldo, retirado in c.fetchall():
+        aviso = ""
+        if codigo is None:
+            situacao = "código inválido"
+        elif not cadastrado:
+            situacao = "código não cadastrado"
+        elif quantidade is None or quantidade <= 0:
+            situacao = "quantidade deve ser maior que zero"
+        elif tipo == "saída" and total > saldo + TOLERANCIA:
+            situacao = f"saldo insuficiente (pedido {total:g}, saldo {saldo:g})"
+        else:
+            situacao = "ok"
+            if tipo == "baixa_eqtl" and total > retirado + TOLERANCIA:
+                aviso = f"acima do retirado pelo projeto ({retirado:g})"
+        linhas.append((linha, codigo, descricao, quantidade, saldo, retirado, situacao, aviso))
+    validados = pd.DataFrame(linhas, columns=COLUNAS_VALIDACAO)
+    validados["Código"] = validados["Código"].astype("Int64")
+    return validados
+
+
+# Função para gravar uma requisição: valida de novo dentro da transação de escrita e grava a
+# requisição e todas as movimentações juntas. Retorna (requisicao_id, itens validados); se algum
+# item for recusado nada é gravado e ErroRequisicao traz os itens validados.
+def registrar_requisicao(conn, tipo, projeto, equipe, itens):
+    if tipo not in TIPOS_REQUISICAO:
+        raise ErroRequisicao(f"Tipo de requisição inválido: {tipo}")
+    if not projeto or not equipe:
+        raise ErroRequisicao("Projeto e equipe são obrigatórios.")
+
+    with transacao(conn):
+        validados = validar_requisicao(conn, tipo, projeto, itens)
+        if validados.empty:
+            raise ErroRequisicao("Adicione ao menos um material à requisição.", validados)
+        recusados = validados[validados["Situação"] != "ok"]
+        if len(recusados):
+            raise ErroRequisicao(f"{len(recusados)} item(ns) recusado(s); nada foi gravado.", validados)
+
+        c = conn.cursor()
+        c.execute("INSERT INTO requisicoes (tipo, projeto, equipe, itens) VALUES (?, ?, ?, ?)",
+                  (tipo, projeto, equipe, len(validados)))
+        requisicao_id = c.lastrowid
+        c.executemany("""
+            INSERT INTO movimentacoes (codigo, descricao, quantidade, tipo, projeto, equipe, requisicao_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, [(int(codigo), descricao, float(quantidade), tipo, projeto, equipe, requisicao_id)
+              for codigo, descricao, quantidade in validados[["Código", "Descrição", "Quantidade"]].itertuples(
+                  index=False, name=None)])
+    return requisicao_id, validados
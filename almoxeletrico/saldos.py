@@ -0,0 +1,236 @@
+import argparse
+
+import pandas as pd
+
+from almoxeletrico.conexoes import transacao
+from almoxeletrico.livro import sql_nome
+
+# Saldos materializados a partir do livro de movimentações.
+#
+# saldos       -> soma de todas as quantidades por material (usada no Inventário)
+# saldos_tipo  -> soma das quantidades por material e tipo de movimentação (usada na Visão Geral)
+#
+# As duas tabelas são mantidas por triggers no livro (criados pela migração do livro compacto),
+# então qualquer INSERT, UPDATE ou DELETE em movimentacoes já atualiza os saldos na mesma transação.
+
+TOLERANCIA = 1e-6
+
+SQL_TABELAS = [
+    """
+    CREATE TABLE IF NOT EXISTS saldos (
+        codigo INTEGER PRIMARY KEY,
+        quantidade REAL NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS saldos_tipo (
+        codigo INTEGER NOT NULL,
+        tipo TEXT NOT NULL,
+        quantidade REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (codigo, tipo)
+    ) WITHOUT ROWID
+    """,
+]
+
+
+# Monta o corpo do trigger que aplica (sinal = 1) ou desfaz (sinal = -1) uma movimentação
+def _sql_aplicar(ref, sinal):
+    return f"""
+        INSERT INTO saldos (codigo, quantidade)
+        SELECT {ref}.codigo, {sinal} * COALESCE({ref}.quantidade, 0)
+        WHERE {ref}.codigo IS NOT NULL
+        ON CONFLICT(codigo) DO UPDATE SET quantidade = quantidade + excluded.quantidade;
+
+        INSERT INTO saldos_tipo (codigo, tipo, quantidade)
+        SELECT {ref}.codigo, {sql_nome("tipo", ref)}, {sinal} * COALESCE({ref}.quantidade, 0)
+        WHERE {ref}.codigo IS NOT NULL AND {ref}.tipo_id IS NOT NULL
+        ON CONFLICT(codigo, tipo) DO UPDATE SET quantidade = quantidade + excluded.quantidade;
+    """
+
+
+SQL_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_saldos_insert AFTER INSERT ON livro
+    BEGIN
+        {_sql_aplicar("NEW", 1)}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_saldos_delete AFTER DELETE ON livro
+    BEGIN
+        {_sql_aplicar("OLD", -1)}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_saldos_update AFTER UPDATE OF codigo, quantidade, tipo_id ON livro
+    BEGIN
+        {_sql_aplicar("OLD", -1)}
+        {_sql_aplicar("NEW", 1)}
+    END
+    """,
+]
+
+
+# Função para criar as tabelas de saldo (os triggers são criados junto com o livro); na primeira
+# execução os saldos são calculados a partir das movimentações já existentes
+def criar_tabelas_saldos(conn):
+    c = conn.cursor()
+    c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'saldos'")
+    existia = c.fetchone() is not None
+
+    for sql in SQL_TABELAS:
+        c.execute(sql)
+    conn.commit()
+
+    if not existia:
+        reconstruir_saldos(conn)
+
+
+# Função para recalcular todos os saldos a partir do livro de movimentações
+def reconstruir_saldos(conn):
+    with transacao(conn):
+        c = conn.cursor()
+        c.execute("DELETE FROM saldos")
+        c.execute("DELETE FROM saldos_tipo")
+        c.execute("""
+            INSERT INTO saldos (codigo, quantidade)
+            SELECT codigo, COALESCE(SUM(quantidade), 0)
+            FROM movimentacoes WHERE codigo IS NOT NULL
+            GROUP BY codigo
+        """)
+        c.execute("""
+            INSERT INTO saldos_tipo (codigo, tipo, quantidade)
+            SELECT codigo, tipo, COALESCE(SUM(quantidade), 0)
+            FROM movimentacoes WHERE codigo IS NOT NULL AND tipo IS NOT NULL
+            GROUP BY codigo, tipo
+        """)
+
+
+# Função para comparar os saldos materializados com a soma do livro de movimentações.
+# Retorna uma lista de (tabela, chave, saldo_registrado, saldo_calculado) com as divergências.
+def verificar_saldos(conn):
+    c = conn.cursor()
+    divergencias = []
+
+    c.execute("""
+        SELECT codigo, COALESCE(SUM(quantidade), 0)
+        FROM movimentacoes WHERE codigo IS NOT NULL
+        GROUP BY codigo
+    """)
+    calculado = dict(c.fetchall())
+    c.execute("SELECT codigo, quantidade FROM saldos")
+    registrado = dict(c.fetchall())
+    for codigo in calculado.keys() | registrado.keys():
+        esperado, atual = calculado.get(codigo, 0), registrado.get(codigo, 0)
+        if abs(esperado - atual) > TOLERANCIA:
+            divergencias.append(("saldos", codigo, atual, esperado))
+
+    c.execute("""
+        SELECT codigo, tipo, COALESCE(SUM(quantidade), 0)
+        FROM movimentacoes WHERE codigo IS NOT NULL AND tipo IS NOT NULL
+        GROUP BY codigo, tipo
+    """)
+    calculado = {(codigo, tipo): quantidade for codigo, tipo, quantidade in c.fetchall()}
+    c.execute("SELECT codigo, tipo, quantidade FROM saldos_tipo")
+    registrado = {(codigo, tipo): quantidade for codigo, tipo, quantidade in c.fetchall()}
+    for chave in calculado.keys() | registrado.keys():
+        esperado, atual = calculado.get(chave, 0), registrado.get(chave, 0)
+        if abs(esperado - atual) > TOLERANCIA:
+            divergencias.append(("saldos_tipo", chave, atual, esperado))
+
+    return divergencias
+
+
+# Função para buscar o saldo total (soma de todas as movimentações) de um material
+def saldo_total(conn, codigo):
+    c = conn.cursor()
+    c.execute("SELECT quantidade FROM saldos WHERE codigo = ?", (codigo,))
+    saldo = c.fetchone()
+    return saldo[0] if saldo else 0
+
+
+# Função para registrar um ajuste de inventário que leva o saldo total do material à quantidade
+# contada. O saldo é lido na própria transação de escrita. Retorna o ajuste gravado (0 se nenhum).
+def ajustar_saldo(conn, codigo, nova_quantidade):
+    with transacao(conn):
+        ajuste = nova_quantidade - saldo_total(conn, codigo)
+        if ajuste != 0:
+            conn.execute("""
+                INSERT INTO movimentacoes (codigo, descricao, quantidade, tipo, projeto, equipe)
+                VALUES (?, (SELECT descricao FROM materiais WHERE codigo = ?), ?, 'ajuste_inventario', NULL, NULL)
+            """, (codigo, codigo, ajuste))
+    return ajuste
+
+
+COLUNAS_ESTOQUE = ["Código", "Descrição", "Entradas", "Saídas", "Baixas EQTL", "Devoluções", "Ajustes"]
+
+# Colunas de quantidade por tipo (apelido "s" para a origem das quantidades), na ordem de COLUNAS_ESTOQUE
+SQL_SOMA_TIPOS = """
+               COALESCE(SUM(CASE WHEN s.tipo = 'entrada' THEN s.quantidade ELSE 0 END), 0) AS entradas,
+               COALESCE(SUM(CASE WHEN s.tipo = 'saída' THEN s.quantidade ELSE 0 END), 0) AS saidas,
+               COALESCE(SUM(CASE WHEN s.tipo = 'baixa_eqtl' THEN s.quantidade ELSE 0 END), 0) AS baixas_eqtl,
+               COALESCE(SUM(CASE WHEN s.tipo = 'devolução' THEN s.quantidade ELSE 0 END), 0) AS devolucoes,
+               COALESCE(SUM(CASE WHEN s.tipo = 'ajuste_inventario' THEN s.quantidade ELSE 0 END), 0) AS ajustes
+"""
+
+
+# Função para montar o DataFrame de posição do estoque (linhas em COLUNAS_ESTOQUE) com o saldo
+def tabela_estoque(linhas):
+    df_estoque = pd.DataFrame(linhas, columns=COLUNAS_ESTOQUE)
+
+    # Novo saldo atualizado (agora incluindo os ajustes do inventário)
+    df_estoque["Saldo Atual"] = df_estoque["Entradas"] - df_estoque["Saídas"] + df_estoque["Devoluções"] + df_estoque[
+        "Ajustes"]
+    return df_estoque
+
+
+# Função para montar a Visão Geral do Estoque (todos os materiais ou apenas um), lendo os saldos
+# materializados por material e tipo em vez do livro de movimentações
+def visao_geral_estoque(conn, codigo=None):
+    query = f"""
+        SELECT m.codigo,
+               m.descricao,{SQL_SOMA_TIPOS}
+        FROM materiais m
+        LEFT JOIN saldos_tipo s ON m.codigo = s.codigo
+    """
+
+    params = []
+    if codigo is not None:
+        query += " WHERE m.codigo = ?"
+        params.append(codigo)
+
+    query += " GROUP BY m.codigo, m.descricao"
+
+    c = conn.cursor()
+    c.execute(query, params)
+    return tabela_estoque(c.fetchall())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manutenção dos saldos materializados de estoque")
+    parser.add_argument("comando", choices=["reconstruir", "verificar"])
+    parser.add_argument("--banco", default="estoque.db", help="Caminho do banco SQLite")
+    args = parser.parse_args(argv)
+
+    from almoxeletrico.db import get_db_connection, migrar
+
+    conn = get_db_connection(args.banco)
+    migrar(conn)
+
+    if args.comando == "reconstruir":
+        reconstruir_saldos(conn)
+        print("Saldos reconstruídos com sucesso!")
+        return 0
+
+    divergencias = verificar_saldos(conn)
+    for tabela, chave, atual, esperado in divergencias:
+        print(f"{tabela} {chave}: registrado={atual} calculado={esperado}")
+    if divergencias:
+        print(f"{len(divergencias)} divergência(s) encontrada(s).")
+        return 1
+    print("Saldos conferem com as movimentações.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
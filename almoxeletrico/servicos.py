@@ -0,0 +1,232 @@
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from almoxeletrico.analitico import (CAUDA_MAXIMA, criar_cache, manifesto_atual, movimentacao_mensal,
+                                     resumo_por_tipo, usar_cache)
+from almoxeletrico.conciliacao import (equipes_pendentes, listar_pendencias, reconstruir_conciliacao,
+                                       totais_pendencias, verificar_conciliacao)
+from almoxeletrico.fechamentos import fechar_meses, listar_fechamentos, meses_a_fechar, posicao_historica
+from almoxeletrico.relatorios import contar_projetos, equipes_projetos, listar_projetos, resumo_projetos
+from almoxeletrico.repositorios import RepositorioMateriais, RepositorioMovimentacoes
+from almoxeletrico.saldos import (ajustar_saldo, reconstruir_saldos, saldo_total, verificar_saldos,
+                                  visao_geral_estoque)
+from almoxeletrico.tarefas import (consultar_tarefa, enfileirar_tarefa, executar_tarefa, liberar_tarefa_abandonada,
+                                   listar_tarefas, reservar_tarefa, retomar_tarefas)
+
+# Serviços de saldo, de relatório de projetos, de pendências, de relatórios analíticos e da fila de
+# importações, e o Almoxarifado, que reúne repositórios e serviços de um depósito (backend) para uso
+# pelas telas e scripts.
+
+logger = logging.getLogger(__name__)
+
+
+class ServicoSaldos:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def saldo_total(self, codigo):
+        return saldo_total(self.backend.conexao(), codigo)
+
+    def visao_geral(self, codigo=None):
+        return visao_geral_estoque(self.backend.conexao(), codigo)
+
+    def ajustar(self, codigo, nova_quantidade):
+        return ajustar_saldo(self.backend.conexao(), codigo, nova_quantidade)
+
+    def reconstruir(self):
+        reconstruir_saldos(self.backend.conexao())
+
+    def verificar(self):
+        return verificar_saldos(self.backend.conexao())
+
+
+class ServicoRelatorioProjetos:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def contar(self, busca=""):
+        return contar_projetos(self.backend.conexao(), busca)
+
+    def listar(self, busca="", limite=10, deslocamento=0):
+        return listar_projetos(self.backend.conexao(), busca, limite, deslocamento)
+
+    def equipes(self, projetos):
+        return equipes_projetos(self.backend.conexao(), projetos)
+
+    def resumo(self, projetos):
+        return resumo_projetos(self.backend.conexao(), projetos)
+
+
+class ServicoPosicaoHistorica:
+    def __init__(self, backend):
+        self.backend = backend
+
+    # Posição no fim do dia informado: (DataFrame, mês do fechamento usado como base)
+    def posicao(self, data, codigo=None, projeto=None):
+        return posicao_historica(self.backend.conexao(), data, codigo, projeto)
+
+    def pendentes(self, ate=None):
+        return meses_a_fechar(self.backend.conexao(), ate)
+
+    def fechar(self, ate=None, ao_progredir=None):
+        return fechar_meses(self.backend.conexao(), ate, ao_progredir)
+
+    def fechamentos(self):
+        return listar_fechamentos(self.backend.conexao())
+
+
+class ServicoPendencias:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def equipes(self):
+        return equipes_pendentes(self.backend.conexao())
+
+    # Totais das pendências filtradas: (linhas, pendente baixa, pendente estorno)
+    def totais(self, equipe=None, projeto=""):
+        return totais_pendencias(self.backend.conexao(), equipe, projeto)
+
+    def listar(self, equipe=None, projeto="", limite=None, deslocamento=0):
+        return listar_pendencias(self.backend.conexao(), equipe, projeto, limite, deslocamento)
+
+    def reconstruir(self):
+        reconstruir_conciliacao(self.backend.conexao())
+
+    def verificar(self):
+        return verificar_conciliacao(self.backend.conexao())
+
+
+class ServicoAnalitico:
+    def __init__(self, backend):
+        self.backend = backend
+        self.cache = criar_cache(backend.diretorio_analitico())
+        self._executor = None
+        self._atualizacao = None
+        self._lock = threading.Lock()
+
+    # Exporta para o cache as movimentações ainda não exportadas; retorna quantas foram exportadas
+    def atualizar(self):
+        return self.cache.atualizar(self.backend.conexao()) if self.cache else 0
+
+    def _atualizar_em_segundo_plano(self):
+        try:
+            return self.cache.atualizar(self.backend.conexao(), minimo=CAUDA_MAXIMA)
+        except Exception:
+            logger.exception("Erro ao atualizar o cache analítico em %s", self.cache.diretorio)
+            return 0
+
+    # Com o cache desatualizado, dispara a exportação numa thread de fundo (uma por vez) e volta
+    # sem esperar; as consultas usam o SQLite até a exportação terminar. Abaixo do limiar de
+    # tamanho do livro o cache não é usado, então também não é exportado.
+    def _verificar_cache(self, conn):
+        if self.cache is None or not usar_cache(conn) or manifesto_atual(conn, self.cache) is not None:
+            return
+        with self._lock:
+            if self._atualizacao is not None and not self._atualizacao.done():
+                return
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(1, thread_name_prefix="almoxeletrico-analitico")
+            self._atualizacao = self._executor.submit(self._atualizar_em_segundo_plano)
+
+    # Resumo por tipo das movimentações (filtros de filtro_movimentacoes)
+    def resumo(self, **filtros):
+        conn = self.backend.conexao()
+        self._verificar_cache(conn)
+        return resumo_por_tipo(conn, self.cache, **filtros)
+
+    # Quantidades movimentadas por mês e tipo (de um material ou de todos)
+    def mensal(self, codigo=None):
+        conn = self.backend.conexao()
+        self._verificar_cache(conn)
+        return movimentacao_mensal(conn, self.cache, codigo)
+
+    # Aguarda a exportação em andamento
+    def fechar(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+class ServicoTarefas:
+    # Uma thread de trabalho por depósito: o SQLite aceita um escritor por vez, então mais threads
+    # só disputariam o lock de escrita
+    TRABALHADORES = 1
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.diretorio = backend.diretorio_tarefas() or tempfile.mkdtemp(prefix="almoxeletrico-tarefas-")
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _executar(self, tarefa_id):
+        conn = self.backend.conexao()
+        if reservar_tarefa(conn, tarefa_id):
+            return executar_tarefa(conn, self.diretorio, tarefa_id)
+        return None
+
+    # Entrega a tarefa à thread de trabalho (criada na primeira tarefa)
+    def _submeter(self, tarefa_id):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.TRABALHADORES, thread_name_prefix="almoxeletrico-tarefas")
+            return self._executor.submit(self._executar, tarefa_id)
+
+    # Devolve à thread de trabalho a tarefa, se ela foi abandonada por outro processo
+    def _retomar_abandonada(self, tarefa_id):
+        if liberar_tarefa_abandonada(self.backend.conexao(), tarefa_id):
+            self._submeter(tarefa_id)
+            return True
+        return False
+
+    # Enfileira a importação da planilha enviada: (id da tarefa, nova). A mesma planilha devolve a
+    # tarefa existente (nova = False), que não é executada de novo, a não ser que tenha sido abandonada.
+    def importar(self, arquivo, tipo):
+        tarefa_id, nova = enfileirar_tarefa(self.backend.conexao(), self.diretorio, arquivo, tipo)
+        if nova:
+            self._submeter(tarefa_id)
+            return tarefa_id, nova
+        return tarefa_id, self._retomar_abandonada(tarefa_id)
+
+    # Devolve à thread de trabalho as tarefas pendentes e as interrompidas; retorna quantas foram retomadas
+    def retomar(self):
+        pendentes = retomar_tarefas(self.backend.conexao())
+        for tarefa_id in pendentes:
+            self._submeter(tarefa_id)
+        return len(pendentes)
+
+    # Executa as tarefas pendentes na thread atual (linha de comando); retorna {tarefa: situação final}
+    def processar_pendentes(self):
+        return {tarefa_id: self._executar(tarefa_id) for tarefa_id in retomar_tarefas(self.backend.conexao())}
+
+    # Consulta a tarefa (acompanhada pela tela); uma tarefa abandonada volta para a fila
+    def tarefa(self, tarefa_id):
+        tarefa = consultar_tarefa(self.backend.conexao(), tarefa_id)
+        if tarefa and tarefa.situacao == "executando" and self._retomar_abandonada(tarefa_id):
+            tarefa = consultar_tarefa(self.backend.conexao(), tarefa_id)
+        return tarefa
+
+    def listar(self, tipo=None, limite=10):
+        return listar_tarefas(self.backend.conexao(), tipo, limite)
+
+    # Aguarda as tarefas já entregues à thread de trabalho
+    def fechar(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+class Almoxarifado:
+    def __init__(self, backend):
+        self.backend = backend
+        self.materiais = RepositorioMateriais(backend)
+        self.movimentacoes = RepositorioMovimentacoes(backend)
+        self.saldos = ServicoSaldos(backend)
+        self.projetos = ServicoRelatorioProjetos(backend)
+        self.historico = ServicoPosicaoHistorica(backend)
+        self.pendencias = ServicoPendencias(backend)
+        self.analitico = ServicoAnalitico(backend)
+        self.tarefas = ServicoTarefas(backend)
@@ -0,0 +1,271 @@
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+from collections import namedtuple
+from pathlib import Path
+
+import pandas as pd
+
+from almoxeletrico.conexoes import transacao
+from almoxeletrico.importacao import IMPORTADORES, ErroPlanilha, gravar_lotes, rejeitadas_csv
+from almoxeletrico.instrumentacao import concluir_tela, iniciar_tela
+from almoxeletrico.leitura import TAMANHO_LOTE, digest_arquivo, ler_planilha_em_lotes
+
+# Fila de importações em segundo plano.
+#
+# A tela não importa a planilha: grava o arquivo enviado no diretório de tarefas do depósito
+# (estoque.tarefas/, com o SHA-256 do conteúdo no nome) e registra uma tarefa na tabela tarefas.
+# Uma thread de trabalho executa a importação (o mesmo gravar_lotes das telas e da linha de
+# comando) e grava na tarefa o progresso e o resultado, que a tela consulta periodicamente. Assim a
+# página continua respondendo durante a importação e um clique em outro widget (que reexecuta o
+# script) não dispara a importação de novo.
+#
+# A tarefa é única por (digest, tipo): a mesma planilha enviada de novo devolve a tarefa existente,
+# e só uma tarefa com erro volta para a fila. A gravação continua idempotente pelo digest na tabela
+# importacoes, então uma tarefa interrompida (servidor reiniciado no meio da importação) é retomada
+# do primeiro lote ainda não gravado.
+#
+# A tarefa em execução guarda o processo que a reservou (PROCESSO). Uma tarefa de outro processo
+# sem progresso há mais de ABANDONO é considerada abandonada e volta para a fila: na partida do
+# servidor e também quando a planilha é enviada de novo ou a tela consulta a tarefa, então um
+# servidor reiniciado logo após a interrupção não deixa a tarefa "executando" para sempre.
+#
+# Situações: pendente -> executando -> concluida | erro
+
+logger = logging.getLogger(__name__)
+
+SITUACOES_FINAIS = ("concluida", "erro")
+
+# Tarefa em execução por outro processo sem progresso registrado há mais tempo que isso é
+# considerada abandonada (processo encerrado no meio da importação) e volta para a fila; o progresso
+# é gravado a cada lote, que leva poucos segundos
+ABANDONO = "-2 minutes"
+
+# Identificação deste processo nas tarefas que ele reserva (o pid pode ser reutilizado após reiniciar)
+PROCESSO = f"{os.getpid()}-{uuid.uuid4().hex[:12]}"
+
+SQL_ABANDONADA = """
+    situacao = 'executando' AND (processo IS NULL OR processo != ?) AND atualizada_em < datetime('now', ?)
+"""
+
+Tarefa = namedtuple("Tarefa", ["id", "tipo", "arquivo", "situacao", "linhas_lidas", "total", "gravadas",
+                               "ja_importada", "mensagem", "recusadas", "criada_em", "concluida_em"])
+
+COLUNAS_TAREFAS = ["Tarefa", "Arquivo", "Tipo", "Situação", "Linhas Lidas", "Gravadas", "Enviada em", "Concluída em"]
+
+
+# Função para criar a tabela de tarefas
+def criar_tabela_tarefas(conn):
+    c = conn.cursor()
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS tarefas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        digest TEXT NOT NULL,
+        tipo TEXT NOT NULL,
+        arquivo TEXT NOT NULL,
+        situacao TEXT NOT NULL DEFAULT 'pendente',
+        linhas_lidas INTEGER NOT NULL DEFAULT 0,
+        total INTEGER,
+        gravadas INTEGER,
+        ja_importada INTEGER NOT NULL DEFAULT 0,
+        mensagem TEXT,
+        recusadas BLOB,
+        criada_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        atualizada_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        concluida_em TIMESTAMP,
+        processo TEXT,
+        UNIQUE (digest, tipo)
+    )
+    """)
+    c.execute("PRAGMA table_info(tarefas)")
+    if "processo" not in {coluna[1] for coluna in c.fetchall()}:
+        c.execute("ALTER TABLE tarefas ADD COLUMN processo TEXT")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tarefas_situacao ON tarefas (situacao, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tarefas_tipo ON tarefas (tipo, id)")
+    conn.commit()
+
+
+# Cópia da planilha no diretório de tarefas (a extensão original decide entre CSV e XLSX na leitura)
+def _caminho(diretorio, digest, arquivo):
+    return Path(diretorio) / f"{digest}{Path(arquivo).suffix.lower()}"
+
+
+# Função para enfileirar a importação de uma planilha enviada (arquivo com .name, como o do
+# st.file_uploader). Retorna (id da tarefa, nova); se a mesma planilha já tem uma tarefa pendente,
+# em execução ou concluída para o tipo, devolve essa tarefa (nova = False) sem gravar nada.
+def enfileirar_tarefa(conn, diretorio, arquivo, tipo):
+    if tipo not in IMPORTADORES:
+        raise ValueError(f"Tipo de importação inválido: {tipo}")
+
+    digest = digest_arquivo(arquivo)
+    c = conn.cursor()
+    c.execute("SELECT id, situacao FROM tarefas WHERE digest = ? AND tipo = ?", (digest, tipo))
+    existente = c.fetchone()
+    if existente and existente[1] != "erro":
+        return existente[0], False
+
+    # Grava a cópia antes de registrar a tarefa, para a thread de trabalho nunca ler um arquivo pela
+    # metade. O arquivo temporário tem nome único: dois envios da mesma planilha ao mesmo tempo não
+    # escrevem no mesmo arquivo.
+    caminho = _caminho(diretorio, digest, arquivo.name)
+    caminho.parent.mkdir(parents=True, exist_ok=True)
+    arquivo.seek(0)
+    with tempfile.NamedTemporaryFile(dir=caminho.parent, prefix=caminho.name + ".", suffix=".parcial",
+                                     delete=False) as destino:
+        try:
+            shutil.copyfileobj(arquivo, destino)
+        except BaseException:
+            destino.close()
+            os.unlink(destino.name)
+            raise
+    arquivo.seek(0)
+    os.replace(destino.name, caminho)
+
+    with transacao(conn):
+        c.execute("""
+            INSERT INTO tarefas (digest, tipo, arquivo) VALUES (?, ?, ?)
+            ON CONFLICT(digest, tipo) DO UPDATE SET
+                arquivo = excluded.arquivo, situacao = 'pendente', linhas_lidas = 0, total = NULL,
+                gravadas = NULL, ja_importada = 0, mensagem = NULL, recusadas = NULL,
+                criada_em = CURRENT_TIMESTAMP, atualizada_em = CURRENT_TIMESTAMP, concluida_em = NULL
+            WHERE situacao = 'erro'
+        """, (digest, tipo, arquivo.name))
+        nova = c.rowcount == 1
+        c.execute("SELECT id FROM tarefas WHERE digest = ? AND tipo = ?", (digest, tipo))
+        return c.fetchone()[0], nova
+
+
+# Função para reservar uma tarefa pendente; retorna False se outra thread (ou processo) já a reservou
+def reservar_tarefa(conn, tarefa_id):
+    with transacao(conn):
+        c = conn.cursor()
+        c.execute("""
+            UPDATE tarefas SET situacao = 'executando', processo = ?, atualizada_em = CURRENT_TIMESTAMP
+            WHERE id = ? AND situacao = 'pendente'
+        """, (PROCESSO, tarefa_id))
+        return c.rowcount == 1
+
+
+# Função para devolver à fila uma tarefa abandonada; retorna True se ela voltou para a fila
+def liberar_tarefa_abandonada(conn, tarefa_id):
+    with transacao(conn):
+        c = conn.cursor()
+        c.execute(f"UPDATE tarefas SET situacao = 'pendente' WHERE id = ? AND {SQL_ABANDONADA}",
+                  (tarefa_id, PROCESSO, ABANDONO))
+        return c.rowcount == 1
+
+
+def _finalizar(conn, tarefa_id, **campos):
+    colunas = ", ".join(f"{coluna} = ?" for coluna in campos)
+    with transacao(conn):
+        conn.execute(f"""
+            UPDATE tarefas SET {colunas}, atualizada_em = CURRENT_TIMESTAMP, concluida_em = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, tuple(campos.values()) + (tarefa_id,))
+
+
+# Função para reservar a importação de uma planilha feita fora da fila (linha de comando): a tarefa
+# do digest é criada, ou tomada se estiver pendente, com erro ou abandonada, já em execução por este
+# processo, e a tela e a fila deixam de executá-la. Retorna o id da tarefa, ou None se a planilha
+# está em execução por outro processo ou já foi concluída.
+def reservar_importacao(conn, diretorio, digest, tipo, arquivo):
+    with transacao(conn):
+        c = conn.cursor()
+        c.execute("SELECT arquivo FROM tarefas WHERE digest = ? AND tipo = ?", (digest, tipo))
+        anterior = c.fetchone()
+        c.execute(f"""
+            INSERT INTO tarefas (digest, tipo, arquivo, situacao, processo) VALUES (?, ?, ?, 'executando', ?)
+            ON CONFLICT(digest, tipo) DO UPDATE SET
+                arquivo = excluded.arquivo, situacao = 'executando', processo = excluded.processo,
+                linhas_lidas = 0, total = NULL, gravadas = NULL, ja_importada = 0, mensagem = NULL,
+                recusadas = NULL, atualizada_em = CURRENT_TIMESTAMP, concluida_em = NULL
+            WHERE situacao IN ('pendente', 'erro') OR ({SQL_ABANDONADA})
+        """, (digest, tipo, arquivo, PROCESSO, PROCESSO, ABANDONO))
+        if c.rowcount != 1:
+            return None
+        c.execute("SELECT id FROM tarefas WHERE digest = ? AND tipo = ?", (digest, tipo))
+        tarefa_id = c.fetchone()[0]
+    if anterior:
+        _caminho(diretorio, digest, anterior[0]).unlink(missing_ok=True)  # cópia enviada pela tela, não será lida
+    return tarefa_id
+
+
+# Função que grava o progresso da tarefa (linhas lidas e total estimado), para o ao_progredir de gravar_lotes
+def progresso_tarefa(conn, tarefa_id):
+    def ao_progredir(lidas, total):
+        with transacao(conn):
+            conn.execute("UPDATE tarefas SET linhas_lidas = ?, total = ?, atualizada_em = CURRENT_TIMESTAMP "
+                         "WHERE id = ?", (lidas, total, tarefa_id))
+    return ao_progredir
+
+
+# Função para gravar na tarefa o resultado da importação (ResultadoImportacao) ou a mensagem do
+# erro. Retorna a situação final.
+def finalizar_tarefa(conn, tarefa_id, resultado=None, erro=None):
+    if erro is not None:
+        _finalizar(conn, tarefa_id, situacao="erro", mensagem=str(erro) or type(erro).__name__)
+        return "erro"
+    recusadas = rejeitadas_csv(resultado.rejeitadas) if len(resultado.rejeitadas) else None
+    _finalizar(conn, tarefa_id, situacao="concluida", gravadas=resultado.gravadas,
+               ja_importada=int(resultado.ja_importada), recusadas=recusadas)
+    return "concluida"
+
+
+# Função para executar uma tarefa já reservada: importa a cópia da planilha, gravando o progresso
+# após cada lote e, no fim, o resultado (ou a mensagem de erro) na tarefa. Retorna a situação final.
+def executar_tarefa(conn, diretorio, tarefa_id, tamanho_lote=TAMANHO_LOTE):
+    c = conn.cursor()
+    c.execute("SELECT digest, tipo, arquivo FROM tarefas WHERE id = ?", (tarefa_id,))
+    digest, tipo, nome = c.fetchone()
+    caminho = _caminho(diretorio, digest, nome)
+
+    # As tarefas aparecem no painel Desempenho como uma tela
+    iniciar_tela(f"Tarefa: importação {tipo}")
+    try:
+        with open(caminho, "rb") as arquivo:
+            resultado = gravar_lotes(conn, digest, tipo, lambda: ler_planilha_em_lotes(arquivo, tamanho_lote),
+                                     progresso_tarefa(conn, tarefa_id))
+    except FileNotFoundError:
+        _finalizar(conn, tarefa_id, situacao="erro",
+                   mensagem="Arquivo da tarefa não encontrado; envie a planilha novamente.")
+        return "erro"
+    except Exception as erro:
+        if not isinstance(erro, ErroPlanilha):  # planilha fora do padrão não é falha do sistema
+            logger.exception("Erro na tarefa %s (importação %s de %s)", tarefa_id, tipo, nome)
+        caminho.unlink(missing_ok=True)
+        return finalizar_tarefa(conn, tarefa_id, erro=erro)
+    finally:
+        concluir_tela()
+
+    caminho.unlink(missing_ok=True)
+    return finalizar_tarefa(conn, tarefa_id, resultado)
+
+
+# Função para devolver à fila as tarefas abandonadas e listar as pendentes, na ordem em que foram enviadas
+def retomar_tarefas(conn):
+    with transacao(conn):
+        conn.execute(f"UPDATE tarefas SET situacao = 'pendente' WHERE {SQL_ABANDONADA}", (PROCESSO, ABANDONO))
+    c = conn.cursor()
+    c.execute("SELECT id FROM tarefas WHERE situacao = 'pendente' ORDER BY id")
+    return [tarefa_id for tarefa_id, in c.fetchall()]
+
+
+# Função para consultar uma tarefa (None se não existir)
+def consultar_tarefa(conn, tarefa_id):
+    c = conn.cursor()
+    c.execute(f"SELECT {', '.join(Tarefa._fields)} FROM tarefas WHERE id = ?", (tarefa_id,))
+    linha = c.fetchone()
+    return Tarefa(*linha) if linha else None
+
+
+# Função para listar as tarefas mais recentes (de um tipo ou de todos), sem as linhas recusadas
+def listar_tarefas(conn, tipo=None, limite=10):
+    where, params = ("WHERE tipo = ?", (tipo,)) if tipo else ("", ())
+    c = conn.cursor()
+    c.execute(f"""
+        SELECT id, arquivo, tipo, situacao, linhas_lidas, gravadas, criada_em, concluida_em
+        FROM tarefas {where} ORDER BY id DESC LIMIT ?
+    """, params + (limite,))
+    return pd.DataFrame(c.fetchall(), columns=COLUNAS_TAREFAS)
@@ -0,0 +1,290 @@
+import argparse
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+
+from almoxeletrico.analitico import LIMIAR_CACHE, movimentacao_mensal, resumo_por_tipo, usar_cache
+from almoxeletrico.backends import BackendSQLite
+from almoxeletrico.importacao import importar_em_lotes
+from almoxeletrico.movimentacoes import filtro_movimentacoes
+from almoxeletrico.servicos import Almoxarifado
+from benchmarks.gerador import gerar_materiais, gerar_projetos, planilha_csv, popular
+
+try:
+    import resource  # indisponível no Windows
+except ImportError:
+    resource = None
+
+# Benchmark dos fluxos de estoque sem a interface do Streamlit.
+#
+# Executa as mesmas chamadas das telas (Visão Geral do Estoque, Projetos, Consulta de
+# Movimentação e as importações de planilha) sobre um banco sintético e informa os percentis
+# de latência e a memória alocada em cada cenário. O resultado pode ser gravado em JSON e
+# comparado com uma execução anterior; cenários mais lentos que a tolerância fazem o comando
+# terminar com código 1, para barrar regressões antes do deploy.
+#
+#   python -m benchmarks.fluxos --movimentacoes 1000000 --json base.json
+#   python -m benchmarks.fluxos --banco bench.db --comparar base.json
+#
+# As importações gravam no banco; use um banco gerado por benchmarks.gerador, nunca o de produção.
+
+TOLERANCIA = 0.25
+
+# Cenários (cache, SQLite) do mesmo relatório, comparados para conferir o LIMIAR_CACHE
+COMPARACOES_CACHE = [
+    ("Movimentação mensal (todos, cache)", "Movimentação mensal (todos, SQLite)"),
+    ("Consulta: resumo sem filtro (cache)", "Consulta: resumo sem filtro (SQLite)"),
+]
+
+
+def _percentil(tempos, p):
+    ordenados = sorted(tempos)
+    return ordenados[max(0, math.ceil(p / 100 * len(ordenados)) - 1)]
+
+
+# Função para medir um cenário: executa preparar() (fora da medição) e executar() a cada
+# repetição; uma execução extra com tracemalloc mede o pico de memória alocada
+def medir(executar, repeticoes, preparar=None):
+    tempos = []
+    for _ in range(repeticoes):
+        argumento = preparar() if preparar else None
+        t0 = time.perf_counter()
+        executar(argumento) if preparar else executar()
+        tempos.append((time.perf_counter() - t0) * 1000)
+
+    argumento = preparar() if preparar else None
+    tracemalloc.start()
+    try:
+        executar(argumento) if preparar else executar()
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "p50": _percentil(tempos, 50),
+        "p95": _percentil(tempos, 95),
+        "p99": _percentil(tempos, 99),
+        "max": max(tempos),
+        "memoria_mb": pico / 1024 / 1024,
+    }
+
+
+def _consumir(gerar):
+    return len(gerar())
+
+
+# Cenários de leitura: lista de (nome, função), com os parâmetros escolhidos no próprio banco
+def cenarios_consulta(almox):
+    conn = almox.backend.conexao()
+    codigo = conn.execute("SELECT codigo FROM saldos ORDER BY quantidade DESC LIMIT 1").fetchone()[0]
+    projeto = conn.execute("SELECT projeto FROM movimentacoes WHERE projeto IS NOT NULL "
+                           "ORDER BY id DESC LIMIT 1").fetchone()[0]
+    ultima = conn.execute("SELECT datetime(MAX(data), 'unixepoch') FROM livro").fetchone()[0]
+    fim = date.fromisoformat(ultima[:10])
+    mes = fim.replace(day=1)
+
+    campos_mes = {"data_inicial": mes, "data_final": fim}
+    campos_material = {"codigo": codigo, "data_inicial": date(fim.year, 1, 1)}
+    sem_filtro = filtro_movimentacoes()
+    por_mes = filtro_movimentacoes(**campos_mes)
+    por_material = filtro_movimentacoes(**campos_material)
+    por_projeto = filtro_movimentacoes(projeto=projeto)
+
+    # Fechamentos mensais usados pela Posição Histórica (meio do último mês com movimentação)
+    almox.historico.fechar()
+    meio_mes = fim.replace(day=15)
+
+    # Cache analítico exportado antes da medição (como pela linha de comando). Os cenários sem
+    # sufixo seguem o LIMIAR_CACHE, como as telas; "(cache)" força o cache e "(SQLite)" calcula o
+    # mesmo relatório sem ele, para comparação
+    almox.analitico.atualizar()
+    cache = almox.analitico.cache
+
+    # Chave da 50ª página de 100 linhas (navegação profunda por keyset)
+    apos = None
+    for _ in range(49):
+        _, apos = almox.movimentacoes.pagina(sem_filtro, 100, apos)
+
+    def projetos_pagina(busca):
+        projetos = almox.projetos.listar(busca, 10, 0)
+        almox.projetos.contar(busca)
+        almox.projetos.equipes(projetos)
+        almox.projetos.resumo(projetos)
+
+    return [
+        ("Busca de material (prefixo)", lambda: almox.materiais.pesquisar("cabo alu")),
+        ("Busca de material (código)", lambda: almox.materiais.pesquisar(str(codigo))),
+        ("Visão Geral do Estoque (todos)", lambda: almox.saldos.visao_geral()),
+        ("Visão Geral do Estoque (um material)", lambda: almox.saldos.visao_geral(codigo)),
+        ("Posição Histórica (todos)", lambda: almox.historico.posicao(meio_mes)),
+        ("Posição Histórica (projeto)", lambda: almox.historico.posicao(meio_mes, projeto=projeto)),
+        ("Projetos: primeira página", lambda: projetos_pagina("")),
+        ("Projetos: busca", lambda: projetos_pagina(projeto[:8])),
+        ("Movimentação mensal (todos)", lambda: almox.analitico.mensal()),
+        ("Movimentação mensal (todos, cache)", lambda: movimentacao_mensal(conn, cache, limiar=0)),
+        ("Movimentação mensal (todos, SQLite)", lambda: movimentacao_mensal(conn, None)),
+        ("Movimentação mensal (um material)", lambda: almox.analitico.mensal(codigo)),
+        ("Consulta: resumo sem filtro", lambda: almox.analitico.resumo()),
+        ("Consulta: resumo sem filtro (cache)", lambda: resumo_por_tipo(conn, cache, limiar=0)),
+        ("Consulta: resumo sem filtro (SQLite)", lambda: resumo_por_tipo(conn, None)),
+        ("Consulta: primeira página", lambda: almox.movimentacoes.pagina(sem_filtro, 100)),
+        ("Consulta: página 50", lambda: almox.movimentacoes.pagina(sem_filtro, 100, apos)),
+        ("Consulta: último mês", lambda: (almox.analitico.resumo(**campos_mes),
+                                          almox.movimentacoes.pagina(por_mes, 100))),
+        ("Consulta: último mês (SQLite)", lambda: resumo_por_tipo(conn, None, **campos_mes)),
+        ("Consulta: material no ano", lambda: (almox.analitico.resumo(**campos_material),
+                                               almox.movimentacoes.pagina(por_material, 100))),
+        ("Consulta: projeto", lambda: (almox.analitico.resumo(projeto=projeto),
+                                       almox.movimentacoes.pagina(por_projeto, 100))),
+        ("Exportação CSV do projeto", lambda: _consumir(lambda: almox.movimentacoes.exportar(por_projeto, "CSV"))),
+        ("Exportação XLSX do último mês", lambda: _consumir(lambda: almox.movimentacoes.exportar(por_mes, "XLSX"))),
+    ]
+
+
+# Cenários de importação: cada repetição importa uma planilha nova (o digest muda), senão a
+# importação seria reconhecida como já concluída
+def cenarios_importacao(almox, pasta, linhas, materiais, semente):
+    cadastro = gerar_materiais(materiais, semente)
+    projetos = gerar_projetos(max(50, linhas // 100), semente)
+    contador = iter(range(1, 1000000))
+
+    def preparar(tipo):
+        def gerar():
+            numero = next(contador)
+            caminho = os.path.join(pasta, f"{tipo}_{numero}.csv")
+            return planilha_csv(caminho, tipo, linhas, cadastro, projetos, semente + numero)
+        return gerar
+
+    # A mesma gravação em lotes das tarefas de importação, na thread atual
+    def importar(tipo):
+        def executar(caminho):
+            with open(caminho, "rb") as arquivo:
+                importar_em_lotes(almox.backend.conexao(), arquivo, tipo)
+        return executar
+
+    return [(f"Importação {tipo} ({linhas} linhas)", importar(tipo), preparar(tipo))
+            for tipo in ("materiais", "entrada", "saída", "baixa_eqtl", "inventario")]
+
+
+def imprimir(resultados):
+    largura = max(len(nome) for nome in resultados)
+    print(f"\n{'Cenário':<{largura}}  {'p50':>9}  {'p95':>9}  {'p99':>9}  {'máx':>9}  {'memória':>9}")
+    for nome, medida in resultados.items():
+        print(f"{nome:<{largura}}  {medida['p50']:>7.1f}ms  {medida['p95']:>7.1f}ms  {medida['p99']:>7.1f}ms  "
+              f"{medida['max']:>7.1f}ms  {medida['memoria_mb']:>7.1f}MB")
+
+
+# Função para comparar o cache analítico com o SQLite no tamanho de livro medido. Retorna o
+# tamanho do livro, o limiar, se o cache é usado nesse tamanho e o p50 dos dois caminhos em cada
+# relatório de COMPARACOES_CACHE (sem pyarrow, só o tamanho e o limiar).
+def ponto_de_virada(resultados, conn):
+    virada = {"livro": conn.execute("SELECT MAX(id) FROM livro").fetchone()[0] or 0,
+              "limiar": LIMIAR_CACHE, "usa_cache": usar_cache(conn), "relatorios": {}}
+    for com_cache, sem_cache in COMPARACOES_CACHE:
+        if com_cache in resultados and sem_cache in resultados:
+            virada["relatorios"][com_cache.replace(", cache)", ")").replace(" (cache)", "")] = {
+                "cache": resultados[com_cache]["p50"], "sqlite": resultados[sem_cache]["p50"]}
+    return virada
+
+
+def imprimir_virada(virada):
+    print(f"\nCache analítico: livro com {virada['livro']} movimentações, LIMIAR_CACHE = {virada['limiar']} "
+          f"({'usa o cache' if virada['usa_cache'] else 'usa o SQLite'})")
+    for nome, p50 in virada["relatorios"].items():
+        mais_rapido = "cache" if p50["cache"] < p50["sqlite"] else "SQLite"
+        print(f"  {nome}: cache {p50['cache']:.1f} ms, SQLite {p50['sqlite']:.1f} ms -> {mais_rapido} mais rápido")
+    # O cache deveria ser usado só quando é o mais rápido em todos os relatórios
+    rapidos = [p50["cache"] < p50["sqlite"] for p50 in virada["relatorios"].values()]
+    if rapidos and all(rapidos) != virada["usa_cache"]:
+        print("  O limiar não corresponde a esta medição: reveja LIMIAR_CACHE.")
+
+
+# Função para comparar com uma execução anterior; retorna a lista de (cenário, p50 base, p50 atual)
+# dos cenários cujo p50 piorou além da tolerância
+def regressoes(resultados, base, tolerancia=TOLERANCIA):
+    piores = []
+    for nome, medida in resultados.items():
+        anterior = base.get(nome)
+        if anterior and medida["p50"] > anterior["p50"] * (1 + tolerancia):
+            piores.append((nome, anterior["p50"], medida["p50"]))
+    return piores
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark dos fluxos de estoque (sem a interface)")
+    parser.add_argument("--banco", help="Banco sintético já gerado (padrão: gera um banco temporário)")
+    parser.add_argument("--materiais", type=int, default=10000)
+    parser.add_argument("--movimentacoes", type=int, default=200000)
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--repeticoes", type=int, default=20)
+    parser.add_argument("--linhas-importacao", type=int, default=20000)
+    parser.add_argument("--repeticoes-importacao", type=int, default=3)
+    parser.add_argument("--sem-importacao", action="store_true", help="Mede apenas as consultas")
+    parser.add_argument("--json", help="Grava os resultados neste arquivo")
+    parser.add_argument("--comparar", help="Resultado anterior (JSON) para detectar regressões")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA,
+                        help="Aumento relativo do p50 aceito na comparação (padrão: 0.25)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as pasta:
+        caminho = args.banco or os.path.join(pasta, "bench.db")
+        backend = BackendSQLite(caminho)
+        backend.migrar()
+        almox = Almoxarifado(backend)
+
+        if not args.banco:
+            print(f"Gerando {args.movimentacoes} movimentações e {args.materiais} materiais...")
+            t0 = time.perf_counter()
+            popular(backend.conexao(), args.materiais, args.movimentacoes, semente=args.semente)
+            print(f"Banco gerado em {time.perf_counter() - t0:.1f} s.")
+
+        resultados = {}
+        for nome, executar in cenarios_consulta(almox):
+            resultados[nome] = medir(executar, args.repeticoes)
+            print(f"{nome}: p50 {resultados[nome]['p50']:.1f} ms")
+
+        if not args.sem_importacao:
+            materiais = backend.conexao().execute("SELECT COUNT(*) FROM materiais").fetchone()[0]
+            for nome, executar, preparar in cenarios_importacao(almox, pasta, args.linhas_importacao,
+                                                                materiais, args.semente):
+                resultados[nome] = medir(executar, args.repeticoes_importacao, preparar)
+                print(f"{nome}: p50 {resultados[nome]['p50']:.1f} ms")
+
+        tamanho_mb = os.path.getsize(caminho) / 1024 / 1024
+        virada = ponto_de_virada(resultados, backend.conexao())
+        almox.analitico.fechar()
+        backend.fechar()
+
+    imprimir(resultados)
+    imprimir_virada(virada)
+    print(f"\nBanco: {tamanho_mb:.1f} MB")
+    rss_mb = None
+    if resource:
+        rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+        print(f"Pico de memória do processo: {rss_mb:.1f} MB")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as arquivo:
+            json.dump({"parametros": vars(args), "banco_mb": tamanho_mb, "rss_mb": rss_mb,
+                       "cache_analitico": virada, "cenarios": resultados},
+                      arquivo, ensure_ascii=False, indent=2)
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as arquivo:
+            base = json.load(arquivo)["cenarios"]
+        piores = regressoes(resultados, base, args.tolerancia)
+        for nome, anterior, atual in piores:
+            print(f"REGRESSÃO {nome}: p50 {anterior:.1f} ms -> {atual:.1f} ms")
+        if piores:
+            return 1
+        print("Nenhuma regressão acima da tolerância.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,217 @@
+import argparse
+import bisect
+import csv
+import itertools
+import random
+import time
+from datetime import datetime, timedelta
+
+from almoxeletrico.conciliacao import SQL_TRIGGERS as SQL_TRIGGERS_CONCILIACAO, reconstruir_conciliacao
+from almoxeletrico.conexoes import transacao
+from almoxeletrico.db import get_db_connection, migrar
+from almoxeletrico.saldos import SQL_TRIGGERS, reconstruir_saldos
+
+# Gerador de livro de movimentações sintético para os benchmarks.
+#
+# Os dados imitam a operação real: poucos materiais concentram a maior parte das movimentações
+# (popularidade Zipf), cada projeto tem um período de obra e de uma a três equipes, as saídas e
+# baixas EQTL dominam o livro e as datas crescem junto com o id. A geração é feita em lotes,
+# então 10 milhões de movimentações não precisam caber na memória.
+#
+#   python -m benchmarks.gerador --banco bench.db --materiais 10000 --movimentacoes 1000000
+
+LOTE = 50000
+INICIO = datetime(2022, 1, 1)
+DIAS = 3 * 365
+EQUIPES = 80
+
+# Participação de cada tipo no livro
+PESOS_TIPOS = {
+    "saída": 0.42,
+    "baixa_eqtl": 0.25,
+    "entrada": 0.16,
+    "devolução": 0.09,
+    "estorno": 0.05,
+    "ajuste_inventario": 0.03,
+}
+
+# Famílias de material: (descrição, unidade, especificações)
+FAMILIAS = [
+    ("CABO ALUMINIO", "M", ["2AWG", "1/0AWG", "4/0AWG", "336,4MCM", "MULTIPLEXADO 3X1X35+35MM2"]),
+    ("CABO COBRE NU", "M", ["16MM2", "25MM2", "35MM2", "50MM2"]),
+    ("CONECTOR CUNHA", "UN", ["TIPO I", "TIPO II", "TIPO III", "ESTRIBO"]),
+    ("ISOLADOR PILAR", "UN", ["15KV", "36,2KV", "POLIMERICO 15KV"]),
+    ("ISOLADOR DISCO", "UN", ["VIDRO 15KV", "POLIMERICO 36,2KV"]),
+    ("POSTE CONCRETO", "UN", ["DT 9/300", "DT 11/300", "DT 11/600", "DT 12/1000"]),
+    ("CRUZETA", "UN", ["CONCRETO 2000MM", "MADEIRA 2400MM", "POLIMERICA 2000MM"]),
+    ("CHAVE FUSIVEL", "UN", ["15KV 100A", "36,2KV 100A"]),
+    ("ELO FUSIVEL", "UN", ["1H", "2H", "6K", "10K", "15K", "25K"]),
+    ("PARA-RAIOS", "UN", ["12KV 10KA", "30KV 10KA"]),
+    ("TRANSFORMADOR", "UN", ["15KVA MONOFASICO", "30KVA TRIFASICO", "75KVA TRIFASICO", "112,5KVA TRIFASICO"]),
+    ("ALCA PREFORMADA", "UN", ["DISTRIBUICAO 2AWG", "DISTRIBUICAO 1/0AWG", "SERVICO 10MM2"]),
+    ("FITA ISOLANTE", "UN", ["19MM X 20M", "AUTOFUSAO 19MM X 10M"]),
+    ("ARMACAO SECUNDARIA", "KIT", ["1 ESTRIBO", "2 ESTRIBOS", "3 ESTRIBOS"]),
+    ("HASTE ATERRAMENTO", "UN", ["5/8 X 2400MM", "3/4 X 3000MM"]),
+    ("PARAFUSO CABECA ABAULADA", "UN", ["16X150MM", "16X200MM", "16X250MM"]),
+]
+
+# Faixa de quantidade por unidade de medida
+QUANTIDADES = {"M": (10, 500), "UN": (1, 30), "KIT": (1, 10), "KG": (1, 50)}
+
+
+def _acumulados(pesos):
+    return list(itertools.accumulate(pesos))
+
+
+def _sortear(aleatorio, itens, acumulados):
+    return itens[bisect.bisect_left(acumulados, aleatorio.random() * acumulados[-1])]
+
+
+# Função para gerar o cadastro de materiais: lista de (codigo, descricao, unidade)
+def gerar_materiais(quantidade, semente=42):
+    aleatorio = random.Random(semente)
+    materiais = []
+    for i in range(quantidade):
+        familia, unidade, especificacoes = FAMILIAS[aleatorio.randrange(len(FAMILIAS))]
+        materiais.append((100000 + i, f"{familia} {aleatorio.choice(especificacoes)} REF {i:05d}", unidade))
+    return materiais
+
+
+# Função para gerar os projetos: lista de (nome, dia de início, dia de fim, equipes)
+def gerar_projetos(quantidade, semente=42):
+    aleatorio = random.Random(semente + 1)
+    projetos = []
+    for i in range(quantidade):
+        inicio = aleatorio.randrange(DIAS)
+        fim = min(DIAS, inicio + aleatorio.randint(15, 240))
+        equipes = [f"EQ-{aleatorio.randrange(EQUIPES):03d}" for _ in range(aleatorio.randint(1, 3))]
+        projetos.append((f"PRJ-{2022 + inicio // 365}-{i:05d}", inicio, fim, equipes))
+    return projetos
+
+
+# Função para gerar as movimentações em lotes (listas de tuplas prontas para o INSERT), com
+# datas crescentes distribuídas ao longo de DIAS
+def gerar_movimentacoes(materiais, projetos, quantidade, semente=42, lote=LOTE):
+    aleatorio = random.Random(semente + 2)
+    acumulado_materiais = _acumulados(1 / (posicao + 1) ** 1.1 for posicao in range(len(materiais)))
+    tipos = list(PESOS_TIPOS)
+    acumulado_tipos = _acumulados(PESOS_TIPOS.values())
+
+    # Projetos em obra em cada dia (sorteio restrito ao período de cada projeto)
+    por_dia = [[] for _ in range(DIAS + 1)]
+    for projeto in projetos:
+        for dia in range(projeto[1], projeto[2] + 1):
+            por_dia[dia].append(projeto)
+
+    passo = DIAS * 24 * 3600 / max(quantidade, 1)
+    segundos = 0.0
+    linhas = []
+    for _ in range(quantidade):
+        segundos += aleatorio.expovariate(1 / passo)
+        data = INICIO + timedelta(seconds=min(segundos, DIAS * 24 * 3600))
+        codigo, descricao, unidade = _sortear(aleatorio, materiais, acumulado_materiais)
+        tipo = _sortear(aleatorio, tipos, acumulado_tipos)
+        minimo, maximo = QUANTIDADES[unidade]
+        quantidade_mov = aleatorio.randint(minimo, maximo)
+        projeto = equipe = None
+        if tipo == "ajuste_inventario":
+            quantidade_mov = aleatorio.randint(-maximo // 5 - 1, maximo // 5 + 1)
+        elif tipo != "entrada":
+            em_obra = por_dia[min(int(segundos // 86400), DIAS)] or projetos
+            projeto, _, _, equipes = aleatorio.choice(em_obra)
+            equipe = aleatorio.choice(equipes)
+        linhas.append((codigo, descricao, quantidade_mov, tipo, projeto, equipe, data.strftime("%Y-%m-%d %H:%M:%S")))
+        if len(linhas) == lote:
+            yield linhas
+            linhas = []
+    if linhas:
+        yield linhas
+
+
+# Função para popular um banco (já migrado) com o livro sintético. Os triggers de saldo e de
+# conciliação são suspensos durante a carga e as tabelas recalculadas uma única vez no final.
+def popular(conn, materiais, movimentacoes, projetos=None, semente=42, ao_progredir=None):
+    cadastro = gerar_materiais(materiais, semente)
+    lista_projetos = gerar_projetos(projetos or max(50, movimentacoes // 2000), semente)
+
+    with transacao(conn):
+        conn.executemany("INSERT OR IGNORE INTO materiais (codigo, descricao, unidade) VALUES (?, ?, ?)", cadastro)
+        for tabela in ("saldos", "conciliacao"):
+            for evento in ("insert", "delete", "update"):
+                conn.execute(f"DROP TRIGGER IF EXISTS trg_{tabela}_{evento}")
+
+    gravadas = 0
+    try:
+        for linhas in gerar_movimentacoes(cadastro, lista_projetos, movimentacoes, semente):
+            with transacao(conn):
+                conn.executemany("""
+                    INSERT INTO movimentacoes (codigo, descricao, quantidade, tipo, projeto, equipe, data_movimentacao)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, linhas)
+            gravadas += len(linhas)
+            if ao_progredir:
+                ao_progredir(gravadas, movimentacoes)
+    finally:
+        with transacao(conn):
+            for sql in SQL_TRIGGERS + SQL_TRIGGERS_CONCILIACAO:
+                conn.execute(sql)
+
+    reconstruir_saldos(conn)
+    reconstruir_conciliacao(conn)
+    conn.execute("ANALYZE")
+    conn.commit()
+    return cadastro, lista_projetos
+
+
+# Função para gravar uma planilha CSV de importação do tipo informado (materiais, entrada, saída,
+# baixa_eqtl ou inventario), com códigos do cadastro gerado e uma pequena fração de linhas inválidas
+def planilha_csv(caminho, tipo, linhas, cadastro, projetos, semente=42, invalidas=0.01):
+    aleatorio = random.Random(semente + 3)
+    with open(caminho, "w", newline="", encoding="utf-8") as arquivo:
+        escritor = csv.writer(arquivo)
+        if tipo == "materiais":
+            escritor.writerow(["codigo", "descricao", "unidade"])
+            base = 100000 + len(cadastro) + semente * linhas
+            for i in range(linhas):
+                familia, unidade, especificacoes = aleatorio.choice(FAMILIAS)
+                escritor.writerow([base + i, f"{familia} {aleatorio.choice(especificacoes)} NOVO {i:05d}", unidade])
+            return caminho
+
+        colunas = ["codigo", "quantidade"] + (["projeto", "equipe"] if tipo in ("saída", "baixa_eqtl") else [])
+        escritor.writerow(colunas)
+        for _ in range(linhas):
+            codigo, _, unidade = aleatorio.choice(cadastro)
+            if aleatorio.random() < invalidas:
+                codigo = 1  # código não cadastrado, recusado pela importação
+            linha = [codigo, aleatorio.randint(*QUANTIDADES[unidade])]
+            if len(colunas) == 4:
+                projeto, _, _, equipes = aleatorio.choice(projetos)
+                linha += [projeto, aleatorio.choice(equipes)]
+            escritor.writerow(linha)
+    return caminho
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera um banco de estoque sintético para benchmarks")
+    parser.add_argument("--banco", default="bench.db", help="Caminho do banco SQLite a criar/popular")
+    parser.add_argument("--materiais", type=int, default=10000)
+    parser.add_argument("--movimentacoes", type=int, default=1000000)
+    parser.add_argument("--projetos", type=int, default=None, help="Padrão: uma obra a cada 2000 movimentações")
+    parser.add_argument("--semente", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    conn = get_db_connection(args.banco)
+    migrar(conn)
+
+    inicio = time.perf_counter()
+
+    def ao_progredir(gravadas, total):
+        print(f"\r{gravadas}/{total} movimentações ({time.perf_counter() - inicio:.0f} s)", end="", flush=True)
+
+    popular(conn, args.materiais, args.movimentacoes, args.projetos, args.semente, ao_progredir)
+    print(f"\nBanco {args.banco} gerado em {time.perf_counter() - inicio:.1f} s.")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
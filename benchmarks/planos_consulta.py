@@ -0,0 +1,119 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from almoxeletrico.db import get_db_connection, migrar
+from almoxeletrico.livro import epoch
+
+# Compara os planos de execução (EXPLAIN QUERY PLAN) e o tempo das consultas das telas
+# antes da migração de índices e no esquema atual (livro compacto, datas em epoch), num banco sintético.
+#
+#   python -m benchmarks.planos_consulta --movimentacoes 200000
+
+TIPOS = ["entrada", "saída", "baixa_eqtl", "devolução", "estorno", "ajuste_inventario"]
+
+# (nome, consulta antes, consulta depois, parâmetros antes, parâmetros depois)
+CONSULTAS = [
+    (
+        "Consulta de Movimentação por período",
+        "SELECT data_movimentacao, codigo, descricao, tipo, quantidade, projeto, equipe FROM movimentacoes "
+        "WHERE 1=1 AND DATE(data_movimentacao) >= DATE(?) AND DATE(data_movimentacao) <= DATE(?) "
+        "ORDER BY data_movimentacao DESC",
+        "SELECT data_movimentacao, codigo, descricao, tipo, quantidade, projeto, equipe FROM movimentacoes "
+        "WHERE 1=1 AND data >= ? AND data < ? "
+        "ORDER BY data DESC",
+        ("2024-03-01", "2024-03-07"),
+        (epoch("2024-03-01"), epoch("2024-03-08")),
+    ),
+    (
+        "Consulta de Movimentação por material e período",
+        "SELECT data_movimentacao, codigo, descricao, tipo, quantidade, projeto, equipe FROM movimentacoes "
+        "WHERE 1=1 AND codigo = ? AND DATE(data_movimentacao) >= DATE(?) ORDER BY data_movimentacao DESC",
+        "SELECT data_movimentacao, codigo, descricao, tipo, quantidade, projeto, equipe FROM movimentacoes "
+        "WHERE 1=1 AND codigo = ? AND data >= ? ORDER BY data DESC",
+        (1010, "2024-01-01"),
+        (1010, epoch("2024-01-01")),
+    ),
+    (
+        "Projetos (agregado por material)",
+        "SELECT codigo, MAX(descricao), SUM(CASE WHEN tipo = 'saída' THEN quantidade ELSE 0 END) "
+        "FROM movimentacoes WHERE projeto = ? GROUP BY codigo",
+        "SELECT codigo, MAX(descricao), SUM(CASE WHEN tipo = 'saída' THEN quantidade ELSE 0 END) "
+        "FROM movimentacoes WHERE projeto_id = (SELECT id FROM projetos WHERE nome = ?) GROUP BY codigo",
+        ("PRJ-0007",),
+        ("PRJ-0007",),
+    ),
+    (
+        "Devolução (materiais com saída no projeto)",
+        "SELECT DISTINCT codigo, descricao FROM movimentacoes WHERE projeto = ? AND tipo = 'saída'",
+        "SELECT DISTINCT codigo, descricao FROM movimentacoes WHERE projeto_id = (SELECT id FROM projetos "
+        "WHERE nome = ?) AND tipo_id = (SELECT id FROM tipos_movimentacao WHERE nome = 'saída')",
+        ("PRJ-0007",),
+        ("PRJ-0007",),
+    ),
+]
+
+
+def popular(conn, materiais, movimentacoes, semente=42):
+    aleatorio = random.Random(semente)
+    c = conn.cursor()
+    c.executemany("INSERT INTO materiais (codigo, descricao, unidade) VALUES (?, ?, 'UN')",
+                  [(1000 + i, f"MATERIAL {i}") for i in range(materiais)])
+    inicio = datetime(2023, 1, 1)
+    linhas = []
+    for _ in range(movimentacoes):
+        codigo = 1000 + aleatorio.randrange(materiais)
+        data = inicio + timedelta(minutes=aleatorio.randrange(2 * 365 * 24 * 60))
+        linhas.append((codigo, f"MATERIAL {codigo - 1000}", aleatorio.randint(1, 50), aleatorio.choice(TIPOS),
+                       f"PRJ-{aleatorio.randrange(500):04d}", f"EQ-{aleatorio.randrange(60):02d}",
+                       data.strftime("%Y-%m-%d %H:%M:%S")))
+    c.executemany("""
+        INSERT INTO movimentacoes (codigo, descricao, quantidade, tipo, projeto, equipe, data_movimentacao)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, linhas)
+    conn.commit()
+
+
+def medir(conn, sql, params, repeticoes):
+    c = conn.cursor()
+    plano = [linha[-1] for linha in c.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()]
+    tempos = []
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        c.execute(sql, params).fetchall()
+        tempos.append(time.perf_counter() - t0)
+    return plano, min(tempos) * 1000
+
+
+def relatorio(conn, etapa, repeticoes):
+    print(f"\n=== {etapa} ===")
+    for nome, antes, depois, p_antes, p_depois in CONSULTAS:
+        sql, params = (antes, p_antes) if etapa == "antes" or depois is None else (depois, p_depois)
+        plano, ms = medir(conn, sql, params, repeticoes)
+        print(f"\n{nome}: {ms:.2f} ms")
+        for passo in plano:
+            print(f"    {passo}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Planos de execução antes e depois dos índices")
+    parser.add_argument("--materiais", type=int, default=5000)
+    parser.add_argument("--movimentacoes", type=int, default=200000)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as pasta:
+        conn = get_db_connection(os.path.join(pasta, "bench.db"))
+        migrar(conn, ate=2)  # esquema anterior aos índices
+        popular(conn, args.materiais, args.movimentacoes)
+        relatorio(conn, "antes", args.repeticoes)
+        migrar(conn)
+        relatorio(conn, "depois", args.repeticoes)
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
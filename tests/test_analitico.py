@@ -0,0 +1,120 @@
+from pathlib import Path
+
+import pytest
+
+from almoxeletrico import analitico
+from almoxeletrico.analitico import CacheAnalitico, manifesto_atual, resumo_por_tipo, usar_cache
+from almoxeletrico.backends import BackendSQLite
+from almoxeletrico.db import get_db_connection, migrar
+from almoxeletrico.servicos import ServicoAnalitico
+
+pytest.importorskip("pyarrow")
+
+
+def _conectar(tmp_path, movimentacoes):
+    conn = get_db_connection(str(tmp_path / "estoque.db"))
+    migrar(conn)
+    conn.execute("INSERT INTO materiais (codigo, descricao, unidade) VALUES (1, 'Cabo 10mm', 'm')")
+    conn.executemany("INSERT INTO movimentacoes (codigo, quantidade, tipo, projeto) VALUES (1, ?, ?, 'P1')",
+                     [(i % 7 + 1, "entrada" if i % 2 else "saída") for i in range(movimentacoes)])
+    conn.commit()
+    return conn
+
+
+# A consulta nunca exporta: com o cache desatualizado o resumo vem do SQLite
+def test_consulta_nao_atualiza_cache_desatualizado(tmp_path, monkeypatch):
+    conn = _conectar(tmp_path, 50)
+    cache = CacheAnalitico(tmp_path / "analitico")
+    monkeypatch.setattr(CacheAnalitico, "atualizar", lambda *args, **kwargs: pytest.fail("exportou na consulta"))
+
+    assert manifesto_atual(conn, cache) is None
+    assert resumo_por_tipo(conn, cache, limiar=0).equals(resumo_por_tipo(conn, None))
+
+
+def test_cache_atual_soma_a_cauda_do_sqlite(tmp_path, monkeypatch):
+    conn = _conectar(tmp_path, 50)
+    cache = CacheAnalitico(tmp_path / "analitico")
+    assert cache.atualizar(conn) == 50
+    conn.executemany("INSERT INTO movimentacoes (codigo, quantidade, tipo) VALUES (1, 2, 'entrada')", [()] * 5)
+    conn.commit()
+
+    assert manifesto_atual(conn, cache)["ultimo_id"] == 50
+    esperado = resumo_por_tipo(conn, None)
+    assert resumo_por_tipo(conn, cache, limiar=0)[["Tipo", "Movimentações", "Quantidade"]].equals(
+        esperado[["Tipo", "Movimentações", "Quantidade"]])
+
+    # Cauda acima do máximo: cache desatualizado até a próxima exportação
+    monkeypatch.setattr(analitico, "CAUDA_MAXIMA", 4)
+    assert manifesto_atual(conn, cache) is None
+    cache.atualizar(conn, minimo=4)
+    assert manifesto_atual(conn, cache)["ultimo_id"] == 55
+
+    # Alteração no livro muda a versão e invalida o cache
+    conn.execute("UPDATE movimentacoes SET quantidade = 3 WHERE id = 1")
+    conn.commit()
+    assert manifesto_atual(conn, cache) is None
+
+
+def _sem_cache(*args, **kwargs):
+    pytest.fail("leu o cache desatualizado")
+
+
+# Livro alterado depois da exportação: o resumo vem do SQLite, com o valor novo
+def test_versao_nova_do_livro_ignora_o_cache(tmp_path, monkeypatch):
+    conn = _conectar(tmp_path, 50)
+    cache = CacheAnalitico(tmp_path / "analitico")
+    cache.atualizar(conn)
+    conn.execute("UPDATE movimentacoes SET quantidade = 1000 WHERE id = 1")
+    conn.commit()
+
+    monkeypatch.setattr(analitico, "_agregar_cache", _sem_cache)
+    resumo = resumo_por_tipo(conn, cache, limiar=0)
+    assert resumo.equals(resumo_por_tipo(conn, None))
+    assert resumo["Quantidade"].max() > 1000
+
+
+# Cauda acima de CAUDA_MAXIMA: o resumo vem só do SQLite, com as movimentações não exportadas
+def test_cauda_longa_ignora_o_cache(tmp_path, monkeypatch):
+    conn = _conectar(tmp_path, 50)
+    cache = CacheAnalitico(tmp_path / "analitico")
+    cache.atualizar(conn)
+    conn.executemany("INSERT INTO movimentacoes (codigo, quantidade, tipo) VALUES (1, 2, 'devolução')", [()] * 5)
+    conn.commit()
+
+    monkeypatch.setattr(analitico, "CAUDA_MAXIMA", 4)
+    monkeypatch.setattr(analitico, "_agregar_cache", _sem_cache)
+    resumo = resumo_por_tipo(conn, cache, limiar=0)
+    assert resumo.equals(resumo_por_tipo(conn, None))
+    assert resumo.set_index("Tipo").loc["devolução", "Movimentações"] == 5
+
+
+# Parte do manifesto removida (exportação concorrente): o resumo é refeito no SQLite
+def test_parte_removida_volta_para_o_sqlite(tmp_path):
+    conn = _conectar(tmp_path, 50)
+    cache = CacheAnalitico(tmp_path / "analitico")
+    cache.atualizar(conn)
+    for parte in cache.partes(cache.manifesto()):
+        Path(parte).unlink()
+
+    assert manifesto_atual(conn, cache) is not None
+    assert resumo_por_tipo(conn, cache, limiar=0).equals(resumo_por_tipo(conn, None))
+
+
+# Livro abaixo do limiar: o cache exportado não é lido e o serviço não agenda exportações
+def test_livro_pequeno_usa_so_o_sqlite(tmp_path, monkeypatch):
+    conn = _conectar(tmp_path, 50)
+    cache = CacheAnalitico(tmp_path / "analitico")
+    cache.atualizar(conn)
+    monkeypatch.setattr(analitico, "_agregar_cache", _sem_cache)
+    assert not usar_cache(conn) and usar_cache(conn, limiar=50)
+    assert resumo_por_tipo(conn, cache).equals(resumo_por_tipo(conn, None))
+
+    backend = BackendSQLite(str(tmp_path / "estoque.db"))
+    servico = ServicoAnalitico(backend)
+    exportacoes = []
+    monkeypatch.setattr(CacheAnalitico, "atualizar", lambda *args, **kwargs: exportacoes.append(args))
+    servico.resumo()
+    servico.mensal()
+    servico.fechar()
+    backend.fechar()
+    assert exportacoes == []
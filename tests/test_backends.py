@@ -0,0 +1,16 @@
+import pytest
+
+from almoxeletrico.backends import Backend, BackendSQLite, criar_backend
+
+
+def test_backend_e_abstrato():
+    with pytest.raises(TypeError):
+        Backend()
+
+
+def test_criar_backend_aceita_so_sqlite(tmp_path):
+    caminho = str(tmp_path / "estoque.db")
+    assert isinstance(criar_backend(caminho), BackendSQLite)
+    assert criar_backend(f"sqlite:///{caminho}").caminho == caminho
+    with pytest.raises(ValueError, match="não suportado"):
+        criar_backend("postgresql://servidor/estoque")
@@ -0,0 +1,48 @@
+from almoxeletrico.conciliacao import listar_pendencias, totais_pendencias, verificar_conciliacao
+from almoxeletrico.db import get_db_connection, migrar
+
+
+def _conectar(tmp_path):
+    conn = get_db_connection(str(tmp_path / "estoque.db"))
+    migrar(conn)
+    conn.execute("INSERT INTO materiais (codigo, descricao, unidade) VALUES (1, 'Cabo 10mm', 'm')")
+    conn.commit()
+    return conn
+
+
+def _registrar(conn, tipo, quantidade, projeto, equipe=None):
+    conn.execute("INSERT INTO movimentacoes (codigo, quantidade, tipo, projeto, equipe) VALUES (1, ?, ?, ?, ?)",
+                 (quantidade, tipo, projeto, equipe))
+    conn.commit()
+
+
+# A devolução é registrada sem equipe e o estorno com equipe: o par se anula no projeto
+def test_devolucao_estornada_nao_fica_pendente(tmp_path):
+    conn = _conectar(tmp_path)
+    _registrar(conn, "devolução", 5, "P1")
+    _registrar(conn, "estorno", 5, "P1", "E1")
+
+    assert totais_pendencias(conn) == (0, 0, 0)
+    assert listar_pendencias(conn).empty
+    assert verificar_conciliacao(conn) == []
+
+
+def test_devolucao_sem_estorno_fica_pendente_no_projeto(tmp_path):
+    conn = _conectar(tmp_path)
+    _registrar(conn, "saída", 10, "P1", "E1")
+    _registrar(conn, "baixa_eqtl", 10, "P1", "E1")
+    _registrar(conn, "devolução", 5, "P1")
+    _registrar(conn, "estorno", 2, "P1", "E1")
+
+    pendencias = listar_pendencias(conn)
+    assert len(pendencias) == 1
+    assert pendencias.iloc[0]["Equipe"] == ""
+    assert pendencias.iloc[0]["Pendente Estorno"] == 3
+    assert totais_pendencias(conn, equipe="E1") == (0, 0, 0)
+
+    # Alterar e excluir movimentações mantém a conciliação igual ao livro
+    conn.execute("UPDATE movimentacoes SET equipe = 'E2' WHERE tipo = 'estorno'")
+    conn.execute("DELETE FROM movimentacoes WHERE tipo = 'devolução'")
+    conn.commit()
+    assert verificar_conciliacao(conn) == []
+    assert totais_pendencias(conn) == (1, 0, -2)
@@ -0,0 +1,29 @@
+from io import BytesIO
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from almoxeletrico.exportacao import _xlsx, planilha_xlsx
+
+
+def _abas(conteudo):
+    workbook = load_workbook(BytesIO(conteudo), read_only=True)
+    return {planilha.title: [list(linha) for linha in planilha.iter_rows(values_only=True)]
+            for planilha in workbook.worksheets}
+
+
+# Linhas acima do limite por aba continuam em novas abas, cada uma com o cabeçalho
+def test_xlsx_divide_em_abas_acima_do_limite():
+    blocos = [[(1, "a"), (2, None)], [(3, "c")]]
+    abas = _abas(_xlsx(["Código", "Descrição"], blocos, "Dados", linhas_por_aba=2))
+    assert abas == {
+        "Dados": [["Código", "Descrição"], [1, "a"], [2, None]],
+        "Dados 2": [["Código", "Descrição"], [3, "c"]],
+    }
+
+
+def test_planilha_xlsx_divide_em_abas_acima_do_limite():
+    df = pd.DataFrame({"Código": [1, 2, 3]})
+    abas = _abas(planilha_xlsx(df, "Estoque", linhas_por_aba=2))
+    assert abas == {"Estoque": [["Código"], [1], [2]], "Estoque 2": [["Código"], [3]]}
+    assert _abas(planilha_xlsx(df.iloc[:0], "Estoque")) == {"Estoque": [["Código"]]}
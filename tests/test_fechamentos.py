@@ -0,0 +1,84 @@
+from datetime import date
+
+from almoxeletrico.db import get_db_connection, migrar
+from almoxeletrico.fechamentos import fechar_meses, meses_a_fechar, posicao_historica
+
+MOVIMENTACOES = [
+    (1, 10, "entrada", None, "2024-01-05 08:00:00"),
+    (1, 3, "saída", "P1", "2024-01-20 09:00:00"),
+    (2, 5, "entrada", None, "2024-01-31 23:59:59"),
+    (1, 2, "devolução", "P1", "2024-02-01 00:00:00"),
+    (2, 1, "saída", "P2", "2024-02-15 10:00:00"),
+    (1, 4, "saída", "P1", "2024-03-10 11:00:00"),
+]
+
+
+def _conectar(tmp_path):
+    conn = get_db_connection(str(tmp_path / "estoque.db"))
+    migrar(conn)
+    conn.executemany("INSERT INTO materiais (codigo, descricao, unidade) VALUES (?, ?, ?)",
+                     [(1, "Cabo 10mm", "m"), (2, "Poste", "un")])
+    _registrar(conn, MOVIMENTACOES)
+    return conn
+
+
+def _registrar(conn, movimentacoes):
+    conn.executemany("INSERT INTO movimentacoes (codigo, quantidade, tipo, projeto, data_movimentacao) "
+                     "VALUES (?, ?, ?, ?, ?)", movimentacoes)
+    conn.commit()
+
+
+def _meses_fechados(conn):
+    return [mes for mes, in conn.execute("SELECT mes FROM fechamentos ORDER BY mes")]
+
+
+def _posicoes(conn):
+    return {(dia, projeto): posicao_historica(conn, dia, projeto=projeto)[0].to_dict("records")
+            for dia in (date(2024, 1, 31), date(2024, 2, 1), date(2024, 2, 29), date(2024, 3, 31))
+            for projeto in (None, "P1")}
+
+
+# A posição calculada a partir dos fechamentos é a mesma calculada pelo livro inteiro
+def test_fechamento_nao_altera_a_posicao(tmp_path):
+    conn = _conectar(tmp_path)
+    sem_fechamento = _posicoes(conn)
+    assert meses_a_fechar(conn, ate="2024-02") == ["2024-01", "2024-02"]
+
+    assert fechar_meses(conn, ate="2024-02") == ["2024-01", "2024-02"]
+    assert meses_a_fechar(conn, ate="2024-02") == []
+    assert conn.execute("SELECT mes, fim, movimentacoes FROM fechamentos ORDER BY mes").fetchall() == \
+        [("2024-01", "2024-02-01", 3), ("2024-02", "2024-03-01", 2)]
+    assert _posicoes(conn) == sem_fechamento
+
+    df, mes = posicao_historica(conn, date(2024, 2, 29))
+    assert mes == "2024-02"
+    assert df.set_index("Código")["Saldo Atual"].to_dict() == {1: 9, 2: 4}
+    assert posicao_historica(conn, date(2024, 1, 30))[1] is None
+
+
+# Gravar, alterar ou excluir uma movimentação com data num mês fechado reabre esse mês e os seguintes
+def test_movimentacao_retroativa_reabre_os_meses(tmp_path):
+    conn = _conectar(tmp_path)
+    fechar_meses(conn, ate="2024-02")
+
+    _registrar(conn, [(1, 1, "entrada", None, "2024-03-01 00:00:00")])  # depois do último fechamento
+    assert _meses_fechados(conn) == ["2024-01", "2024-02"]
+
+    _registrar(conn, [(1, 1, "entrada", None, "2024-02-10 00:00:00")])
+    assert _meses_fechados(conn) == ["2024-01"]
+    assert conn.execute("SELECT COUNT(*) FROM saldos_mensais WHERE mes = '2024-02'").fetchone()[0] == 0
+
+    fechar_meses(conn, ate="2024-02")
+    conn.execute("DELETE FROM movimentacoes WHERE id = 3")
+    conn.commit()
+    assert _meses_fechados(conn) == []
+
+    # Alteração que move a data de um mês aberto para um fechado também reabre
+    fechar_meses(conn, ate="2024-02")
+    conn.execute("UPDATE movimentacoes SET data_movimentacao = '2024-01-10 00:00:00' WHERE id = 6")
+    conn.commit()
+    assert _meses_fechados(conn) == []
+
+    sem_fechamento = _posicoes(conn)
+    fechar_meses(conn, ate="2024-02")
+    assert _posicoes(conn) == sem_fechamento
@@ -0,0 +1,46 @@
+import io
+
+from almoxeletrico.db import get_db_connection, migrar
+from almoxeletrico.importacao import importar_em_lotes
+
+
+def _planilha(conteudo):
+    arquivo = io.BytesIO(conteudo.encode())
+    arquivo.name = "materiais.csv"
+    return arquivo
+
+
+# Gravadas conta só as linhas da planilha inseridas, não as alteradas pelos triggers do cadastro
+def test_importacao_de_materiais_conta_as_linhas_gravadas(tmp_path):
+    conn = get_db_connection(str(tmp_path / "estoque.db"))
+    migrar(conn)
+    conn.execute("INSERT INTO materiais (codigo, descricao, unidade) VALUES (1, 'Cabo 10mm', 'm')")
+    conn.commit()
+
+    planilha = _planilha("codigo,descricao,unidade\n1,Cabo 10mm,m\n2,Poste,un\n3,Isolador,un\n")
+    resultado = importar_em_lotes(conn, planilha, "materiais")
+    assert resultado.gravadas == 2
+    assert conn.execute("SELECT linhas_gravadas FROM importacoes").fetchone()[0] == 2
+
+
+# Duas importações do mesmo arquivo ao mesmo tempo (tela e linha de comando): cada lote entra uma vez só
+def test_importacoes_simultaneas_do_mesmo_arquivo_nao_duplicam_lotes(tmp_path):
+    banco = str(tmp_path / "estoque.db")
+    conn = get_db_connection(banco)
+    migrar(conn)
+    conn.executemany("INSERT INTO materiais (codigo, descricao, unidade) VALUES (?, ?, 'un')",
+                     [(codigo, f"Material {codigo}") for codigo in range(1, 5)])
+    conn.commit()
+    outra = get_db_connection(banco)
+
+    conteudo = "codigo,quantidade\n" + "".join(f"{codigo},10\n" for codigo in range(1, 5))
+    # A segunda importação roda inteira enquanto a primeira está entre o primeiro e o segundo lote
+    def ao_progredir(lidas, total):
+        if lidas == 2:
+            assert importar_em_lotes(outra, _planilha(conteudo), "entrada", tamanho_lote=2).gravadas == 4
+
+    resultado = importar_em_lotes(conn, _planilha(conteudo), "entrada", tamanho_lote=2, ao_progredir=ao_progredir)
+    assert resultado.gravadas == 2
+    assert conn.execute("SELECT codigo, COUNT(*) FROM movimentacoes GROUP BY codigo").fetchall() == \
+        [(codigo, 1) for codigo in range(1, 5)]
+    assert conn.execute("SELECT lotes, linhas_gravadas, concluida FROM importacoes").fetchone() == (2, 4, 1)
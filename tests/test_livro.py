@@ -0,0 +1,96 @@
+import sqlite3
+
+import pytest
+
+from almoxeletrico.conciliacao import verificar_conciliacao
+from almoxeletrico.db import get_db_connection, migrar
+from almoxeletrico.livro import epoch
+from almoxeletrico.saldos import verificar_saldos
+
+# Versão do esquema com a tabela movimentacoes antiga, antes da migração para o livro compacto
+VERSAO_TABELA_ANTIGA = 11
+
+MOVIMENTACOES = [
+    (1, 10, "entrada", "", None, "2024-01-05 08:00:00"),
+    (1, 4, "saída", "P1", "E1", "2024-01-06 09:30:00"),
+    (2, 7, "entrada", None, None, "2024-02-01 10:00:00"),
+    (1, 4, "baixa_eqtl", "P1", "E1", "2024-02-10 11:00:00"),
+    (1, 1, "devolução", "P1", "", "2024-02-11 12:00:00"),
+    (1, 1, "estorno", "P1", "E1", "2024-02-12 13:00:00"),
+]
+
+
+def _conectar(tmp_path, ate=None):
+    conn = get_db_connection(str(tmp_path / "estoque.db"))
+    migrar(conn, ate=ate)
+    conn.executemany("INSERT INTO materiais (codigo, descricao, unidade) VALUES (?, ?, ?)",
+                     [(1, "Cabo 10mm", "m"), (2, "Poste", "un")])
+    conn.commit()
+    return conn
+
+
+def _registrar(conn, movimentacoes):
+    conn.executemany("INSERT INTO movimentacoes (codigo, quantidade, tipo, projeto, equipe, data_movimentacao) "
+                     "VALUES (?, ?, ?, ?, ?, ?)", movimentacoes)
+    conn.commit()
+
+
+# A conversão da tabela antiga preserva ids, sequência, datas e as tabelas derivadas
+def test_migracao_para_o_livro_preserva_as_movimentacoes(tmp_path):
+    conn = _conectar(tmp_path, ate=VERSAO_TABELA_ANTIGA)
+    _registrar(conn, MOVIMENTACOES + [(2, 1, "entrada", None, None, "2024-03-01 00:00:00")])
+    conn.execute("DELETE FROM movimentacoes WHERE id IN (3, 7)")  # o id 7 excluído não deve ser reaproveitado
+    conn.commit()
+    antes = conn.execute("SELECT id, codigo, quantidade, tipo, NULLIF(projeto, ''), NULLIF(equipe, ''), "
+                         "data_movimentacao FROM movimentacoes ORDER BY id").fetchall()
+
+    migrar(conn)
+    assert conn.execute("SELECT type FROM sqlite_master WHERE name = 'movimentacoes'").fetchone()[0] == "view"
+    depois = conn.execute("SELECT id, codigo, quantidade, tipo, projeto, equipe, data_movimentacao "
+                          "FROM movimentacoes ORDER BY id").fetchall()
+    assert depois == antes
+    assert conn.execute("SELECT id, data FROM livro ORDER BY id").fetchall() == \
+        [(linha[0], epoch(linha[6])) for linha in antes]
+    assert conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'livro'").fetchone()[0] == 7
+    assert verificar_saldos(conn) == []
+    assert verificar_conciliacao(conn) == []
+
+    _registrar(conn, [(2, 1, "entrada", None, None, "2024-03-02 00:00:00")])
+    assert conn.execute("SELECT MAX(id) FROM movimentacoes").fetchone()[0] == 8
+
+
+# INSERT, UPDATE e DELETE na view chegam ao livro e às tabelas derivadas
+def test_escrita_pela_view(tmp_path):
+    conn = _conectar(tmp_path)
+    _registrar(conn, MOVIMENTACOES)
+    assert conn.execute("SELECT projeto_id, equipe_id FROM livro WHERE id = 1").fetchone() == (None, None)
+    assert conn.execute("SELECT equipe FROM movimentacoes WHERE id = 5").fetchone()[0] is None
+
+    conn.execute("UPDATE movimentacoes SET codigo = 2, quantidade = 3, projeto = 'P2', equipe = 'E2', "
+                 "data_movimentacao = '2024-03-01 08:00:00' WHERE id = 2")
+    conn.execute("DELETE FROM movimentacoes WHERE id = 4")
+    conn.commit()
+    assert conn.execute("SELECT codigo, quantidade, tipo, projeto, equipe, data, descricao FROM movimentacoes "
+                        "WHERE id = 2").fetchone() == (2, 3, "saída", "P2", "E2", epoch("2024-03-01 08:00:00"),
+                                                        "Poste")
+    assert conn.execute("SELECT COUNT(*) FROM livro WHERE id = 4").fetchone()[0] == 0
+    assert conn.execute("SELECT quantidade FROM saldos WHERE codigo = 2").fetchone()[0] == 10
+    assert verificar_saldos(conn) == []
+    assert verificar_conciliacao(conn) == []
+
+    with pytest.raises(sqlite3.IntegrityError, match="data_movimentacao inválida"):
+        conn.execute("UPDATE movimentacoes SET data_movimentacao = '05/01/2024' WHERE id = 1")
+    conn.rollback()
+
+
+# As colunas derivadas da view não são gravadas no livro: alterá-las é um erro, não uma escrita perdida
+@pytest.mark.parametrize("coluna, valor", [("data", 0), ("descricao", "Outra"), ("tipo_id", 2),
+                                           ("projeto_id", 1), ("equipe_id", 1)])
+def test_view_recusa_alterar_colunas_derivadas(tmp_path, coluna, valor):
+    conn = _conectar(tmp_path)
+    _registrar(conn, MOVIMENTACOES)
+    antes = conn.execute("SELECT * FROM livro WHERE id = 1").fetchone()
+    with pytest.raises(sqlite3.IntegrityError, match="derivados"):
+        conn.execute(f"UPDATE movimentacoes SET {coluna} = ? WHERE id = 1", (valor,))
+    conn.rollback()
+    assert conn.execute("SELECT * FROM livro WHERE id = 1").fetchone() == antes
@@ -0,0 +1,62 @@
+from datetime import date
+
+from almoxeletrico.db import get_db_connection, migrar
+from almoxeletrico.movimentacoes import filtro_movimentacoes, pagina_movimentacoes
+
+DATAS = ["2024-01-05 08:00:00", "2024-01-06 09:00:00", "2024-01-06 09:00:00", "2024-01-06 09:00:00",
+         "2024-01-04 10:00:00", "2024-01-06 09:00:00", "2024-01-07 11:00:00"]
+
+
+def _conectar(tmp_path):
+    conn = get_db_connection(str(tmp_path / "estoque.db"))
+    migrar(conn)
+    conn.executemany("INSERT INTO materiais (codigo, descricao, unidade) VALUES (?, ?, ?)",
+                     [(1, "Cabo 10mm", "m"), (2, "Poste", "un")])
+    conn.executemany("INSERT INTO movimentacoes (codigo, quantidade, tipo, data_movimentacao) VALUES (?, ?, ?, ?)",
+                     [(1 + numero % 2, numero, "entrada", data) for numero, data in enumerate(DATAS, start=1)])
+    conn.commit()
+    return conn
+
+
+# Percorre todas as páginas e devolve as quantidades (iguais aos ids) na ordem exibida
+def _percorrer(conn, filtro, tamanho):
+    vistas, apos, paginas = [], None, 0
+    while True:
+        df, apos = pagina_movimentacoes(conn, filtro, tamanho, apos)
+        assert len(df) <= tamanho
+        vistas += df["Quantidade"].astype(int).tolist()
+        paginas += 1
+        if apos is None:
+            return vistas, paginas
+
+
+def _esperado(ids):
+    return sorted(ids, key=lambda i: (DATAS[i - 1], i), reverse=True)
+
+
+# Várias movimentações no mesmo instante: a chave (data, id) não pula nem repete linhas entre páginas
+def test_paginas_com_datas_iguais(tmp_path):
+    conn = _conectar(tmp_path)
+    todas = _esperado(range(1, len(DATAS) + 1))
+    assert todas[:5] == [7, 6, 4, 3, 2]
+    for tamanho in (1, 2, 3, 7, 10):
+        vistas, paginas = _percorrer(conn, filtro_movimentacoes(), tamanho)
+        assert vistas == todas
+        assert paginas == max(1, -(-len(DATAS) // tamanho))
+
+
+def test_paginas_com_filtro(tmp_path):
+    conn = _conectar(tmp_path)
+    vistas, _ = _percorrer(conn, filtro_movimentacoes(codigo=1), 1)
+    assert vistas == _esperado([2, 4, 6])
+
+    # A data final inclui o dia inteiro
+    filtro = filtro_movimentacoes(data_inicial=date(2024, 1, 5), data_final=date(2024, 1, 6))
+    vistas, _ = _percorrer(conn, filtro, 2)
+    assert vistas == _esperado([1, 2, 3, 4, 6])
+
+
+def test_pagina_formata_a_data(tmp_path):
+    conn = _conectar(tmp_path)
+    df, _ = pagina_movimentacoes(conn, filtro_movimentacoes(), 1)
+    assert df["Data"].tolist() == ["07/01/2024 11:00:00"]
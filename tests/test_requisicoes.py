@@ -0,0 +1,17 @@
+import pandas as pd
+
+from almoxeletrico.db import get_db_connection, migrar
+from almoxeletrico.requisicoes import validar_requisicao
+
+
+# Linha incompleta na grade (coluna Int64 com pd.NA) é recusada, sem exceção
+def test_codigo_vazio_na_grade_e_recusado(tmp_path):
+    conn = get_db_connection(str(tmp_path / "estoque.db"))
+    migrar(conn)
+    conn.execute("INSERT INTO materiais (codigo, descricao, unidade) VALUES (1, 'Cabo 10mm', 'm')")
+    conn.execute("INSERT INTO movimentacoes (codigo, quantidade, tipo) VALUES (1, 10, 'entrada')")
+    conn.commit()
+
+    itens = pd.DataFrame({"codigo": pd.array([1, None], dtype="Int64"), "quantidade": [2.0, 3.0]})
+    situacoes = validar_requisicao(conn, "saída", "P1", itens)["Situação"].tolist()
+    assert situacoes == ["ok", "código inválido"]
@@ -0,0 +1,75 @@
+from almoxeletrico.db import get_db_connection, migrar
+from almoxeletrico.saldos import ajustar_saldo, reconstruir_saldos, saldo_total, verificar_saldos
+
+
+def _conectar(tmp_path):
+    conn = get_db_connection(str(tmp_path / "estoque.db"))
+    migrar(conn)
+    conn.executemany("INSERT INTO materiais (codigo, descricao, unidade) VALUES (?, ?, ?)",
+                     [(1, "Cabo 10mm", "m"), (2, "Poste", "un")])
+    conn.commit()
+    return conn
+
+
+def _registrar(conn, codigo, quantidade, tipo):
+    conn.execute("INSERT INTO movimentacoes (codigo, quantidade, tipo) VALUES (?, ?, ?)", (codigo, quantidade, tipo))
+    conn.commit()
+
+
+def _saldos_tipo(conn):
+    return {(codigo, tipo): quantidade
+            for codigo, tipo, quantidade in conn.execute("SELECT codigo, tipo, quantidade FROM saldos_tipo")}
+
+
+# Os triggers do livro mantêm saldos e saldos_tipo em cada INSERT, UPDATE e DELETE
+def test_triggers_mantem_os_saldos(tmp_path):
+    conn = _conectar(tmp_path)
+    _registrar(conn, 1, 10, "entrada")
+    _registrar(conn, 1, 4, "saída")
+    _registrar(conn, 2, 3, "entrada")
+    assert (saldo_total(conn, 1), saldo_total(conn, 2)) == (14, 3)
+    assert _saldos_tipo(conn) == {(1, "entrada"): 10, (1, "saída"): 4, (2, "entrada"): 3}
+
+    # Troca de material, quantidade e tipo: sai do saldo antigo e entra no novo
+    conn.execute("UPDATE movimentacoes SET codigo = 2, quantidade = 5, tipo = 'devolução' WHERE id = 2")
+    conn.execute("DELETE FROM movimentacoes WHERE id = 1")
+    conn.commit()
+    assert (saldo_total(conn, 1), saldo_total(conn, 2)) == (0, 8)
+    assert _saldos_tipo(conn) == {(1, "entrada"): 0, (1, "saída"): 0, (2, "entrada"): 3, (2, "devolução"): 5}
+    assert verificar_saldos(conn) == []
+
+
+# Uma escrita que falha não deixa os saldos pela metade: o trigger roda na mesma transação
+def test_saldos_acompanham_o_rollback(tmp_path):
+    conn = _conectar(tmp_path)
+    _registrar(conn, 1, 10, "entrada")
+    conn.execute("INSERT INTO movimentacoes (codigo, quantidade, tipo) VALUES (1, 5, 'entrada')")
+    conn.rollback()
+    assert saldo_total(conn, 1) == 10
+    assert verificar_saldos(conn) == []
+
+
+# verificar_saldos aponta as divergências e reconstruir_saldos as corrige a partir do livro
+def test_verificar_e_reconstruir_saldos(tmp_path):
+    conn = _conectar(tmp_path)
+    _registrar(conn, 1, 10, "entrada")
+    _registrar(conn, 2, 3, "entrada")
+    conn.execute("UPDATE saldos SET quantidade = 99 WHERE codigo = 1")
+    conn.execute("DELETE FROM saldos_tipo WHERE codigo = 2")
+    conn.commit()
+
+    assert sorted(verificar_saldos(conn)) == [("saldos", 1, 99, 10), ("saldos_tipo", (2, "entrada"), 0, 3)]
+    reconstruir_saldos(conn)
+    assert verificar_saldos(conn) == []
+    assert saldo_total(conn, 1) == 10
+
+
+# O ajuste de inventário leva o saldo total à quantidade contada
+def test_ajuste_de_inventario(tmp_path):
+    conn = _conectar(tmp_path)
+    _registrar(conn, 1, 10, "entrada")
+    assert ajustar_saldo(conn, 1, 7) == -3
+    assert ajustar_saldo(conn, 1, 7) == 0
+    assert saldo_total(conn, 1) == 7
+    assert conn.execute("SELECT COUNT(*) FROM movimentacoes WHERE tipo = 'ajuste_inventario'").fetchone()[0] == 1
+    assert verificar_saldos(conn) == []
@@ -0,0 +1,104 @@
+import io
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from almoxeletrico import tarefas
+from almoxeletrico.backends import BackendSQLite
+from almoxeletrico.servicos import Almoxarifado
+
+
+@pytest.fixture
+def almox(tmp_path):
+    backend = BackendSQLite(str(tmp_path / "estoque.db"))
+    backend.migrar()
+    almox = Almoxarifado(backend)
+    yield almox
+    almox.tarefas.fechar()
+    backend.fechar()
+
+
+def _planilha(conteudo, nome="materiais.csv"):
+    arquivo = io.BytesIO(conteudo)
+    arquivo.name = nome
+    return arquivo
+
+
+def _concluir(almox, tarefa_id):
+    almox.tarefas.fechar()
+    return almox.tarefas.tarefa(tarefa_id)
+
+
+# Tarefa reservada por um processo encerrado: a consulta e o reenvio da planilha a devolvem à fila
+def test_tarefa_abandonada_volta_para_a_fila(almox, monkeypatch):
+    conn = almox.backend.conexao()
+    planilha = _planilha("codigo,descricao,unidade\n1,Cabo 10mm,m\n".encode())
+    tarefa_id, _ = tarefas.enfileirar_tarefa(conn, almox.tarefas.diretorio, planilha, "materiais")
+    monkeypatch.setattr(tarefas, "PROCESSO", "processo-encerrado")
+    assert tarefas.reservar_tarefa(conn, tarefa_id)
+    monkeypatch.undo()
+
+    # Ainda dentro do prazo de abandono: continua em execução
+    assert almox.tarefas.importar(planilha, "materiais") == (tarefa_id, False)
+    assert almox.tarefas.tarefa(tarefa_id).situacao == "executando"
+
+    conn.execute("UPDATE tarefas SET atualizada_em = datetime('now', '-1 hour') WHERE id = ?", (tarefa_id,))
+    conn.commit()
+    assert almox.tarefas.importar(planilha, "materiais") == (tarefa_id, True)
+    assert _concluir(almox, tarefa_id).situacao == "concluida"
+    assert conn.execute("SELECT codigo, descricao FROM materiais").fetchall() == [(1, "Cabo 10mm")]
+
+
+@pytest.mark.parametrize("conteudo, nome", [(b"", "vazia.csv"), (b"\r\n\r\n", "vazia.csv")])
+def test_planilha_vazia_gera_erro_claro(almox, conteudo, nome):
+    tarefa_id, nova = almox.tarefas.importar(_planilha(conteudo, nome), "materiais")
+    tarefa = _concluir(almox, tarefa_id)
+    assert nova and (tarefa.situacao, tarefa.mensagem) == ("erro", "A planilha está vazia.")
+
+
+def test_planilha_so_com_cabecalho_confere_as_colunas(almox):
+    tarefa_id, _ = almox.tarefas.importar(_planilha(b"codigo,nome\n"), "materiais")
+    tarefa = _concluir(almox, tarefa_id)
+    assert tarefa.situacao == "erro" and tarefa.mensagem.startswith("A planilha deve conter as colunas")
+
+
+# A linha de comando reserva a tarefa da planilha: não importa a que está em execução pela tela
+def test_importacao_pela_linha_de_comando_reserva_a_tarefa(almox, monkeypatch):
+    conn = almox.backend.conexao()
+    planilha = _planilha("codigo,descricao,unidade\n1,Cabo 10mm,m\n".encode())
+    tarefa_id, _ = tarefas.enfileirar_tarefa(conn, almox.tarefas.diretorio, planilha, "materiais")
+    monkeypatch.setattr(tarefas, "PROCESSO", "processo-da-tela")
+    assert tarefas.reservar_tarefa(conn, tarefa_id)
+    monkeypatch.undo()
+    digest = conn.execute("SELECT digest FROM tarefas WHERE id = ?", (tarefa_id,)).fetchone()[0]
+    assert tarefas.reservar_importacao(conn, almox.tarefas.diretorio, digest, "materiais", "materiais.csv") is None
+
+    conn.execute("UPDATE tarefas SET situacao = 'erro' WHERE id = ?", (tarefa_id,))
+    conn.commit()
+    assert tarefas.reservar_importacao(conn, almox.tarefas.diretorio, digest, "materiais", "materiais.csv") == tarefa_id
+    assert almox.tarefas.tarefa(tarefa_id).situacao == "executando"
+    assert not tarefas.reservar_tarefa(conn, tarefa_id)
+
+
+# Dois envios da mesma planilha ao mesmo tempo: cada um grava a cópia num temporário próprio
+def test_envios_simultaneos_da_mesma_planilha(almox, monkeypatch):
+    conteudo = "codigo,descricao,unidade\n1,Cabo 10mm,m\n".encode()
+    # Os dois envios só copiam a planilha depois de ambos abrirem o arquivo temporário
+    barreira = threading.Barrier(2)
+    copiar = shutil.copyfileobj
+    monkeypatch.setattr(shutil, "copyfileobj", lambda origem, destino: (barreira.wait(), copiar(origem, destino)))
+
+    def enviar():
+        conn = almox.backend.conexao()
+        return tarefas.enfileirar_tarefa(conn, almox.tarefas.diretorio, _planilha(conteudo), "materiais")
+
+    with ThreadPoolExecutor(2) as executor:
+        enviadas = [futuro.result() for futuro in [executor.submit(enviar) for _ in range(2)]]
+
+    assert len({tarefa_id for tarefa_id, _ in enviadas}) == 1
+    assert sorted(nova for _, nova in enviadas) == [False, True]
+    copias = list(Path(almox.tarefas.diretorio).iterdir())
+    assert [copia.suffix for copia in copias] == [".csv"] and copias[0].read_bytes() == conteudo